@@ -5,7 +5,8 @@ SQLite 資料庫網頁查看器
 """
 from flask import Flask, render_template, request, jsonify
 import sqlite3
-from config import DATABASE_PATH
+from config import DATABASE_PATH, SEARCH_CONFIG
+from search_engine import search_cells, SEARCH_MODES
 import os
 
 app = Flask(__name__)
@@ -131,34 +132,21 @@ def api_search():
     """搜索 API"""
     keyword = request.args.get('keyword', '')
     limit = request.args.get('limit', 20, type=int)
+    mode = request.args.get('mode', SEARCH_CONFIG['search_mode'])
 
     if not keyword:
         return jsonify({'success': False, 'error': 'Keyword is required'})
+    if mode not in SEARCH_MODES:
+        return jsonify({'success': False, 'error': f'Mode must be one of: {", ".join(SEARCH_MODES)}'})
 
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT
-            f.file_name,
-            c.sheet_name,
-            c.cell_location,
-            c.value,
-            c.row_num,
-            c.col_num
-        FROM cells c
-        JOIN files f ON c.file_id = f.file_id
-        WHERE c.value_lower LIKE ?
-        ORDER BY f.file_name, c.sheet_name, c.row_num, c.col_num
-        LIMIT ?
-    ''', (f'%{keyword.lower()}%', limit))
-
-    results = [dict(row) for row in cursor.fetchall()]
+    results, used_mode = search_cells(conn, keyword, limit=limit, mode=mode)
     conn.close()
 
     return jsonify({
         'success': True,
         'keyword': keyword,
+        'mode': used_mode,
         'count': len(results),
         'results': results
     })
@@ -4,13 +4,13 @@
 包含所有 Excel 檔案的詳細資訊和狀態
 """
 import os
-import zipfile
 from file_scanner import FileScanner
 from database_mariadb import DatabaseManager
+from excel_reader import validate_workbook
 
 def check_file_status(file_path):
     """
-    詳細檢查檔案狀態
+    詳細檢查檔案狀態（與 index 命令的預檢規則相同）
     返回: (狀態代碼, 詳細說明, 檔案大小)
     """
     try:
@@ -18,40 +18,8 @@ def check_file_status(file_path):
     except:
         return 'ERROR_ACCESS', '無法存取檔案', 0
 
-    # 空檔案
-    if file_size == 0:
-        return 'ERROR_EMPTY', '空檔案 (0 bytes)', file_size
-
-    # 檢查副檔名
-    if file_path.endswith('.xls') and not file_path.endswith('.xlsx'):
-        return 'ERROR_XLS', '.xls 舊格式 (openpyxl 不支援)', file_size
-
-    # 檢查 ZIP 格式
-    try:
-        # 先讀取檔頭
-        with open(file_path, 'rb') as f:
-            header = f.read(4)
-            if header[:2] != b'PK':
-                return 'ERROR_NOT_ZIP', '不是 ZIP 格式 (檔頭錯誤)', file_size
-
-        # 嘗試打開 ZIP
-        with zipfile.ZipFile(file_path, 'r') as zf:
-            files = zf.namelist()
-
-            # 檢查是否有 Excel 的基本結構
-            has_content_types = '[Content_Types].xml' in files
-            has_workbook = any('workbook.xml' in f for f in files)
-
-            if not has_content_types and not has_workbook:
-                return 'ERROR_STRUCTURE', 'ZIP 正常但缺少 Excel 結構', file_size
-
-            # ZIP 和結構都正常
-            return 'VALID_ZIP', 'ZIP 結構完整 (應該可以索引)', file_size
-
-    except zipfile.BadZipFile:
-        return 'ERROR_CORRUPT', 'ZIP 結構損壞 (無法解壓)', file_size
-    except Exception as e:
-        return 'ERROR_UNKNOWN', f'未知錯誤: {str(e)[:50]}', file_size
+    status, detail = validate_workbook(file_path)
+    return status, detail, file_size
 
 def format_size(size_bytes):
     """格式化檔案大小"""
@@ -139,7 +107,8 @@ def main():
 
     status_names = {
         'SUCCESS': '✅ 成功索引',
-        'ERROR_XLS': '🔴 .xls 舊格式',
+        'VALID_XLS': '🟢 .xls 正常（但失敗）',
+        'ERROR_NOT_OLE': '🟠 非 OLE2 格式 (.xls)',
         'ERROR_CORRUPT': '🔴 ZIP 損壞',
         'ERROR_STRUCTURE': '🟡 結構異常',
         'VALID_ZIP': '🟢 ZIP 正常（但失敗）',
@@ -222,7 +191,7 @@ def main():
     print(f"📄 生成人工檢查清單: {manual_check_file}")
 
     # 需要人工檢查的狀態
-    check_statuses = ['ERROR_CORRUPT', 'VALID_ZIP', 'ERROR_STRUCTURE', 'ERROR_UNKNOWN']
+    check_statuses = ['ERROR_CORRUPT', 'VALID_ZIP', 'VALID_XLS', 'ERROR_STRUCTURE', 'ERROR_UNKNOWN']
     check_files = [r for r in results if r['status'] in check_statuses]
 
     with open(manual_check_file, 'w', encoding='utf-8') as f:
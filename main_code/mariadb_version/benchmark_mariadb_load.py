@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+MariaDB 單元格寫入效能比較
+以相同的單元格分別用 executemany（一般模式）與 LOAD DATA LOCAL INFILE（index --bulk）
+寫入資料庫，比較每秒寫入筆數。寫入到暫時的檔案記錄下，結束後刪除
+
+使用方法：
+    python3 benchmark_mariadb_load.py ./Sharepoint
+    python3 benchmark_mariadb_load.py ./Sharepoint --repeat 3
+"""
+import time
+import click
+from contextlib import nullcontext
+from datetime import datetime
+
+from database_mariadb import DatabaseManager
+from file_scanner import FileScanner
+from excel_reader import read_excel_file, iter_batches
+from excel_search_cli_mariadb import cell_row
+from config_mariadb import BATCH_SIZE
+
+# 暫時檔案記錄的路徑（不會與真實檔案衝突）
+SCRATCH_PATH = '<benchmark_mariadb_load>'
+
+
+def load_cells(path):
+    """讀取目錄下所有檔案的單元格（不含 file_id）"""
+    cells = []
+    for file_info in FileScanner().scan_directory(path, show_progress=False):
+        try:
+            cells.extend(read_excel_file(file_info['file_path']))
+        except Exception as e:
+            click.echo(f"⚠️  略過 {file_info['file_name']}: {e}")
+    return cells
+
+
+def time_write(db, cells, bulk):
+    """
+    將單元格寫入一個暫時的檔案記錄，回傳耗時並確認寫入筆數
+
+    Returns:
+        (秒數, 資料庫中的單元格數)
+    """
+    db.delete_file(SCRATCH_PATH)
+    file_id = db.add_file(SCRATCH_PATH, SCRATCH_PATH, datetime.now(), 0)
+    try:
+        start = time.perf_counter()
+        with db.bulk_load() if bulk else nullcontext():
+            for batch in iter_batches(cells, BATCH_SIZE):
+                db.add_cells_batch([cell_row(file_id, cell) for cell in batch])
+        elapsed = time.perf_counter() - start
+
+        db.cursor.execute("SELECT COUNT(*) FROM cells WHERE file_id = %s", (file_id,))
+        return elapsed, db.cursor.fetchone()[0]
+    finally:
+        db.delete_file(SCRATCH_PATH)
+
+
+@click.command()
+@click.argument('path', type=click.Path(exists=True, file_okay=False))
+@click.option('--repeat', default=1, help='每種模式重複寫入次數（取最快一次）')
+def main(path, repeat):
+    """比較 executemany 與 LOAD DATA 寫入單元格的速度"""
+    cells = load_cells(path)
+    if not cells:
+        click.echo("沒有讀取到任何單元格")
+        return
+    click.echo(f"單元格數: {len(cells):,}，批次大小: {BATCH_SIZE}")
+    click.echo()
+
+    with DatabaseManager() as db:
+        if not db.connection:
+            click.echo("❌ 無法連接到 MariaDB 資料庫")
+            return
+        db.create_tables()
+
+        rates = {}
+        for mode, bulk in (('executemany', False), ('LOAD DATA', True)):
+            best = None
+            for _ in range(repeat):
+                elapsed, written = time_write(db, cells, bulk)
+                if written != len(cells):
+                    click.secho(f"❌ {mode}: 寫入 {written:,} 筆，預期 {len(cells):,} 筆", fg='red')
+                    return
+                best = elapsed if best is None else min(best, elapsed)
+            rates[mode] = len(cells) / best if best else 0
+            click.echo(f"{mode:<12} {best:8.2f} 秒  {rates[mode]:>12,.0f} 筆/秒")
+
+    click.echo("-" * 60)
+    if rates['executemany']:
+        click.echo(f"加速: {rates['LOAD DATA'] / rates['executemany']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
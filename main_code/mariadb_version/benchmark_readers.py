@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Excel 讀取引擎效能比較
+以相同的檔案分別用 openpyxl 與 iterparse 引擎讀取，比較耗時並確認輸出一致
+
+使用方法：
+    python3 benchmark_readers.py ./Sharepoint
+    python3 benchmark_readers.py a.xlsx b.xlsx --repeat 3
+"""
+import os
+import time
+import click
+
+from excel_reader import read_excel_file, READER_ENGINES
+from file_scanner import FileScanner
+
+
+def collect_files(paths):
+    """展開參數中的檔案與目錄"""
+    files = []
+    scanner = FileScanner(supported_extensions=['.xlsx', '.xlsm'])
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(f['file_path'] for f in scanner.scan_directory(path, show_progress=False))
+        else:
+            files.append(os.path.abspath(path))
+    return files
+
+
+def time_engine(file_path, engine, repeat):
+    """
+    讀取一個檔案數次，回傳最快一次的耗時與單元格數
+
+    Returns:
+        (秒數, 單元格數)；讀取失敗時回傳 (None, 錯誤訊息)
+    """
+    best = None
+    count = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            count = sum(1 for _ in read_excel_file(file_path, engine=engine))
+        except Exception as e:
+            return None, str(e)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+
+@click.command()
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--repeat', default=1, help='每個檔案重複讀取次數（取最快一次）')
+@click.option('--verify/--no-verify', default=True, help='比對兩個引擎輸出的記錄是否一致')
+def main(paths, repeat, verify):
+    """比較各讀取引擎在相同檔案上的速度"""
+    files = collect_files(paths)
+    if not files:
+        click.echo("沒有找到 .xlsx 檔案")
+        return
+
+    click.echo(f"檔案數: {len(files)}，重複次數: {repeat}")
+    click.echo()
+    click.echo(f"{'檔案':40s} {'單元格':>10s} " +
+               " ".join(f"{engine:>10s}" for engine in READER_ENGINES) + f" {'加速':>8s}")
+    click.echo("-" * 90)
+
+    totals = {engine: 0.0 for engine in READER_ENGINES}
+    total_cells = 0
+    mismatches = []
+
+    for file_path in files:
+        timings = {}
+        cell_count = 0
+        failed = False
+        for engine in READER_ENGINES:
+            elapsed, result = time_engine(file_path, engine, repeat)
+            if elapsed is None:
+                click.echo(f"{os.path.basename(file_path)[:40]:40s} 讀取失敗 ({engine}): {result}")
+                failed = True
+                break
+            timings[engine] = elapsed
+            cell_count = result
+        if failed:
+            continue
+
+        for engine, elapsed in timings.items():
+            totals[engine] += elapsed
+        total_cells += cell_count
+
+        speedup = timings['openpyxl'] / timings['iterparse'] if timings['iterparse'] else 0
+        click.echo(f"{os.path.basename(file_path)[:40]:40s} {cell_count:>10,} " +
+                   " ".join(f"{timings[engine]:>9.3f}s" for engine in READER_ENGINES) +
+                   f" {speedup:>7.2f}x")
+
+        if verify:
+            expected = list(read_excel_file(file_path, engine='openpyxl'))
+            actual = list(read_excel_file(file_path, engine='iterparse'))
+            if expected != actual:
+                mismatches.append(file_path)
+
+    click.echo("-" * 90)
+    speedup = totals['openpyxl'] / totals['iterparse'] if totals['iterparse'] else 0
+    click.echo(f"{'合計':40s} {total_cells:>10,} " +
+               " ".join(f"{totals[engine]:>9.3f}s" for engine in READER_ENGINES) +
+               f" {speedup:>7.2f}x")
+
+    for engine, elapsed in totals.items():
+        if elapsed:
+            click.echo(f"  {engine:10s}: {total_cells / elapsed:,.0f} 單元格/秒")
+
+    if verify:
+        click.echo()
+        if mismatches:
+            click.secho(f"❌ {len(mismatches)} 個檔案的輸出不一致:", fg='red')
+            for file_path in mismatches:
+                click.echo(f"   {file_path}")
+        else:
+            click.secho("✅ 兩個引擎輸出的記錄完全一致", fg='green')
+
+
+if __name__ == '__main__':
+    main()
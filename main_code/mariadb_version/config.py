@@ -25,7 +25,22 @@ LOG_FILE = os.path.join(LOG_DIR, 'excel_search.log')
 INDEX_CONFIG = {
     # 批量處理配置
     'batch_size': 1000,              # 每批插入的單元格數量
-    'max_workers': 4,                # 多線程索引的線程數（階段 4 使用）
+    'max_workers': 4,                # 平行解析的進程數（index --workers 0 時使用）
+    'reader_engine': 'openpyxl',     # Excel 讀取引擎：openpyxl 或 iterparse（直接解析 XML，較快）
+    'file_timeout_seconds': 600,     # 單一檔案的解析時間上限，超過即終止該 worker（0 表示不限）
+    'max_worker_rss_mb': 2048,       # 解析 worker 的記憶體上限（MB），超過即終止（0 表示不限）
+    'schedule_policy': 'lpt',        # 解析順序：lpt（預估最久的先做）或 freshest（最近修改的先做）
+    'scan_workers': 8,               # 掃描目錄的執行緒數（網路磁碟上每次目錄讀取都是一次往返）
+
+    # 監看模式（index --watch）配置
+    'watch_debounce_seconds': 2.0,   # 檔案最後一個事件後等待多久才重新索引（合併存檔時的連續事件）
+    'watch_max_pending': 10000,      # 待處理變動的上限，超過即改為重新掃描整個目錄
+    'watch_max_concurrent': 2,       # 監看模式同時重新索引（平行解析）的檔案數上限
+    'watch_rescan_minutes': 60,      # 定期重新掃描的間隔（網路磁碟上其他電腦的修改沒有 inotify 事件；0 表示不掃描）
+
+    # 管線模式（index --pipeline）配置
+    'pipeline_queue_size': 1000,     # 掃描與解析之間佇列的上限（檔案數），解析跟不上時掃描會暫停
+    'pipeline_max_batch': 200,       # 每一批最多交給解析的檔案數（每批會重新啟動 worker）
 
     # 文件處理配置
     'skip_empty_cells': True,        # 跳過空白單元格
@@ -44,6 +59,13 @@ INDEX_CONFIG = {
 
 SUPPORTED_EXTENSIONS = ['.xlsx', '.xls']
 
+# 忽略規則（gitignore 語法）：符合的檔案不索引，符合的目錄整個不掃描
+# 例如 'Archive/'、'Backup_*/'、'/舊資料/2019/'
+IGNORE_PATTERNS = ['~$*']  # Excel 開啟時產生的暫存鎖定檔
+
+# 目錄中的忽略規則檔（gitignore 語法，規則相對於檔案所在目錄，並套用到整個子目錄樹）
+IGNORE_FILE_NAME = '.excelsearchignore'
+
 
 # ============================================================================
 # 搜索配置
@@ -54,6 +76,7 @@ SEARCH_CONFIG = {
     'max_limit': 1000,               # 最大返回結果數
     'context_length': 100,           # 上下文字符數
     'highlight_keyword': True,       # 是否高亮關鍵詞
+    'search_mode': 'fts',            # SQLite 搜索模式：fts（全文索引）或 like（逐筆比對）
 
     # 緩存配置（階段 4 使用）
     'enable_cache': False,           # 是否啟用緩存
@@ -134,6 +157,7 @@ DATABASE_CONFIG = {
 
     # 批量操作配置
     'batch_commit_size': 100,         # 每處理多少個文件提交一次
+    'bulk_commit_size': 1000,         # 批量載入模式（index --bulk）每處理多少個文件提交一次
 }
 
 
@@ -4,10 +4,14 @@ MariaDB 配置檔
 Excel 搜索系統 - MariaDB 版本
 """
 import os
+import tempfile
 
 # 工作目錄
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# 批次載入（index --bulk）的暫存 TSV 目錄；只允許從這個目錄 LOAD DATA LOCAL INFILE
+BULK_LOAD_DIR = tempfile.gettempdir()
+
 # MariaDB 連線設定
 DB_CONFIG = {
     'host': 'localhost',
@@ -19,17 +23,38 @@ DB_CONFIG = {
     'unix_socket': '/run/mysqld/mysqld.sock',  # 指定 socket 路徑
     'autocommit': False,
     'use_unicode': True,
-    'collation': 'utf8mb4_unicode_ci'
+    'collation': 'utf8mb4_unicode_ci',
+    'allow_local_infile_in_path': BULK_LOAD_DIR  # 伺服器端也需要 local_infile=ON（MariaDB 預設開啟）
 }
 
 # Excel 檔案搜索設定
 EXCEL_EXTENSIONS = ['.xlsx', '.xlsm', '.xls']
-IGNORE_PATTERNS = ['~$*', '.*']  # 忽略暫存檔和隱藏檔
+IGNORE_PATTERNS = ['~$*', '.*']  # 忽略暫存檔和隱藏檔（gitignore 語法，例如 'Archive/'、'Backup_*/'）
+IGNORE_FILE_NAME = '.excelsearchignore'  # 目錄中的忽略規則檔，規則套用到該目錄的整個子目錄樹
 MIN_FILE_SIZE = 1024  # 最小檔案大小 (bytes)
 
 # 索引設定
 BATCH_SIZE = 1000  # 批次插入大小
+BULK_LOAD_ROWS = 200000  # 批次載入模式每累積多少筆單元格執行一次 LOAD DATA
+DELETE_BATCH_SIZE = 500  # 清理已刪除檔案時，每個 DELETE ... WHERE file_id IN (...) 的檔案數
+MAX_WORKERS = 4  # 平行解析的進程數（index --workers 0 時使用）
+READER_ENGINE = 'openpyxl'  # Excel 讀取引擎：openpyxl 或 iterparse（直接解析 XML，較快）
+FILE_TIMEOUT_SECONDS = 600  # 單一檔案的解析時間上限，超過即終止該 worker（0 表示不限）
+MAX_WORKER_RSS_MB = 2048  # 解析 worker 的記憶體上限（MB），超過即終止（0 表示不限）
+SCHEDULE_POLICY = 'lpt'  # 解析順序：lpt（預估最久的先做）或 freshest（最近修改的先做）
 MAX_CELL_LENGTH = 10000  # 單元格最大長度
+EXPAND_MERGED_CELLS = True  # 是否展開合併儲存格（將左上角的值複製到整個範圍）
+MARK_MERGED_CELLS = True  # 是否標記合併儲存格（is_merged / merged_range）
+
+# 監看模式（index --watch）設定
+WATCH_DEBOUNCE_SECONDS = 2.0  # 檔案最後一個事件後等待多久才重新索引（合併存檔時的連續事件）
+WATCH_MAX_PENDING = 10000  # 待處理變動的上限，超過即改為重新掃描整個目錄
+WATCH_MAX_CONCURRENT = 2  # 監看模式同時重新索引（平行解析）的檔案數上限
+WATCH_RESCAN_MINUTES = 60  # 定期重新掃描的間隔（網路磁碟上其他電腦的修改沒有 inotify 事件；0 表示不掃描）
+
+# 管線模式（index --pipeline）設定
+PIPELINE_QUEUE_SIZE = 1000  # 掃描與解析之間佇列的上限（檔案數），解析跟不上時掃描會暫停
+PIPELINE_MAX_BATCH = 200  # 每一批最多交給解析的檔案數（每批會重新啟動 worker）
 
 # 顯示設定
 DEFAULT_SEARCH_LIMIT = 20  # 預設搜索結果數量
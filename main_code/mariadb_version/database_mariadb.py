@@ -3,11 +3,33 @@
 MariaDB 資料庫操作模組
 Excel 搜索系統 - MariaDB 版本
 """
+import os
+import math
+import time
+import tempfile
 import mysql.connector
+from contextlib import contextmanager
 from mysql.connector import Error
-from config_mariadb import DB_CONFIG
+from config_mariadb import DB_CONFIG, BULK_LOAD_DIR, BULK_LOAD_ROWS, DELETE_BATCH_SIZE
 from datetime import datetime
 
+# cells 表的寫入欄位（add_cells_batch 的 tuple 順序）
+CELL_COLUMNS = ('file_id', 'sheet_name', 'row_num', 'col_num', 'cell_location', 'value',
+                'value_lower', 'is_merged', 'merged_range', 'value_type', 'value_num')
+
+
+def _tsv_field(value):
+    """將一個欄位值轉成 LOAD DATA 預設格式（tab 分隔、反斜線跳脫、\\N 為 NULL）"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else '\\N'
+    text = str(value)
+    return (text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+            .replace('\r', '\\r').replace('\0', '\\0'))
+
 
 class DatabaseManager:
     """MariaDB 資料庫管理類"""
@@ -16,6 +38,13 @@ class DatabaseManager:
         """初始化資料庫管理器"""
         self.connection = None
         self.cursor = None
+        self._spool = None  # 批次載入模式的暫存 TSV（見 bulk_load()）
+        self._spool_rows = 0
+        self._spool_file_ids = set()  # 暫存 TSV 中有單元格的檔案
+        # LOAD DATA 失敗而遺失單元格的檔案（已刪除，呼叫端應視為索引失敗）
+        self.bulk_failed_ids = set()
+        # 單元格寫入統計（rows / seconds），用於顯示寫入速度
+        self.write_stats = {'rows': 0, 'seconds': 0.0}
 
     def connect(self):
         """連接到 MariaDB 資料庫"""
@@ -27,6 +56,15 @@ class DatabaseManager:
             print(f"❌ 連接資料庫失敗: {e}")
             return False
 
+    def ping(self):
+        """確認連線仍有效，斷線時重新連線（長時間閒置的 index --watch 可能被 wait_timeout 斷線）"""
+        try:
+            self.connection.ping(reconnect=True, attempts=3, delay=5)
+            return True
+        except Error as e:
+            print(f"❌ 重新連接資料庫失敗: {e}")
+            return False
+
     def close(self):
         """關閉資料庫連接"""
         if self.cursor:
@@ -56,11 +94,28 @@ class DatabaseManager:
                     file_size BIGINT,
                     cell_count INT DEFAULT 0,
                     indexed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    content_hash CHAR(40),
+                    content_file_id INT,
+                    parse_seconds DOUBLE,
                     INDEX idx_file_name (file_name),
-                    INDEX idx_indexed_at (indexed_at)
+                    INDEX idx_indexed_at (indexed_at),
+                    INDEX idx_content_hash (content_hash),
+                    INDEX idx_content_file_id (content_file_id)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
 
+            # 舊版資料表補上新增欄位
+            # content_hash: 內容指紋；content_file_id: 內容相同時實際保存單元格的檔案
+            # parse_seconds: 上次完整解析的耗時（用於排程）
+            self.cursor.execute("""
+                ALTER TABLE files
+                    ADD COLUMN IF NOT EXISTS content_hash CHAR(40),
+                    ADD COLUMN IF NOT EXISTS content_file_id INT,
+                    ADD COLUMN IF NOT EXISTS parse_seconds DOUBLE,
+                    ADD INDEX IF NOT EXISTS idx_content_hash (content_hash),
+                    ADD INDEX IF NOT EXISTS idx_content_file_id (content_file_id)
+            """)
+
             # 建立 cells 表
             self.cursor.execute("""
                 CREATE TABLE IF NOT EXISTS cells (
@@ -74,14 +129,96 @@ class DatabaseManager:
                     value_lower TEXT,
                     is_merged BOOLEAN DEFAULT FALSE,
                     merged_range VARCHAR(50),
+                    value_type VARCHAR(10),
+                    value_num DOUBLE,
                     FOREIGN KEY (file_id) REFERENCES files(file_id) ON DELETE CASCADE,
                     INDEX idx_file_id (file_id),
                     INDEX idx_value_lower (value_lower(500)),
                     INDEX idx_sheet (sheet_name),
+                    INDEX idx_file_sheet (file_id, sheet_name),
                     INDEX idx_location (row_num, col_num),
+                    INDEX idx_value_num (value_type, value_num),
                     FULLTEXT INDEX idx_fulltext (value)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
             """)
+            # value_type: 原始類型；value_num: 數值（日期為 1970-01-01 起的秒數）
+            self.cursor.execute("""
+                ALTER TABLE cells
+                    ADD COLUMN IF NOT EXISTS value_type VARCHAR(10),
+                    ADD COLUMN IF NOT EXISTS value_num DOUBLE,
+                    ADD INDEX IF NOT EXISTS idx_file_sheet (file_id, sheet_name),
+                    ADD INDEX IF NOT EXISTS idx_value_num (value_type, value_num)
+            """)
+
+            # 建立 sheet_parts 表（各工作表部件 CRC，用於只重新索引有變動的工作表）
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sheet_parts (
+                    file_id INT NOT NULL,
+                    sheet_name VARCHAR(255) NOT NULL,
+                    part_crc INT UNSIGNED NOT NULL,
+                    shared_crc INT UNSIGNED NOT NULL,
+                    PRIMARY KEY (file_id, sheet_name),
+                    FOREIGN KEY (file_id) REFERENCES files(file_id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+            """)
+
+            # 建立 failed_files 表（結構損壞或解析失敗，檔案未變動前不再重試）
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS failed_files (
+                    failed_id INT AUTO_INCREMENT PRIMARY KEY,
+                    file_path VARCHAR(1000) NOT NULL UNIQUE,
+                    file_size BIGINT,
+                    mtime DOUBLE,
+                    status VARCHAR(30) NOT NULL,
+                    error TEXT,
+                    failed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+
+            # 建立 index_runs / run_files 表（索引執行記錄，中斷後可用 index --resume 續跑）
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS index_runs (
+                    run_id INT AUTO_INCREMENT PRIMARY KEY,
+                    root_path VARCHAR(1000) NOT NULL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'running',
+                    file_count INT DEFAULT 0,
+                    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    finished_at DATETIME,
+                    INDEX idx_status (status)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS run_files (
+                    run_id INT NOT NULL,
+                    file_path VARCHAR(1000) NOT NULL,
+                    state VARCHAR(20) NOT NULL DEFAULT 'pending',
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (run_id, file_path),
+                    INDEX idx_run_state (run_id, state),
+                    FOREIGN KEY (run_id) REFERENCES index_runs(run_id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+            """)
+
+            # 建立 scan_dirs / scan_entries 表（目錄快照，目錄 mtime 未變時掃描直接沿用）
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scan_dirs (
+                    dir_id INT AUTO_INCREMENT PRIMARY KEY,
+                    dir_path VARCHAR(1000) NOT NULL UNIQUE,
+                    mtime_ns BIGINT NOT NULL,
+                    scanned_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+            """)
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS scan_entries (
+                    dir_id INT NOT NULL,
+                    name VARCHAR(255) NOT NULL,
+                    is_dir BOOLEAN NOT NULL DEFAULT FALSE,
+                    file_size BIGINT,
+                    mtime DOUBLE,
+                    PRIMARY KEY (dir_id, name),
+                    FOREIGN KEY (dir_id) REFERENCES scan_dirs(dir_id) ON DELETE CASCADE
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+            """)
 
             self.connection.commit()
             print("✅ 資料表建立成功")
@@ -92,18 +229,20 @@ class DatabaseManager:
             self.connection.rollback()
             return False
 
-    def add_file(self, file_path, file_name, last_modified, file_size):
+    def add_file(self, file_path, file_name, last_modified, file_size, content_hash=None):
         """新增檔案記錄"""
         try:
             sql = """
-                INSERT INTO files (file_path, file_name, last_modified, file_size)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO files (file_path, file_name, last_modified, file_size, content_hash)
+                VALUES (%s, %s, %s, %s, %s)
                 ON DUPLICATE KEY UPDATE
                     last_modified = VALUES(last_modified),
                     file_size = VALUES(file_size),
+                    content_hash = VALUES(content_hash),
+                    content_file_id = NULL,
                     indexed_at = CURRENT_TIMESTAMP
             """
-            self.cursor.execute(sql, (file_path, file_name, last_modified, file_size))
+            self.cursor.execute(sql, (file_path, file_name, last_modified, file_size, content_hash))
             self.connection.commit()
             return self.cursor.lastrowid or self.get_file_id(file_path)
         except Error as e:
@@ -126,7 +265,8 @@ class DatabaseManager:
         try:
             self.cursor.execute("""
                 SELECT file_id, file_path, file_name, last_modified,
-                       file_size, cell_count, indexed_at
+                       file_size, cell_count, indexed_at, content_hash, content_file_id,
+                       parse_seconds
                 FROM files
                 WHERE file_path = %s
             """, (file_path,))
@@ -135,31 +275,253 @@ class DatabaseManager:
             print(f"❌ 獲取檔案資訊失敗: {e}")
             return None
 
+    def find_content_owner(self, content_hash, exclude_path=None):
+        """查找保存了相同內容單元格的檔案"""
+        try:
+            self.cursor.execute("""
+                SELECT file_id, file_path, cell_count
+                FROM files
+                WHERE content_hash = %s AND content_file_id IS NULL
+                  AND cell_count > 0 AND file_path != %s
+                ORDER BY file_id
+                LIMIT 1
+            """, (content_hash, exclude_path or ''))
+            return self.cursor.fetchone()
+        except Error as e:
+            print(f"❌ 查找相同內容檔案失敗: {e}")
+            return None
+
+    def link_file_content(self, file_id, owner_id):
+        """將檔案指向另一個內容相同的檔案，共用其單元格"""
+        try:
+            self.cursor.execute("""
+                UPDATE files f
+                JOIN files owner ON owner.file_id = %s
+                SET f.content_file_id = owner.file_id,
+                    f.cell_count = owner.cell_count
+                WHERE f.file_id = %s
+            """, (owner_id, file_id))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 連結相同內容檔案失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def update_file_metadata(self, file_id, last_modified, file_size, content_hash=None):
+        """只更新檔案的修改時間和大小（內容未變，或只重新索引部分工作表）"""
+        try:
+            self.cursor.execute("""
+                UPDATE files
+                SET last_modified = %s, file_size = %s, content_hash = COALESCE(%s, content_hash)
+                WHERE file_id = %s
+            """, (last_modified, file_size, content_hash, file_id))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 更新檔案資訊失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def has_content_aliases(self, file_id):
+        """檢查是否有其他檔案共用這個檔案的單元格"""
+        try:
+            self.cursor.execute(
+                "SELECT 1 AS found FROM files WHERE content_file_id = %s LIMIT 1", (file_id,)
+            )
+            return self.cursor.fetchone() is not None
+        except Error as e:
+            print(f"❌ 查詢共用檔案失敗: {e}")
+            return True
+
+    def get_sheet_parts(self, file_id):
+        """獲取上次索引時各工作表的部件 CRC: {工作表名稱: (部件 CRC, 共用部件 CRC)}"""
+        try:
+            self.cursor.execute("""
+                SELECT sheet_name, part_crc, shared_crc FROM sheet_parts WHERE file_id = %s
+            """, (file_id,))
+            return {row['sheet_name']: (row['part_crc'], row['shared_crc'])
+                    for row in self.cursor.fetchall()}
+        except Error as e:
+            print(f"❌ 獲取工作表部件失敗: {e}")
+            return {}
+
+    def save_sheet_parts(self, file_id, sheet_parts):
+        """記錄各工作表的部件 CRC（取代舊記錄）"""
+        try:
+            self.cursor.execute("DELETE FROM sheet_parts WHERE file_id = %s", (file_id,))
+            self.cursor.executemany("""
+                INSERT INTO sheet_parts (file_id, sheet_name, part_crc, shared_crc)
+                VALUES (%s, %s, %s, %s)
+            """, [(file_id, name, part_crc, shared_crc)
+                  for name, (part_crc, shared_crc) in sheet_parts.items()])
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 記錄工作表部件失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def last_cell_id(self):
+        """目前最大的 cell_id（AUTO_INCREMENT 只增不減，之後寫入的單元格都大於它）"""
+        try:
+            self.cursor.execute("SELECT COALESCE(MAX(cell_id), 0) AS last_id FROM cells")
+            return self.cursor.fetchone()['last_id']
+        except Error as e:
+            print(f"❌ 獲取最大單元格 ID 失敗: {e}")
+            return None
+
+    def delete_sheet_content(self, file_id, sheet_names, up_to_cell_id=None):
+        """
+        只刪除指定工作表的單元格，回傳刪除的單元格數（失敗時回傳 None）
+
+        up_to_cell_id 不是 None 時只刪除 cell_id 不大於它的舊單元格（新內容已先寫入）。
+        """
+        self.flush_bulk()
+        try:
+            deleted = 0
+            bound = "" if up_to_cell_id is None else " AND cell_id <= %s"
+            for sheet_name in sheet_names:
+                params = (file_id, sheet_name) if up_to_cell_id is None else (file_id, sheet_name, up_to_cell_id)
+                self.cursor.execute(
+                    f"DELETE FROM cells WHERE file_id = %s AND sheet_name = %s{bound}", params
+                )
+                deleted += self.cursor.rowcount
+                self.cursor.execute(
+                    "DELETE FROM sheet_parts WHERE file_id = %s AND sheet_name = %s",
+                    (file_id, sheet_name)
+                )
+            self.connection.commit()
+            return deleted
+        except Error as e:
+            print(f"❌ 刪除工作表內容失敗: {e}")
+            self.connection.rollback()
+            return None
+
+    def discard_new_cells(self, file_id, after_cell_id):
+        """刪除重新索引中途寫入的新單元格（cell_id 大於 after_cell_id），保留舊內容"""
+        self.flush_bulk()
+        try:
+            self.cursor.execute("DELETE FROM cells WHERE file_id = %s AND cell_id > %s",
+                                (file_id, after_cell_id))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 捨棄新寫入的單元格失敗: {e}")
+            self.connection.rollback()
+            return False
+
     def add_cells_batch(self, cells_data):
-        """批次新增單元格資料"""
+        """批次新增單元格資料（tuple 欄位順序見 CELL_COLUMNS），寫入失敗時拋出 Error"""
         if not cells_data:
             return 0
 
+        if self._spool:
+            # 批次載入模式：先寫入暫存 TSV，累積夠多再 LOAD DATA
+            started = time.perf_counter()
+            self._spool.writelines('\t'.join(map(_tsv_field, row)) + '\n' for row in cells_data)
+            self._spool_rows += len(cells_data)
+            self._spool_file_ids.update(row[0] for row in cells_data)
+            self.write_stats['seconds'] += time.perf_counter() - started
+            if self._spool_rows >= BULK_LOAD_ROWS:
+                self.flush_bulk()
+            return len(cells_data)
+
         try:
-            sql = """
-                INSERT INTO cells
-                (file_id, sheet_name, row_num, col_num, cell_location, value, value_lower, is_merged, merged_range)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            started = time.perf_counter()
+            sql = f"""
+                INSERT INTO cells ({', '.join(CELL_COLUMNS)})
+                VALUES ({', '.join(['%s'] * len(CELL_COLUMNS))})
             """
             self.cursor.executemany(sql, cells_data)
             self.connection.commit()
+            self.write_stats['rows'] += len(cells_data)
+            self.write_stats['seconds'] += time.perf_counter() - started
             return self.cursor.rowcount
         except Error as e:
+            # 不能只回傳 0：呼叫端會把檔案標記為完成，單元格數量卻包含沒寫入的資料
             print(f"❌ 批次新增單元格失敗: {e}")
             self.connection.rollback()
-            return 0
+            raise
+
+    @contextmanager
+    def bulk_load(self):
+        """
+        批次載入模式：add_cells_batch 改寫入暫存 TSV，每 BULK_LOAD_ROWS 筆
+        以 LOAD DATA LOCAL INFILE 載入，期間關閉 foreign_key_checks / unique_checks
+
+        依賴已載入單元格的操作（更新單元格數量、刪除檔案或工作表）會先載入暫存內容，
+        因此檔案被標記為完成時，它的單元格一定已經寫入資料庫。
+        關閉 foreign_key_checks 時 CASCADE 不會生效，刪除檔案會另外刪除單元格與工作表部件。
+        載入失敗時，暫存中有單元格的檔案會被刪除並記在 bulk_failed_ids。
+        """
+        self._spool = tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='\n',
+                                                  suffix='.tsv', prefix='cells_',
+                                                  dir=BULK_LOAD_DIR, delete=False)
+        self._spool_rows = 0
+        self._spool_file_ids = set()
+        self.bulk_failed_ids = set()
+        self.cursor.execute("SET SESSION foreign_key_checks = 0")
+        self.cursor.execute("SET SESSION unique_checks = 0")
+        try:
+            yield self
+            self.flush_bulk()
+        finally:
+            spool, self._spool = self._spool, None
+            spool.close()
+            os.remove(spool.name)
+            if self.connection.is_connected():
+                self.cursor.execute("SET SESSION unique_checks = 1")
+                self.cursor.execute("SET SESSION foreign_key_checks = 1")
+
+    def flush_bulk(self):
+        """
+        將暫存 TSV 中的單元格以 LOAD DATA LOCAL INFILE 載入並清空暫存
+
+        載入失敗時，暫存中的單元格屬於尚未完成的檔案（完成前一定會先載入），
+        這些檔案整個刪除並記在 bulk_failed_ids，由呼叫端標記為失敗，下次索引會重新解析。
+        """
+        if not self._spool or not self._spool_rows:
+            return True
 
-    def update_file_cell_count(self, file_id, cell_count):
-        """更新檔案的單元格數量"""
+        file_ids = self._spool_file_ids
+        self._spool_file_ids = set()
+        try:
+            started = time.perf_counter()
+            self._spool.flush()
+            self.cursor.execute(f"""
+                LOAD DATA LOCAL INFILE %s INTO TABLE cells
+                CHARACTER SET utf8mb4
+                FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+                LINES TERMINATED BY '\\n'
+                ({', '.join(CELL_COLUMNS)})
+            """, (self._spool.name,))
+            self.connection.commit()
+            self.write_stats['rows'] += self._spool_rows
+            self.write_stats['seconds'] += time.perf_counter() - started
+            loaded = True
+        except Error as e:
+            print(f"❌ LOAD DATA 載入單元格失敗: {e}")
+            self.connection.rollback()
+            loaded = False
+        finally:
+            self._spool.seek(0)
+            self._spool.truncate()
+            self._spool_rows = 0
+
+        if not loaded:
+            self.bulk_failed_ids.update(file_ids)
+            self.delete_files(file_ids)
+        return loaded
+
+    def update_file_cell_count(self, file_id, cell_count, parse_seconds=None):
+        """更新檔案的單元格數量（與完整解析的耗時）"""
+        self.flush_bulk()
         try:
             self.cursor.execute(
-                "UPDATE files SET cell_count = %s WHERE file_id = %s",
-                (cell_count, file_id)
+                "UPDATE files SET cell_count = %s, parse_seconds = COALESCE(%s, parse_seconds) "
+                "WHERE file_id = %s",
+                (cell_count, parse_seconds, file_id)
             )
             self.connection.commit()
             return True
@@ -168,11 +530,40 @@ class DatabaseManager:
             self.connection.rollback()
             return False
 
-    def search(self, keyword, limit=20):
-        """搜索單元格內容"""
+    def search(self, keyword, limit=20, num_range=None, date_range=None):
+        """
+        搜索單元格內容
+
+        keyword 可為 None；num_range 為 (最小值, 最大值)，date_range 為 (下限秒數, 上限秒數)，
+        兩者的任一端可為 None。數值與日期條件走 idx_value_num 的範圍掃描。
+        """
+        conditions, params = [], []
+        if keyword:
+            conditions.append("c.value_lower LIKE %s")
+            params.append(f'%{keyword.lower()}%')
+        for value_type, value_range in (('number', num_range), ('date', date_range)):
+            if not value_range:
+                continue
+            conditions.append("c.value_type = %s")
+            params.append(value_type)
+            low, high = value_range
+            if low is not None:
+                conditions.append("c.value_num >= %s")
+                params.append(low)
+            if high is not None:
+                # 數值範圍包含上限，日期範圍不含
+                conditions.append("c.value_num <= %s" if value_type == 'number' else "c.value_num < %s")
+                params.append(high)
+        if not conditions:
+            return []
+
         try:
-            sql = """
-                SELECT
+            # 單元格對應到保存它的檔案與所有內容相同的檔案。不寫成一個 OR 連接：
+            # 那樣 files 無法走索引；分成兩個連接以 UNION ALL 合併，各自先取前 limit 筆
+            where = ' AND '.join(conditions)
+            order = "ORDER BY file_name, sheet_name, row_num, col_num"
+            branches = [f"""
+                (SELECT
                     f.file_name,
                     f.file_path,
                     c.sheet_name,
@@ -182,13 +573,13 @@ class DatabaseManager:
                     c.col_num,
                     c.file_id
                 FROM cells c
-                JOIN files f ON c.file_id = f.file_id
-                WHERE c.value_lower LIKE %s
-                ORDER BY f.file_name, c.sheet_name, c.row_num, c.col_num
-                LIMIT %s
-            """
-            search_pattern = f'%{keyword.lower()}%'
-            self.cursor.execute(sql, (search_pattern, limit))
+                JOIN files f ON f.{join_column} = c.file_id
+                WHERE {where}
+                {order}
+                LIMIT %s)
+            """ for join_column in ('file_id', 'content_file_id')]
+            sql = f"{' UNION ALL '.join(branches)} {order} LIMIT %s"
+            self.cursor.execute(sql, (*params, limit, *params, limit, limit))
             return self.cursor.fetchall()
         except Error as e:
             print(f"❌ 搜索失敗: {e}")
@@ -226,6 +617,10 @@ class DatabaseManager:
             result = self.cursor.fetchone()
             stats['db_size_mb'] = round(result['size_mb'], 2) if result['size_mb'] else 0
 
+            # 失敗檔案數
+            self.cursor.execute("SELECT COUNT(*) as count FROM failed_files")
+            stats['failed_count'] = self.cursor.fetchone()['count']
+
             return stats
         except Error as e:
             print(f"❌ 獲取統計資訊失敗: {e}")
@@ -236,6 +631,9 @@ class DatabaseManager:
         try:
             self.cursor.execute("DELETE FROM cells")
             self.cursor.execute("DELETE FROM files")
+            self.cursor.execute("DELETE FROM failed_files")
+            self.cursor.execute("DELETE FROM index_runs")
+            self.cursor.execute("DELETE FROM scan_dirs")
             self.connection.commit()
             print("✅ 資料庫已清空")
             return True
@@ -246,10 +644,14 @@ class DatabaseManager:
 
     def delete_file(self, file_path):
         """刪除檔案及其所有單元格"""
+        self.flush_bulk()
         try:
             file_id = self.get_file_id(file_path)
             if file_id:
-                # 由於設定了 ON DELETE CASCADE，刪除 files 會自動刪除相關 cells
+                # 有其他檔案共用此內容時，先把單元格轉交出去
+                self._release_file_content(file_id)
+                # ON DELETE CASCADE 會刪除相關 cells；批次載入模式下 CASCADE 不生效，先明確刪除
+                self._delete_file_content([file_id])
                 self.cursor.execute("DELETE FROM files WHERE file_id = %s", (file_id,))
                 self.connection.commit()
                 return True
@@ -259,6 +661,300 @@ class DatabaseManager:
             self.connection.rollback()
             return False
 
+    def delete_files(self, file_ids):
+        """
+        批次刪除多個檔案及其所有單元格，回傳刪除的檔案數
+
+        先刪除共用別人內容的檔案（本身沒有單元格），再刪除保存內容的檔案；
+        內容仍被其他（未刪除的）檔案共用時，單元格先轉交出去。
+        每 DELETE_BATCH_SIZE 個檔案執行一次 DELETE ... WHERE file_id IN (...)。
+        """
+        self.flush_bulk()
+        file_ids = list(file_ids)
+        chunks = [file_ids[i:i + DELETE_BATCH_SIZE] for i in range(0, len(file_ids), DELETE_BATCH_SIZE)]
+        deleted = 0
+        try:
+            aliases, owners = [], []
+            for chunk in chunks:
+                placeholders = ', '.join(['%s'] * len(chunk))
+                self.cursor.execute(f"""
+                    SELECT file_id, content_file_id FROM files WHERE file_id IN ({placeholders})
+                """, chunk)
+                for row in self.cursor.fetchall():
+                    (aliases if row['content_file_id'] else owners).append(row['file_id'])
+
+            for group in (aliases, owners):
+                for i in range(0, len(group), DELETE_BATCH_SIZE):
+                    chunk = group[i:i + DELETE_BATCH_SIZE]
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    if group is owners:
+                        self.cursor.execute(f"""
+                            SELECT DISTINCT content_file_id FROM files
+                            WHERE content_file_id IN ({placeholders})
+                        """, chunk)
+                        for row in self.cursor.fetchall():
+                            self._release_file_content(row['content_file_id'])
+                    # ON DELETE CASCADE 會刪除相關 cells；批次載入模式下 CASCADE 不生效，先明確刪除
+                    self._delete_file_content(chunk)
+                    self.cursor.execute(f"DELETE FROM files WHERE file_id IN ({placeholders})", chunk)
+                    deleted += self.cursor.rowcount
+                    self.connection.commit()
+            return deleted
+        except Error as e:
+            print(f"❌ 批次刪除檔案失敗: {e}")
+            self.connection.rollback()
+            return deleted
+
+    def _delete_file_content(self, file_ids):
+        """批次載入模式關閉了 foreign_key_checks，CASCADE 不會生效，刪除檔案前先刪除單元格與工作表部件（不提交）"""
+        if self._spool is None:
+            return
+        placeholders = ', '.join(['%s'] * len(file_ids))
+        self.cursor.execute(f"DELETE FROM cells WHERE file_id IN ({placeholders})", file_ids)
+        self.cursor.execute(f"DELETE FROM sheet_parts WHERE file_id IN ({placeholders})", file_ids)
+
+    def _release_file_content(self, file_id):
+        """檔案內容被刪除前，把單元格轉交給共用此內容的第一個檔案（不提交）"""
+        self.cursor.execute("""
+            SELECT file_id FROM files WHERE content_file_id = %s ORDER BY file_id LIMIT 1
+        """, (file_id,))
+        heir = self.cursor.fetchone()
+        if not heir:
+            return
+
+        heir_id = heir['file_id']
+        self.cursor.execute("UPDATE cells SET file_id = %s WHERE file_id = %s", (heir_id, file_id))
+        self.cursor.execute("UPDATE sheet_parts SET file_id = %s WHERE file_id = %s", (heir_id, file_id))
+        self.cursor.execute("""
+            UPDATE files SET content_file_id = %s WHERE content_file_id = %s AND file_id != %s
+        """, (heir_id, file_id, heir_id))
+        self.cursor.execute("UPDATE files SET content_file_id = NULL WHERE file_id = %s", (heir_id,))
+
+    def get_failed_file(self, file_path):
+        """獲取檔案的失敗記錄"""
+        try:
+            self.cursor.execute("""
+                SELECT file_path, file_size, mtime, status, error, failed_at
+                FROM failed_files
+                WHERE file_path = %s
+            """, (file_path,))
+            return self.cursor.fetchone()
+        except Error as e:
+            print(f"❌ 獲取失敗記錄失敗: {e}")
+            return None
+
+    def record_failed_file(self, file_path, file_size, mtime, status, error):
+        """記錄失敗的檔案（以路徑、大小、修改時間識別同一個版本）"""
+        try:
+            self.cursor.execute("""
+                INSERT INTO failed_files (file_path, file_size, mtime, status, error)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    file_size = VALUES(file_size),
+                    mtime = VALUES(mtime),
+                    status = VALUES(status),
+                    error = VALUES(error),
+                    failed_at = CURRENT_TIMESTAMP
+            """, (file_path, file_size, mtime, status, error))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 記錄失敗檔案失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def clear_failed_file(self, file_path):
+        """移除檔案的失敗記錄（檔案已成功索引）"""
+        try:
+            self.cursor.execute("DELETE FROM failed_files WHERE file_path = %s", (file_path,))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 移除失敗記錄失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def get_failed_files(self):
+        """獲取所有失敗記錄"""
+        try:
+            self.cursor.execute("""
+                SELECT file_path, file_size, mtime, status, error, failed_at
+                FROM failed_files
+                ORDER BY status, file_path
+            """)
+            return self.cursor.fetchall()
+        except Error as e:
+            print(f"❌ 獲取失敗記錄失敗: {e}")
+            return []
+
+    def start_index_run(self, root_path, file_paths):
+        """建立一次索引執行，所有檔案的狀態設為 pending，回傳 run_id"""
+        try:
+            self.cursor.execute("""
+                INSERT INTO index_runs (root_path, file_count) VALUES (%s, %s)
+            """, (root_path, len(file_paths)))
+            run_id = self.cursor.lastrowid
+            self.cursor.executemany("""
+                INSERT IGNORE INTO run_files (run_id, file_path) VALUES (%s, %s)
+            """, [(run_id, file_path) for file_path in file_paths])
+            self.connection.commit()
+            return run_id
+        except Error as e:
+            print(f"❌ 建立索引執行記錄失敗: {e}")
+            self.connection.rollback()
+            return None
+
+    def add_run_files(self, run_id, file_paths):
+        """把檔案加入進行中的索引執行（邊掃描邊索引時使用），狀態為 pending"""
+        try:
+            self.cursor.executemany("""
+                INSERT IGNORE INTO run_files (run_id, file_path) VALUES (%s, %s)
+            """, [(run_id, file_path) for file_path in file_paths])
+            self.cursor.execute("""
+                UPDATE index_runs SET file_count = file_count + %s WHERE run_id = %s
+            """, (len(file_paths), run_id))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 新增索引執行檔案失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def get_index_runs(self, status):
+        """獲取指定狀態的索引執行（最新的在前）"""
+        try:
+            self.cursor.execute("""
+                SELECT run_id, root_path, status, file_count, started_at, finished_at
+                FROM index_runs
+                WHERE status = %s
+                ORDER BY run_id DESC
+            """, (status,))
+            return self.cursor.fetchall()
+        except Error as e:
+            print(f"❌ 獲取索引執行記錄失敗: {e}")
+            return []
+
+    def set_index_run_status(self, run_id, status):
+        """更新索引執行的狀態；completed / abandoned 時清除逐檔狀態"""
+        try:
+            if status in ('completed', 'abandoned'):
+                self.cursor.execute("DELETE FROM run_files WHERE run_id = %s", (run_id,))
+                self.cursor.execute("""
+                    UPDATE index_runs SET status = %s, finished_at = NOW() WHERE run_id = %s
+                """, (status, run_id))
+            else:
+                self.cursor.execute("UPDATE index_runs SET status = %s WHERE run_id = %s",
+                                    (status, run_id))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 更新索引執行狀態失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def set_run_file_state(self, run_id, file_path, state):
+        """更新檔案在索引執行中的狀態（pending / in_progress / done / failed）"""
+        try:
+            self.cursor.execute("""
+                UPDATE run_files SET state = %s WHERE run_id = %s AND file_path = %s
+            """, (state, run_id, file_path))
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 更新檔案狀態失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def get_run_files(self, run_id, states):
+        """獲取索引執行中處於指定狀態的檔案路徑"""
+        try:
+            placeholders = ', '.join(['%s'] * len(states))
+            self.cursor.execute(f"""
+                SELECT file_path FROM run_files
+                WHERE run_id = %s AND state IN ({placeholders})
+                ORDER BY file_path
+            """, (run_id, *states))
+            return [row['file_path'] for row in self.cursor.fetchall()]
+        except Error as e:
+            print(f"❌ 獲取執行檔案列表失敗: {e}")
+            return []
+
+    def get_dir_snapshot(self, root_path):
+        """讀取根路徑（含）以下所有目錄的快照（DirectorySnapshot 的格式）"""
+        prefix = os.path.join(root_path, '')
+        under_root = "d.dir_path = %s OR LEFT(d.dir_path, %s) = %s"
+        params = (root_path, len(prefix), prefix)
+        try:
+            self.cursor.execute(f"SELECT d.dir_path, d.mtime_ns FROM scan_dirs d WHERE {under_root}",
+                                params)
+            dirs = {row['dir_path']: {'mtime_ns': row['mtime_ns'], 'subdirs': [], 'files': []}
+                    for row in self.cursor.fetchall()}
+
+            self.cursor.execute(f"""
+                SELECT d.dir_path, e.name, e.is_dir, e.file_size, e.mtime
+                FROM scan_entries e JOIN scan_dirs d ON d.dir_id = e.dir_id
+                WHERE {under_root}
+            """, params)
+            for row in self.cursor.fetchall():
+                record = dirs[row['dir_path']]
+                if row['is_dir']:
+                    record['subdirs'].append(os.path.join(row['dir_path'], row['name']))
+                else:
+                    record['files'].append((row['name'], row['file_size'], row['mtime']))
+            return dirs
+        except Error as e:
+            print(f"❌ 讀取目錄快照失敗: {e}")
+            return {}
+
+    def save_dir_snapshot(self, snapshot, prune=True):
+        """寫回本次掃描重新列出的目錄；prune 時刪除本次沒有掃描到的目錄"""
+        try:
+            removed = snapshot.stale_dirs() if prune else []
+            # CASCADE 會自動刪除相關 scan_entries
+            for dir_path in removed + list(snapshot.changed):
+                self.cursor.execute("DELETE FROM scan_dirs WHERE dir_path = %s", (dir_path,))
+
+            for dir_path, record in snapshot.changed.items():
+                self.cursor.execute(
+                    "INSERT INTO scan_dirs (dir_path, mtime_ns) VALUES (%s, %s)",
+                    (dir_path, record['mtime_ns']))
+                dir_id = self.cursor.lastrowid
+                entries = ([(dir_id, os.path.basename(subdir), True, None, None)
+                            for subdir in record['subdirs']]
+                           + [(dir_id, name, False, size, mtime)
+                              for name, size, mtime in record['files']])
+                if entries:
+                    self.cursor.executemany("""
+                        INSERT INTO scan_entries (dir_id, name, is_dir, file_size, mtime)
+                        VALUES (%s, %s, %s, %s, %s)
+                    """, entries)
+            self.connection.commit()
+            return True
+        except Error as e:
+            print(f"❌ 儲存目錄快照失敗: {e}")
+            self.connection.rollback()
+            return False
+
+    def get_files_map(self, root_path):
+        """一次讀出根目錄下所有已索引的檔案，回傳 路徑 -> 記錄（欄位同 get_file_by_path）"""
+        prefix = os.path.join(root_path, '')
+        # LIKE 'prefix%' 可使用 file_path 的索引；路徑中的 % 與 _ 需要跳脫
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        try:
+            self.cursor.execute("""
+                SELECT file_id, file_path, file_name, last_modified,
+                       file_size, cell_count, indexed_at, content_hash, content_file_id,
+                       parse_seconds
+                FROM files
+                WHERE file_path LIKE %s
+            """, (pattern,))
+            # 排序規則不分大小寫，LIKE 可能多比對到大小寫不同的路徑
+            return {row['file_path']: row for row in self.cursor.fetchall()
+                    if row['file_path'].startswith(prefix)}
+        except Error as e:
+            print(f"❌ 查詢檔案列表失敗: {e}")
+            return {}
+
     def get_files_under_path(self, base_path):
         """取得指定路徑下所有已索引的檔案"""
         try:
@@ -297,6 +993,9 @@ if __name__ == '__main__':
         print("資料表:")
         print("  - files: 儲存 Excel 檔案資訊")
         print("  - cells: 儲存單元格內容")
+        print("  - sheet_parts: 儲存工作表部件 CRC")
+        print("  - failed_files: 儲存無法索引的檔案")
+        print("  - index_runs / run_files: 儲存索引執行進度")
     else:
         print()
         print("❌ 資料庫初始化失敗")
@@ -0,0 +1,899 @@
+"""
+Excel 搜索系統 - Excel 讀取模組
+以生成器逐個工作表串流輸出單元格，避免把整本活頁簿載入記憶體
+"""
+import os
+import hashlib
+import logging
+import posixpath
+import re
+import zlib
+import zipfile
+import xml.etree.ElementTree as ET
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, Dict, Any, List, Optional, Set, Tuple
+
+import xlrd
+from openpyxl import load_workbook
+from openpyxl.cell.read_only import EMPTY_CELL
+from openpyxl.styles.numbers import builtin_format_code, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter, range_boundaries
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+
+logger = logging.getLogger(__name__)
+
+# 支援的讀取引擎
+#   openpyxl:  load_workbook(read_only=True)，相容性最好
+#   iterparse: 直接解壓 xlsx 並串流解析工作表 XML，不建立單元格物件
+# .xls 舊格式不受引擎設定影響，一律由 xlrd 讀取
+READER_ENGINES = ('openpyxl', 'iterparse')
+DEFAULT_ENGINE = 'openpyxl'
+
+# OOXML 關聯類型（以結尾判斷，同時相容 Transitional 與 Strict 格式）
+_REL_WORKSHEET = '/worksheet'
+_REL_SHARED_STRINGS = '/sharedStrings'
+_REL_STYLES = '/styles'
+_REL_OFFICE_DOCUMENT = '/officeDocument'
+_PACKAGE_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+# validate_workbook() 的狀態代碼中可以解析的狀態
+VALID_STATUSES = ('VALID_ZIP', 'VALID_XLS')
+_OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+# 單元格值類型（cells.value_type），value_num 的意義：
+#   number: 數值本身
+#   date:   to_epoch_seconds() 的秒數
+#   time:   時間（自午夜起）或時間長度的秒數
+#   bool:   1 / 0
+#   text:   無（None）
+VALUE_TYPES = ('text', 'number', 'date', 'time', 'bool')
+_EPOCH = datetime(1970, 1, 1)
+
+# <mergeCell ref="A1:C2"/>（可能帶命名空間前綴）
+_MERGE_CELL_RE = re.compile(rb'<(?:[A-Za-z_][\w.-]*:)?mergeCell\b[^>]*?\bref=["\']([^"\']+)["\']')
+# 掃描的單元格超過此數且保留比例低於 SPARSE_SHEET_RATIO 時，記錄警告（大量格式化空白）
+SPARSE_SHEET_MIN_SCANNED = 100000
+SPARSE_SHEET_RATIO = 0.01
+# 單個合併範圍最多展開的單元格數，超過時只標記錨點（避免整欄合併產生上百萬筆）
+MAX_MERGED_EXPANSION = 10000
+
+
+def read_excel_file(file_path: str, engine: str = DEFAULT_ENGINE,
+                    sheets: Optional[Iterable[str]] = None,
+                    expand_merged: bool = False,
+                    mark_merged: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    逐個工作表串流讀取 Excel 檔案中的非空單元格
+
+    與舊版不同，這裡不會先建立整本活頁簿的單元格列表，
+    呼叫端應搭配 iter_batches() 分批寫入資料庫，讓記憶體用量維持固定。
+
+    Args:
+        file_path: 檔案路徑
+        engine: .xlsx / .xlsm 使用的讀取引擎（見 READER_ENGINES）
+        sheets: 只讀取這些工作表（None 表示全部）
+        expand_merged: 將合併儲存格錨點（左上角）的值複製到被覆蓋的位置
+        mark_merged: 在合併範圍內的單元格加上 is_merged / merged_range
+
+    Returns:
+        Iterator[Dict]: 單元格資料生成器，每個元素包含：
+            - sheet_name: 工作表名稱
+            - row: 行號
+            - col: 列號
+            - location: 單元格位置（如 "A5"）
+            - value: 單元格值（字串）
+            - value_type: 原始類型（見 VALUE_TYPES）
+            - value_num: 數值、日期或時間的數值表示（文字為 None）
+            - is_merged / merged_range: 只有位於合併範圍內且開啟 mark_merged 時才有
+
+    Raises:
+        ValueError: 不支援的讀取引擎
+        Exception: 檔案無法開啟或讀取（在迭代時拋出）
+    """
+    if engine not in READER_ENGINES:
+        raise ValueError(f"不支援的讀取引擎: {engine}")
+
+    if sheets is not None:
+        sheets = set(sheets)
+
+    if os.path.splitext(file_path)[1].lower() == '.xls':
+        return _read_with_xlrd(file_path, sheets)
+    if engine == 'iterparse':
+        return _read_with_iterparse(file_path, sheets, expand_merged, mark_merged)
+    return _read_with_openpyxl(file_path, sheets, expand_merged, mark_merged)
+
+
+def to_epoch_seconds(value: datetime) -> float:
+    """
+    將日期時間轉成自 1970-01-01 起的秒數（日期的 value_num）
+
+    Excel 的日期沒有時區，這裡一律視為 UTC 計算，不受本機時區影響。
+    """
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return (value - _EPOCH).total_seconds()
+
+
+def iter_batches(iterable: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """
+    將任意可迭代物件切成固定大小的批次
+
+    Args:
+        iterable: 資料來源（例如 read_excel_file() 的生成器）
+        batch_size: 每批最多幾筆
+
+    Yields:
+        List: 一個批次（最後一批可能不足 batch_size）
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def file_fingerprint(file_path: str) -> Optional[str]:
+    """
+    計算檔案內容指紋
+
+    xlsx 只讀取 zip 中央目錄：以每個成員的名稱、CRC32、大小加上檔案總大小計算，
+    不需要解壓任何內容；.xls 等非 zip 檔案則對整個檔案計算 SHA-1。
+    同步工具只更新修改時間時，指紋不會改變。
+
+    Args:
+        file_path: 檔案路徑
+
+    Returns:
+        str: 40 字元的十六進位指紋；檔案無法讀取時回傳 None
+    """
+    digest = hashlib.sha1()
+    try:
+        digest.update(str(os.path.getsize(file_path)).encode())
+
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                for info in sorted(archive.infolist(), key=lambda i: i.filename):
+                    digest.update(f"{info.filename}\0{info.CRC:08x}\0{info.file_size}\0".encode())
+        except zipfile.BadZipFile:
+            with open(file_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+    except OSError as e:
+        logger.warning(f"無法計算內容指紋: {file_path}, 錯誤: {e}")
+        return None
+
+    return digest.hexdigest()
+
+
+def validate_workbook(file_path: str) -> Tuple[str, str]:
+    """
+    解析前的快速結構檢查（只讀檔頭與 zip 中央目錄，不解壓任何內容）
+
+    損壞的檔案交給 load_workbook 也會失敗，但要付出開檔與解析的成本；
+    先用這個檢查把它們擋下來。
+
+    Args:
+        file_path: 檔案路徑
+
+    Returns:
+        (狀態代碼, 說明)：狀態代碼在 VALID_STATUSES 中表示可以解析，
+        其餘為 ERROR_ACCESS / ERROR_EMPTY / ERROR_NOT_OLE / ERROR_NOT_ZIP /
+        ERROR_CORRUPT / ERROR_STRUCTURE / ERROR_UNKNOWN
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            header = f.read(8)
+    except OSError:
+        return 'ERROR_ACCESS', '無法存取檔案'
+
+    # 空檔案
+    if file_size == 0:
+        return 'ERROR_EMPTY', '空檔案 (0 bytes)'
+
+    # .xls 舊格式由 xlrd 讀取，只需確認是 OLE2 複合文件
+    if os.path.splitext(file_path)[1].lower() == '.xls':
+        if header != _OLE2_MAGIC:
+            return 'ERROR_NOT_OLE', '不是有效的 .xls 格式 (檔頭錯誤)'
+        return 'VALID_XLS', '.xls 結構正常 (應該可以索引)'
+
+    if header[:2] != b'PK':
+        return 'ERROR_NOT_ZIP', '不是 ZIP 格式 (檔頭錯誤)'
+
+    try:
+        # 開啟時會讀取並檢查中央目錄
+        with zipfile.ZipFile(file_path) as archive:
+            names = archive.NameToInfo
+            has_content_types = '[Content_Types].xml' in names
+            has_workbook = any(name.endswith('workbook.xml') for name in names)
+            if not has_content_types and not has_workbook:
+                return 'ERROR_STRUCTURE', 'ZIP 正常但缺少 Excel 結構'
+    except zipfile.BadZipFile:
+        return 'ERROR_CORRUPT', 'ZIP 結構損壞 (無法解壓)'
+    except Exception as e:
+        return 'ERROR_UNKNOWN', f'未知錯誤: {str(e)[:50]}'
+
+    return 'VALID_ZIP', 'ZIP 結構完整 (應該可以索引)'
+
+
+def read_sheet_parts(file_path: str) -> Optional[Dict[str, Tuple[int, int]]]:
+    """
+    讀取每個工作表部件的 CRC32（只讀 zip 中央目錄與活頁簿結構，不解壓工作表）
+
+    共用部件 CRC 由共用字串表、樣式表與日期系統組成：這些部件改變時，
+    所有工作表的輸出都可能改變，因此每個工作表都會被視為已變動。
+
+    Args:
+        file_path: 檔案路徑
+
+    Returns:
+        Dict: 工作表名稱 -> (工作表部件 CRC, 共用部件 CRC)；
+              非 xlsx 或無法讀取時回傳 None（呼叫端應整本重新索引）
+    """
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            workbook = _read_workbook_info(archive)
+            shared = [archive.getinfo(part).CRC if part else 0
+                      for part in (workbook['shared_strings'], workbook['styles'])]
+            shared_crc = zlib.crc32(f"{shared[0]:08x}:{shared[1]:08x}:{workbook['epoch']}".encode())
+            return {sheet_name: (archive.getinfo(part_name).CRC, shared_crc)
+                    for sheet_name, part_name in workbook['sheets']}
+    except Exception as e:
+        logger.debug(f"無法讀取工作表部件: {file_path}, 錯誤: {e}")
+        return None
+
+
+# ============================================================================
+# openpyxl 引擎
+# ============================================================================
+
+def _read_with_openpyxl(file_path: str, sheets: Optional[Set[str]] = None,
+                        expand_merged: bool = False,
+                        mark_merged: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    使用 openpyxl 唯讀模式讀取
+
+    唯讀模式的工作表不提供合併範圍，需要時另外從 zip 中讀取。
+    """
+    try:
+        # 打開檔案（唯讀模式）
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        archive = zipfile.ZipFile(file_path) if expand_merged or mark_merged else None
+    except Exception as e:
+        raise Exception(f"讀取檔案失敗: {e}")
+
+    try:
+        sheet_parts = dict(_read_workbook_info(archive)['sheets']) if archive else {}
+
+        # 遍歷所有工作表（一次只處理一個工作表）
+        for sheet_name in workbook.sheetnames:
+            if sheets is not None and sheet_name not in sheets:
+                continue
+            cells = _iter_openpyxl_sheet(workbook[sheet_name], sheet_name, file_path)
+            if sheet_name in sheet_parts:
+                merged_ranges = _read_merged_ranges(archive, sheet_parts[sheet_name])
+                cells = _apply_merged_cells(cells, merged_ranges, expand_merged, mark_merged)
+            yield from cells
+    except Exception as e:
+        raise Exception(f"讀取檔案失敗: {e}")
+    finally:
+        workbook.close()
+        if archive:
+            archive.close()
+
+
+def _iter_openpyxl_sheet(sheet, sheet_name: str, file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行輸出 openpyxl 唯讀工作表的非空單元格
+
+    iter_rows() 預設會把每一行補齊到 <dimension> 宣告的寬度，並為缺少的行產生空行；
+    格式套用到 XFD1048576 的工作表因此要走訪上百萬個空白單元格。
+    這裡先記下宣告的範圍，再 reset_dimensions() 讓 openpyxl 只回傳 XML 中實際存在的單元格，
+    超出宣告範圍的行則直接停止讀取。
+    """
+    max_row, max_col = _dimension_limit(sheet.min_column, sheet.min_row,
+                                        sheet.max_column, sheet.max_row)
+    sheet.reset_dimensions()
+
+    scanned = kept = 0
+    for row in sheet.iter_rows():
+        for cell in row:
+            # 行內補齊用的 EMPTY_CELL 沒有座標
+            if cell is EMPTY_CELL:
+                continue
+            scanned += 1
+            if max_row is not None:
+                if cell.row > max_row:
+                    _log_sheet_scan(file_path, sheet_name, scanned, kept)
+                    return
+                if cell.column > max_col:
+                    continue
+            if cell.value is None:
+                continue
+            kept += 1
+            yield {
+                'sheet_name': sheet_name,
+                'row': cell.row,
+                'col': cell.column,
+                'location': f"{cell.column_letter}{cell.row}",
+                **_typed_value(cell.value),
+            }
+
+    _log_sheet_scan(file_path, sheet_name, scanned, kept)
+
+
+def _dimension_limit(min_col, min_row, max_col, max_row) -> Tuple[Optional[int], Optional[int]]:
+    """
+    由 <dimension> 宣告的範圍取得行列上限
+
+    只有單格（如 "A1"）或缺少宣告時視為未知：部分程式產生的檔案一律寫 "A1"，
+    以它作為上限會漏掉資料。
+
+    Returns:
+        (最大行, 最大列)；未知時為 (None, None)
+    """
+    if not max_row or not max_col or (min_row == max_row and min_col == max_col):
+        return None, None
+    return max_row, max_col
+
+
+def _log_sheet_scan(file_path: str, sheet_name: str, scanned: int, kept: int):
+    """記錄工作表掃描的單元格數與保留的單元格數"""
+    ratio = kept / scanned if scanned else 1.0
+    message = (f"{os.path.basename(file_path)} [{sheet_name}]: "
+               f"掃描 {scanned:,} 個單元格，保留 {kept:,} 個 ({ratio:.1%})")
+    if scanned >= SPARSE_SHEET_MIN_SCANNED and ratio < SPARSE_SHEET_RATIO:
+        logger.warning(f"大量空白單元格 - {message}")
+    else:
+        logger.debug(message)
+
+
+# ============================================================================
+# iterparse 引擎
+# ============================================================================
+
+def _read_with_iterparse(file_path: str, sheets: Optional[Set[str]] = None,
+                         expand_merged: bool = False,
+                         mark_merged: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    直接解析 xlsx 內的 XML 讀取
+
+    只處理索引需要的（工作表, 行, 列, 值），數值、日期與布林值的轉換規則
+    與 openpyxl 的 data_only 模式相同，因此輸出的記錄與 openpyxl 引擎一致。
+    """
+    try:
+        archive = zipfile.ZipFile(file_path)
+    except Exception as e:
+        raise Exception(f"讀取檔案失敗: {e}")
+
+    try:
+        workbook = _read_workbook_info(archive)
+
+        shared_strings = []
+        if workbook['shared_strings']:
+            shared_strings = _read_shared_strings(archive, workbook['shared_strings'])
+
+        date_formats, timedelta_formats = set(), set()
+        if workbook['styles']:
+            date_formats, timedelta_formats = _read_date_styles(archive, workbook['styles'])
+
+        for sheet_name, part_name in workbook['sheets']:
+            if sheets is not None and sheet_name not in sheets:
+                continue
+            cells = _iter_sheet_cells(archive, part_name, sheet_name, shared_strings,
+                                      date_formats, timedelta_formats, workbook['epoch'])
+            if expand_merged or mark_merged:
+                merged_ranges = _read_merged_ranges(archive, part_name)
+                cells = _apply_merged_cells(cells, merged_ranges, expand_merged, mark_merged)
+            yield from cells
+    except Exception as e:
+        raise Exception(f"讀取檔案失敗: {e}")
+    finally:
+        archive.close()
+
+
+def _namespace(tag: str) -> str:
+    """取得 XML 標籤的命名空間前綴（如 "{http://...}"）"""
+    return tag[:tag.index('}') + 1] if tag.startswith('{') else ''
+
+
+def _rels_path(part_name: str) -> str:
+    """取得某個部件對應的 .rels 路徑"""
+    folder, name = posixpath.split(part_name)
+    return posixpath.join(folder, '_rels', f"{name}.rels")
+
+
+def _read_rels(archive: zipfile.ZipFile, part_name: str) -> Dict[str, Tuple[str, str]]:
+    """
+    讀取部件的關聯檔
+
+    Args:
+        archive: 已開啟的 xlsx
+        part_name: 部件路徑（"" 表示套件根目錄）
+
+    Returns:
+        Dict: rId -> (關聯類型, 目標部件的完整路徑)
+    """
+    rels_path = _rels_path(part_name)
+    if rels_path not in archive.NameToInfo:
+        return {}
+
+    root = ET.fromstring(archive.read(rels_path))
+    base = posixpath.dirname(part_name)
+    rels = {}
+    for rel in root.iter(f"{_PACKAGE_REL_NS}Relationship"):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = rel.get('Target', '')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(base, target))
+        rels[rel.get('Id')] = (rel.get('Type', ''), target)
+    return rels
+
+
+def _read_workbook_info(archive: zipfile.ZipFile) -> Dict[str, Any]:
+    """
+    讀取活頁簿結構
+
+    Returns:
+        Dict: 包含：
+            - sheets: [(工作表名稱, 工作表部件路徑)]，依活頁簿順序
+            - shared_strings: 共用字串表路徑（可能為 None）
+            - styles: 樣式表路徑（可能為 None）
+            - epoch: 日期基準（1900 或 1904 日期系統）
+    """
+    workbook_part = 'xl/workbook.xml'
+    for rel_type, target in _read_rels(archive, '').values():
+        if rel_type.endswith(_REL_OFFICE_DOCUMENT):
+            workbook_part = target
+            break
+
+    rels = _read_rels(archive, workbook_part)
+    root = ET.fromstring(archive.read(workbook_part))
+    ns = _namespace(root.tag)
+
+    epoch = CALENDAR_WINDOWS_1900
+    workbook_pr = root.find(f"{ns}workbookPr")
+    if workbook_pr is not None and workbook_pr.get('date1904') in ('1', 'true'):
+        epoch = CALENDAR_MAC_1904
+
+    sheets = []
+    for sheet in root.iter(f"{ns}sheet"):
+        # r:id 屬性的命名空間在 Transitional / Strict 格式中不同
+        rel_id = next((v for k, v in sheet.attrib.items() if k.endswith('}id')), None)
+        rel_type, target = rels.get(rel_id, ('', ''))
+        # 圖表工作表等沒有單元格，略過
+        if rel_type.endswith(_REL_WORKSHEET) and target in archive.NameToInfo:
+            sheets.append((sheet.get('name'), target))
+
+    info = {'sheets': sheets, 'shared_strings': None, 'styles': None, 'epoch': epoch}
+    for rel_type, target in rels.values():
+        if target not in archive.NameToInfo:
+            continue
+        if rel_type.endswith(_REL_SHARED_STRINGS):
+            info['shared_strings'] = target
+        elif rel_type.endswith(_REL_STYLES):
+            info['styles'] = target
+    return info
+
+
+def _read_shared_strings(archive: zipfile.ZipFile, part_name: str) -> List[str]:
+    """
+    串流讀取共用字串表
+
+    與 openpyxl 相同：只取 <t> 與 <r><t> 的文字，忽略注音 <rPh>。
+    """
+    strings = []
+    with archive.open(part_name) as source:
+        ns = None
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if ns is None:
+                ns = _namespace(elem.tag)
+                si_tag, t_tag, r_tag = f"{ns}si", f"{ns}t", f"{ns}r"
+            if event != 'end' or elem.tag != si_tag:
+                continue
+
+            strings.append(_text_content(elem, t_tag, r_tag).replace('x005F_', ''))
+            elem.clear()
+    return strings
+
+
+def _text_content(elem, t_tag: str, r_tag: str) -> str:
+    """取得 <si> / <is> 元素的純文字（<t> 與各段 <r><t>）"""
+    parts = []
+    for child in elem:
+        if child.tag == t_tag:
+            parts.append(child.text or '')
+        elif child.tag == r_tag:
+            text = child.findtext(t_tag)
+            if text is not None:
+                parts.append(text)
+    return ''.join(parts)
+
+
+def _read_date_styles(archive: zipfile.ZipFile, part_name: str) -> Tuple[Set[int], Set[int]]:
+    """
+    找出哪些樣式索引代表日期 / 時間間隔格式
+
+    Returns:
+        (日期格式的樣式索引集合, 時間間隔格式的樣式索引集合)
+    """
+    root = ET.fromstring(archive.read(part_name))
+    ns = _namespace(root.tag)
+
+    custom_formats = {}
+    num_fmts = root.find(f"{ns}numFmts")
+    if num_fmts is not None:
+        for fmt in num_fmts.iter(f"{ns}numFmt"):
+            custom_formats[int(fmt.get('numFmtId'))] = fmt.get('formatCode')
+
+    date_formats, timedelta_formats = set(), set()
+    cell_xfs = root.find(f"{ns}cellXfs")
+    if cell_xfs is None:
+        return date_formats, timedelta_formats
+
+    for idx, xf in enumerate(cell_xfs.iter(f"{ns}xf")):
+        fmt_id = int(xf.get('numFmtId', 0))
+        fmt = custom_formats.get(fmt_id) or builtin_format_code(fmt_id)
+        if is_date_format(fmt):
+            date_formats.add(idx)
+        if is_timedelta_format(fmt):
+            timedelta_formats.add(idx)
+    return date_formats, timedelta_formats
+
+
+def _iter_sheet_cells(archive: zipfile.ZipFile, part_name: str, sheet_name: str,
+                      shared_strings: List[str], date_formats: Set[int],
+                      timedelta_formats: Set[int], epoch) -> Iterator[Dict[str, Any]]:
+    """
+    串流解析單個工作表 XML
+
+    每處理完一個 <row> 就清空 <sheetData>，記憶體只保留目前這一行。
+    只有格式、沒有值的單元格在解析座標之前就略過；
+    超出 <dimension> 宣告範圍的行不再解析（規則與 openpyxl 引擎相同）。
+    """
+    max_row = max_col = None
+    scanned = kept = 0
+
+    with archive.open(part_name) as source:
+        ns = None
+        sheet_data = None
+        row_num = 0
+
+        for event, elem in ET.iterparse(source, events=('start', 'end')):
+            if ns is None:
+                ns = _namespace(elem.tag)
+                sheet_data_tag, row_tag, cell_tag = f"{ns}sheetData", f"{ns}row", f"{ns}c"
+                value_tag, inline_tag, t_tag, r_tag = f"{ns}v", f"{ns}is", f"{ns}t", f"{ns}r"
+                dimension_tag = f"{ns}dimension"
+
+            if event == 'start':
+                if elem.tag == sheet_data_tag:
+                    sheet_data = elem
+                elif elem.tag == dimension_tag and elem.get('ref'):
+                    try:
+                        max_row, max_col = _dimension_limit(*range_boundaries(elem.get('ref')))
+                    except ValueError:
+                        pass
+                continue
+
+            if elem.tag != row_tag:
+                continue
+
+            row_attr = elem.get('r')
+            row_num = int(row_attr) if row_attr else row_num + 1
+            if max_row is not None and row_num > max_row:
+                break
+            col_num = 0
+            scanned += len(elem)
+
+            for cell in elem:
+                if cell.tag != cell_tag:
+                    continue
+
+                # 沒有子元素（<v> / <is>）的單元格只有格式
+                if not len(cell):
+                    if not cell.get('r'):
+                        col_num += 1
+                    continue
+
+                location = cell.get('r')
+                if location:
+                    row, col_num = coordinate_to_tuple(location)
+                else:
+                    row = row_num
+                    col_num += 1
+                    location = f"{get_column_letter(col_num)}{row}"
+                if max_col is not None and col_num > max_col:
+                    continue
+
+                data_type = cell.get('t', 'n')
+                if data_type == 'inlineStr':
+                    inline = cell.find(inline_tag)
+                    if inline is None:
+                        continue
+                    value = _text_content(inline, t_tag, r_tag)
+                    kept += 1
+                    yield {
+                        'sheet_name': sheet_name,
+                        'row': row,
+                        'col': col_num,
+                        'location': location,
+                        **_typed_value(value),
+                    }
+                    continue
+
+                value = cell.findtext(value_tag) or None
+                if value is None:
+                    continue
+
+                if data_type == 'n':
+                    value = _cast_number(value)
+                    style_id = int(cell.get('s', 0))
+                    if style_id in date_formats:
+                        try:
+                            value = from_excel(value, epoch,
+                                               timedelta=style_id in timedelta_formats)
+                        except (OverflowError, ValueError):
+                            value = '#VALUE!'
+                elif data_type == 's':
+                    value = shared_strings[int(value)]
+                elif data_type == 'b':
+                    value = bool(int(value))
+                elif data_type == 'd':
+                    value = from_ISO8601(value)
+
+                kept += 1
+                yield {
+                    'sheet_name': sheet_name,
+                    'row': row,
+                    'col': col_num,
+                    'location': location,
+                    **_typed_value(value),
+                }
+
+            # 已處理完的行不再需要
+            if sheet_data is not None:
+                sheet_data.clear()
+            else:
+                elem.clear()
+
+    _log_sheet_scan(archive.filename or '', sheet_name, scanned, kept)
+
+
+def _typed_value(value: Any) -> Dict[str, Any]:
+    """
+    將單元格的值轉成字串，同時保留原始類型與可做範圍查詢的數值
+
+    Returns:
+        Dict: value（字串）、value_type（見 VALUE_TYPES）、value_num（數值或 None）
+    """
+    if isinstance(value, bool):
+        return {'value': str(value), 'value_type': 'bool', 'value_num': float(value)}
+    if isinstance(value, (int, float)):
+        return {'value': str(value), 'value_type': 'number', 'value_num': float(value)}
+    if isinstance(value, datetime):
+        return {'value': str(value), 'value_type': 'date', 'value_num': to_epoch_seconds(value)}
+    if isinstance(value, date):
+        return {'value': str(value), 'value_type': 'date',
+                'value_num': to_epoch_seconds(datetime.combine(value, time()))}
+    if isinstance(value, time):
+        seconds = value.hour * 3600 + value.minute * 60 + value.second + value.microsecond / 1e6
+        return {'value': str(value), 'value_type': 'time', 'value_num': seconds}
+    if isinstance(value, timedelta):
+        return {'value': str(value), 'value_type': 'time', 'value_num': value.total_seconds()}
+    return {'value': str(value), 'value_type': 'text', 'value_num': None}
+
+
+def _cast_number(value: str):
+    """將 XML 中的數值字串轉成 int 或 float（與 openpyxl 規則一致）"""
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+# ============================================================================
+# 合併儲存格
+# ============================================================================
+
+def _read_merged_ranges(archive: zipfile.ZipFile,
+                        part_name: str) -> List[Tuple[int, int, int, int, str]]:
+    """
+    讀取工作表的合併範圍
+
+    <mergeCells> 位於 <sheetData> 之後，為了在串流輸出單元格之前就取得合併範圍，
+    這裡以位元組搜尋掃過解壓後的工作表，只擷取 ref 屬性，不解析 XML。
+
+    Returns:
+        List: [(起始列, 起始行, 結束列, 結束行, 範圍字串)]
+    """
+    refs = []
+    with archive.open(part_name) as source:
+        tail = b''
+        found = False
+        for chunk in iter(lambda: source.read(1024 * 1024), b''):
+            data = tail + chunk
+            if not found:
+                start = data.find(b'mergeCells')
+                if start < 0:
+                    tail = data[-16:]
+                    continue
+                found = True
+                data = data[start:]
+
+            end = 0
+            for match in _MERGE_CELL_RE.finditer(data):
+                refs.append(match.group(1).decode('ascii', 'replace'))
+                end = match.end()
+            # 保留最後一段，避免標籤剛好被切在兩個區塊之間
+            tail = data[max(end, len(data) - 512):]
+
+    ranges = []
+    for ref in refs:
+        if ':' not in ref:
+            continue
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(ref)
+        except ValueError:
+            logger.debug(f"略過無效的合併範圍: {ref}")
+            continue
+        ranges.append((min_col, min_row, max_col, max_row, ref))
+    return ranges
+
+
+def _apply_merged_cells(cells: Iterator[Dict[str, Any]],
+                        merged_ranges: List[Tuple[int, int, int, int, str]],
+                        expand: bool, mark: bool) -> Iterator[Dict[str, Any]]:
+    """
+    依合併範圍展開或標記單個工作表的單元格（單次掃描）
+
+    單元格必須依行的順序輸出（各引擎皆是如此）。合併範圍依起始行排序，
+    隨行號推進只維護「涵蓋目前這一行」的範圍，並以起始列建立區間表，
+    每個單元格用二分搜尋即可判斷是否位於合併範圍內。
+    錨點（左上角）的值與類型記下後，每行結束時才補上該行被覆蓋的位置，
+    因此補上的單元格排在該行實際單元格之後。
+
+    Args:
+        cells: 單個工作表的單元格生成器
+        merged_ranges: _read_merged_ranges() 的結果
+        expand: 將錨點的值複製到被覆蓋的位置（取代這些位置原有的值）
+        mark: 在合併範圍內的單元格加上 is_merged / merged_range
+    """
+    if not merged_ranges or not (expand or mark):
+        yield from cells
+        return
+
+    pending = sorted(merged_ranges, key=lambda r: r[1])
+    state = {'next': 0, 'active': [], 'starts': []}
+    anchors = {}  # 範圍字串 -> 錨點的值
+
+    def advance(row):
+        """更新涵蓋 row 的範圍與區間表（row 只會遞增）"""
+        active = [r for r in state['active'] if r[3] >= row]
+        while state['next'] < len(pending) and pending[state['next']][1] <= row:
+            merged = pending[state['next']]
+            if merged[3] >= row:
+                active.append(merged)
+            state['next'] += 1
+        # 合併範圍不會重疊，依起始列排序後即可二分搜尋
+        active.sort()
+        state['active'] = active
+        state['starts'] = [r[0] for r in active]
+
+    def fill_rows(row, stop):
+        """補上 row 到 stop - 1 各行中被覆蓋的位置"""
+        while row < stop:
+            advance(row)
+            live = [r for r in state['active'] if r[4] in anchors]
+            if not live:
+                return
+            for min_col, min_row, max_col, max_row, ref in live:
+                for col in range(min_col, max_col + 1):
+                    if row == min_row and col == min_col:
+                        continue
+                    cell = {
+                        'sheet_name': sheet_name,
+                        'row': row,
+                        'col': col,
+                        'location': f"{get_column_letter(col)}{row}",
+                        **anchors[ref],
+                    }
+                    if mark:
+                        cell['is_merged'] = True
+                        cell['merged_range'] = ref
+                    yield cell
+            row += 1
+
+    row = None
+    sheet_name = None
+    for cell in cells:
+        if cell['row'] != row:
+            if row is not None and expand:
+                yield from fill_rows(row, cell['row'])
+            row = cell['row']
+            sheet_name = cell['sheet_name']
+            advance(row)
+
+        col = cell['col']
+        index = bisect_right(state['starts'], col) - 1
+        merged = state['active'][index] if index >= 0 else None
+        if merged and col <= merged[2]:
+            min_col, min_row, max_col, max_row, ref = merged
+            if row == min_row and col == min_col:
+                if expand and (max_col - min_col + 1) * (max_row - min_row + 1) <= MAX_MERGED_EXPANSION:
+                    anchors[ref] = {key: cell[key] for key in ('value', 'value_type', 'value_num')}
+            elif expand and ref in anchors:
+                # 被覆蓋的位置以錨點的值為準
+                continue
+            if mark:
+                cell['is_merged'] = True
+                cell['merged_range'] = ref
+        yield cell
+
+    if row is not None and expand:
+        yield from fill_rows(row, float('inf'))
+
+
+# ============================================================================
+# xlrd 引擎（.xls 舊格式）
+# ============================================================================
+
+def _read_with_xlrd(file_path: str, sheets: Optional[Set[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    使用 xlrd 讀取 .xls 舊格式
+
+    以 on_demand=True 開啟，工作表在用到時才載入，讀完立即卸載，
+    因此同一時間只有一個工作表的資料在記憶體中。
+    數值、日期與布林值的字串表示與 xlsx 引擎一致（整數不帶 .0、日期轉成 datetime）。
+    """
+    try:
+        workbook = xlrd.open_workbook(file_path, on_demand=True)
+    except Exception as e:
+        raise Exception(f"讀取檔案失敗: {e}")
+
+    epoch = CALENDAR_MAC_1904 if workbook.datemode else CALENDAR_WINDOWS_1900
+
+    try:
+        for sheet_index, sheet_name in enumerate(workbook.sheet_names()):
+            if sheets is not None and sheet_name not in sheets:
+                continue
+            sheet = workbook.sheet_by_index(sheet_index)
+            try:
+                for row_idx in range(sheet.nrows):
+                    cell_types = sheet.row_types(row_idx)
+                    cell_values = sheet.row_values(row_idx)
+
+                    for col_idx, (cell_type, value) in enumerate(zip(cell_types, cell_values)):
+                        if cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                            continue
+
+                        if cell_type == xlrd.XL_CELL_NUMBER:
+                            value = int(value) if value.is_integer() else value
+                        elif cell_type == xlrd.XL_CELL_DATE:
+                            try:
+                                value = from_excel(value, epoch)
+                            except (OverflowError, ValueError):
+                                value = '#VALUE!'
+                        elif cell_type == xlrd.XL_CELL_BOOLEAN:
+                            value = bool(value)
+                        elif cell_type == xlrd.XL_CELL_ERROR:
+                            value = xlrd.error_text_from_code.get(value, '#VALUE!')
+
+                        yield {
+                            'sheet_name': sheet.name,
+                            'row': row_idx + 1,
+                            'col': col_idx + 1,
+                            'location': f"{get_column_letter(col_idx + 1)}{row_idx + 1}",
+                            **_typed_value(value),
+                        }
+            finally:
+                workbook.unload_sheet(sheet_index)
+    except Exception as e:
+        raise Exception(f"讀取檔案失敗: {e}")
+    finally:
+        workbook.release_resources()
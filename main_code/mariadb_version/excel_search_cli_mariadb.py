@@ -6,20 +6,35 @@ import os
 import sys
 import click
 import time
+import signal
 from datetime import datetime
+from contextlib import nullcontext
 from pathlib import Path
-from openpyxl import load_workbook
 from tqdm import tqdm
 
 from database_mariadb import DatabaseManager
-from file_scanner import FileScanner
-from config_mariadb import DB_CONFIG, BATCH_SIZE
+from file_scanner import FileScanner, DirectorySnapshot
+from indexer import (ParallelIndexer, plan_index, record_failure, schedule_files, pipeline_batches,
+                     SCHEDULE_POLICIES)
+from excel_reader import READER_ENGINES, to_epoch_seconds
+from watcher import DirectoryWatcher, WatchError
+from config_mariadb import (DB_CONFIG, BATCH_SIZE, MAX_WORKERS, READER_ENGINE,
+                            EXPAND_MERGED_CELLS, MARK_MERGED_CELLS,
+                            FILE_TIMEOUT_SECONDS, MAX_WORKER_RSS_MB, SCHEDULE_POLICY,
+                            WATCH_DEBOUNCE_SECONDS, WATCH_MAX_PENDING, WATCH_MAX_CONCURRENT,
+                            WATCH_RESCAN_MINUTES, PIPELINE_QUEUE_SIZE, PIPELINE_MAX_BATCH,
+                            IGNORE_PATTERNS, IGNORE_FILE_NAME)
 
 
 # ============================================================================
 # 輔助函數
 # ============================================================================
 
+def get_scanner():
+    """建立套用 MariaDB 設定（IGNORE_PATTERNS / IGNORE_FILE_NAME）的檔案掃描器"""
+    return FileScanner(ignore_patterns=IGNORE_PATTERNS, ignore_file_name=IGNORE_FILE_NAME)
+
+
 def format_size(bytes_size):
     """格式化檔案大小"""
     for unit in ['B', 'KB', 'MB', 'GB']:
@@ -57,40 +72,436 @@ def print_warning(text):
     click.secho(f"⚠️  {text}", fg='yellow')
 
 
-def read_excel_file(file_path):
+def cell_row(file_id, cell):
+    """將讀取到的單元格轉成 add_cells_batch 的 tuple（欄位順序見 CELL_COLUMNS）"""
+    return (
+        file_id,
+        cell['sheet_name'],
+        cell['row'],
+        cell['col'],
+        cell['location'],
+        cell['value'],
+        cell['value'].lower(),  # value_lower
+        cell.get('is_merged', False),
+        cell.get('merged_range'),
+        cell.get('value_type'),
+        cell.get('value_num')
+    )
+
+
+def index_files(db, files_to_index, workers=1, engine=READER_ENGINE, run_id=None):
     """
-    讀取單個 Excel 檔案
+    解析並寫入一組檔案
+
+    解析可在多個 worker 進程中進行，但所有寫入都由目前的資料庫連接完成。
+
+    Args:
+        db: DatabaseManager 實例
+        files_to_index: 檔案資訊列表
+        workers: 解析用的 worker 進程數
+        engine: Excel 讀取引擎
+        run_id: 索引執行 ID（記錄每個檔案的進度，供 --resume 使用）
 
     Returns:
-        list: 單元格資料列表
+        dict: 統計結果（success / failed / cells / partial），以及 worker 使用率
+            utilization / parse_seconds / wall_seconds / workers
     """
-    cells_data = []
+    result = {'success': 0, 'failed': 0, 'cells': 0, 'partial': 0}
+    indexer = ParallelIndexer(workers=workers, batch_size=BATCH_SIZE,
+                              reader_options={'engine': engine,
+                                              'expand_merged': EXPAND_MERGED_CELLS,
+                                              'mark_merged': MARK_MERGED_CELLS},
+                              timeout=FILE_TIMEOUT_SECONDS, max_rss_mb=MAX_WORKER_RSS_MB)
+
+    # 正在寫入中的檔案: file_path -> file_id（平行模式下可能同時有多個）
+    # 寫入失敗的檔案對應 None，其後續事件都會被忽略
+    open_files = {}
+
+    # 只重新索引部分工作表的檔案: file_path -> 開始時的 last_cell_id()
+    # 新單元格先寫入，解析完成才刪除變動工作表的舊內容並更新修改時間與指紋；
+    # 失敗時只清除新寫入的單元格，其他工作表與檔案記錄保持不變
+    staged = {}
+
+    with tqdm(total=len(files_to_index), desc="索引檔案", unit="file") as pbar:
+        for event, file_info, data in indexer.run(files_to_index):
+            file_path = file_info['file_path']
+            file_name = file_info['file_name']
+
+            if event in ('done', 'error'):
+                pbar.update(1)
+                if file_path in open_files and open_files[file_path] is None:
+                    del open_files[file_path]
+                    continue
+            elif event == 'cells' and open_files.get(file_path) is None:
+                continue
+
+            try:
+                if event == 'start':
+                    open_files[file_path] = None
+                    if run_id:
+                        db.set_run_file_state(run_id, file_path, 'in_progress')
+                    pbar.set_description(f"處理: {file_name[:30]}")
 
-    try:
-        # 打開檔案（唯讀模式）
-        workbook = load_workbook(file_path, read_only=True, data_only=True)
+                    if file_info.get('sheets') is not None:
+                        # 只有部分工作表變動：保留檔案記錄，變動工作表的舊內容等解析完成才刪除
+                        watermark = db.last_cell_id()
+                        if watermark is None:
+                            raise Exception("獲取最大單元格 ID 失敗")
+                        staged[file_path] = watermark
+                        open_files[file_path] = file_info['file_id']
+                        continue
+
+                    # 刪除舊資料（連同相關 cells 與工作表部件）
+                    db.delete_file(file_path)
+
+                    # 新增檔案記錄（串流寫入需要先取得 file_id）
+                    file_id = db.add_file(
+                        file_path=file_path,
+                        file_name=file_name,
+                        last_modified=file_info['last_modified'],  # 已經是 datetime 物件
+                        file_size=file_info['file_size'],
+                        content_hash=file_info.get('content_hash')
+                    )
+                    if not file_id:
+                        raise Exception("新增檔案記錄失敗")
+                    open_files[file_path] = file_id
+
+                elif event == 'cells':
+                    file_id = open_files[file_path]
+                    if file_id in db.bulk_failed_ids:
+                        raise Exception("LOAD DATA 載入單元格失敗，檔案已移除")
+                    db.add_cells_batch([cell_row(file_id, cell) for cell in data])
+
+                elif event == 'done':
+                    file_id = open_files[file_path]
+
+                    if file_path in staged:
+                        deleted = db.delete_sheet_content(file_id, file_info['stale_sheets'],
+                                                          up_to_cell_id=staged[file_path])
+                        if deleted is None:
+                            raise Exception("刪除工作表內容失敗")
+                        file_info['base_cell_count'] -= deleted
+                        db.update_file_metadata(file_id, file_info['last_modified'],
+                                                file_info['file_size'], file_info.get('content_hash'))
+                    cell_count = data + file_info.get('base_cell_count', 0)
+
+                    if cell_count == 0:
+                        db.delete_file(file_path)
+                        open_files.pop(file_path)
+                        staged.pop(file_path, None)
+                        if run_id:
+                            db.set_run_file_state(run_id, file_path, 'done')
+                        pbar.write(f"⚠️  檔案無內容: {file_name}")
+                        continue
+
+                    # 更新檔案的單元格數量與工作表部件 CRC
+                    # 只有完整解析的耗時才記錄下來，作為下次排程的依據
+                    full_parse = file_info.get('sheets') is None
+                    db.update_file_cell_count(file_id, cell_count,
+                                              file_info.get('parse_seconds') if full_parse else None)
+                    # 更新前會先載入暫存的單元格；載入失敗時檔案已被刪除
+                    if file_id in db.bulk_failed_ids:
+                        raise Exception("LOAD DATA 載入單元格失敗，檔案已移除")
+                    if file_info.get('sheet_parts'):
+                        db.save_sheet_parts(file_id, file_info['sheet_parts'])
+                    result['cells'] += data
+                    result['success'] += 1
+                    if file_info.get('sheets') is not None:
+                        result['partial'] += 1
+                    db.clear_failed_file(file_path)
+                    if run_id:
+                        db.set_run_file_state(run_id, file_path, 'done')
+                    open_files.pop(file_path)
+                    staged.pop(file_path, None)
+
+                elif event == 'error':
+                    # 解析失敗（或超時、超量被終止）：記錄下來，檔案未變動前不再重試
+                    record_failure(db, file_info, file_info.get('error_status', 'ERROR_PARSE'), data)
+                    raise Exception(data)
+
+            except Exception as e:
+                result['failed'] += 1
+                pbar.write(f"❌ 索引失敗: {file_name}")
+                pbar.write(f"   錯誤: {str(e)}")
+
+                # 清除寫到一半的資料：部分重新索引只捨棄新寫入的單元格，其餘整個檔案刪除
+                watermark = staged.pop(file_path, None)
+                if open_files.get(file_path) and watermark is not None:
+                    db.discard_new_cells(open_files[file_path], watermark)
+                elif open_files.get(file_path):
+                    db.delete_file(file_path)
+                if run_id:
+                    db.set_run_file_state(run_id, file_path, 'failed')
+                if event in ('done', 'error'):
+                    open_files.pop(file_path, None)
+                else:
+                    open_files[file_path] = None
+
+    result['utilization'] = indexer.utilization
+    result['parse_seconds'] = indexer.stats['busy_seconds']
+    result['wall_seconds'] = indexer.stats['wall_seconds']
+    result['workers'] = indexer.stats['workers']
+    return result
+
+
+def link_file(db, file_info, owner_id):
+    """
+    將內容相同的檔案連結到已索引的檔案，共用其單元格
+
+    Returns:
+        bool: 是否成功
+    """
+    db.delete_file(file_info['file_path'])
+    file_id = db.add_file(
+        file_path=file_info['file_path'],
+        file_name=file_info['file_name'],
+        last_modified=file_info['last_modified'],
+        file_size=file_info['file_size'],
+        content_hash=file_info.get('content_hash')
+    )
+    if not file_id or not db.link_file_content(file_id, owner_id):
+        return False
+    db.clear_failed_file(file_info['file_path'])
+    return True
+
+
+def index_planned(db, plan, workers=1, engine=READER_ENGINE, run_id=None, schedule=SCHEDULE_POLICY):
+    """
+    依 plan_index() 的結果寫入資料庫
+
+    Returns:
+        dict: 統計結果（success / failed / cells / linked / unchanged / invalid）
+    """
+    # 結構檢查未通過：不解析，移除舊內容並記錄失敗
+    for file_info, status, message in plan['invalid']:
+        db.delete_file(file_info['file_path'])
+        record_failure(db, file_info, status, message)
+        print_error(f"跳過損壞檔案: {file_info['file_name']} ({message})")
+
+    # 內容未變，只更新修改時間
+    for file_info, existing in plan['unchanged']:
+        db.update_file_metadata(existing['file_id'], file_info['last_modified'],
+                                file_info['file_size'])
+
+    parse_queue = schedule_files(plan['parse'], schedule)
+    result = index_files(db, parse_queue, workers=workers, engine=engine, run_id=run_id)
+    result['linked'] = 0
+    result['unchanged'] = len(plan['unchanged'])
+    result['invalid'] = len(plan['invalid'])
+    result['failed'] += result['invalid']
+
+    # 與已索引檔案內容相同的檔案：直接共用單元格
+    links = list(plan['link'])
+    for file_info in plan['deferred']:
+        owner = db.find_content_owner(file_info['content_hash'],
+                                      exclude_path=file_info['file_path'])
+        if owner:
+            links.append((file_info, owner['file_id']))
+        else:
+            # 第一份副本解析失敗或無內容，改為自行解析
+            retry = index_files(db, [file_info], workers=1, engine=engine, run_id=run_id)
+            for key in ('success', 'failed', 'cells', 'partial'):
+                result[key] += retry[key]
+
+    for file_info, owner_id in links:
+        if link_file(db, file_info, owner_id):
+            result['linked'] += 1
+            result['success'] += 1
+        else:
+            result['failed'] += 1
+            print_error(f"連結失敗: {file_info['file_name']}")
+
+    return result
+
+
+def index_pipelined(db, file_stream, run_id=None, workers=1, engine=READER_ENGINE,
+                    schedule=SCHEDULE_POLICY, incremental=True, retry_failed=False,
+                    existing_files=None, failed_files=None):
+    """
+    邊掃描邊索引：掃描到的檔案經有界佇列分批交給 plan_index / index_planned
+
+    排程（schedule）與同內容檔案的合併只在同一批之內進行；不同批之間的相同內容
+    由 find_content_owner 找到先前已寫入的檔案，同樣只解析一次。
+
+    Args:
+        db: DatabaseManager 實例
+        file_stream: 檔案資訊的來源（FileScanner.iter_directory）
+        run_id: 索引執行 ID（每一批的檔案先加入執行記錄）
+        workers: 解析用的 worker 進程數
+        engine: Excel 讀取引擎
+        schedule: 解析排程策略
+        incremental: 是否為增量索引
+        retry_failed: 重新嘗試之前失敗且未變動的檔案
+        existing_files: 預先讀出的檔案記錄（見 plan_index）
+        failed_files: 預先讀出的失敗記錄（見 plan_index）
+
+    Returns:
+        (掃描到的檔案列表, plan 計數, index_planned 的統計結果加總)；
+        統計結果另加 first_batch_seconds（開始到第一批交給解析的秒數）
+    """
+    started = time.monotonic()
+    files = []
+    plan_totals = {key: 0 for key in ('new', 'updated', 'skipped', 'partial', 'quarantined')}
+    totals = {}
+    first_batch = None
+
+    for batch in pipeline_batches(file_stream, max_batch=PIPELINE_MAX_BATCH,
+                                  queue_size=PIPELINE_QUEUE_SIZE):
+        if first_batch is None:
+            first_batch = time.monotonic() - started
+        files.extend(batch)
+        if run_id:
+            db.add_run_files(run_id, [f['file_path'] for f in batch])
+
+        plan = plan_index(db, batch, incremental=incremental, retry_failed=retry_failed,
+                          existing_files=existing_files, failed_files=failed_files)
+        for key in plan_totals:
+            plan_totals[key] += plan[key]
+        result = index_planned(db, plan, workers=workers, engine=engine, run_id=run_id,
+                               schedule=schedule)
+        for key, value in result.items():
+            if key == 'workers':
+                totals[key] = max(totals.get(key, 0), value)
+            elif key != 'utilization':
+                totals[key] = totals.get(key, 0) + value
+
+    if not totals:
+        totals = {'success': 0, 'failed': 0, 'cells': 0, 'partial': 0, 'linked': 0,
+                  'unchanged': 0, 'invalid': 0, 'parse_seconds': 0.0, 'wall_seconds': 0.0,
+                  'workers': workers}
+    capacity = totals['wall_seconds'] * totals['workers']
+    totals['utilization'] = min(1.0, totals['parse_seconds'] / capacity) if capacity else 0.0
+    totals['first_batch_seconds'] = first_batch or 0.0
+    return files, plan_totals, totals
+
+
+def recover_interrupted_runs(db):
+    """
+    回滾上次中斷時寫到一半的檔案，並把未結束的索引執行標記為 interrupted
+
+    假設同一個資料庫同時只有一個 index 在執行。
+
+    Returns:
+        int: 回滾的檔案數
+    """
+    rolled_back = 0
+    for run in db.get_index_runs('running'):
+        for file_path in db.get_run_files(run['run_id'], ('in_progress',)):
+            db.delete_file(file_path)
+            db.set_run_file_state(run['run_id'], file_path, 'pending')
+            rolled_back += 1
+        db.set_index_run_status(run['run_id'], 'interrupted')
+    return rolled_back
+
+
+def find_resumable_run(db, root_path):
+    """找出同一路徑最近一次中斷的索引執行"""
+    for run in db.get_index_runs('interrupted'):
+        if run['root_path'] == root_path:
+            return run
+    return None
+
+
+def reindex_paths(db, paths, workers=1, engine=READER_ENGINE, removed_dirs=(),
+                  incremental=True, retry_failed=False):
+    """
+    只處理指定的檔案：仍存在的檔案依增量規則重新索引，已不存在的檔案從資料庫移除
+
+    Args:
+        db: DatabaseManager 實例
+        paths: 檔案路徑列表
+        workers: 解析用的 worker 進程數
+        engine: Excel 讀取引擎
+        removed_dirs: 已刪除或移出的目錄，其下已不存在的檔案都會從資料庫移除
+        incremental: False 時不比對修改時間與內容，全部重新解析
+        retry_failed: 重新嘗試之前失敗且未變動的檔案
+
+    Returns:
+        dict: index_planned 的統計結果，另加 deleted（移除的檔案數）
+    """
+    scanner = get_scanner()
+    files = []
+    missing = set()
+    for file_path in paths:
+        info = scanner.get_file_info(file_path) if os.path.isfile(file_path) else None
+        if info:
+            files.append(info)
+        else:
+            missing.add(file_path)
+    for dir_path in removed_dirs:
+        missing.update(db_file['file_path']
+                       for db_file in db.get_files_under_path(os.path.join(dir_path, ''))
+                       if not os.path.exists(db_file['file_path']))
 
-        # 遍歷所有工作表
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
+    deleted = sum(1 for file_path in sorted(missing) if db.delete_file(file_path))
 
-            # 遍歷所有單元格
-            for row_idx, row in enumerate(sheet.iter_rows(), start=1):
-                for col_idx, cell in enumerate(row, start=1):
-                    if cell.value is not None:
-                        cells_data.append({
-                            'sheet_name': sheet_name,
-                            'row': row_idx,
-                            'col': col_idx,
-                            'location': f"{cell.column_letter}{cell.row}",
-                            'value': str(cell.value),
-                        })
+    plan = plan_index(db, files, incremental=incremental, retry_failed=retry_failed)
+    result = index_planned(db, plan, workers=workers, engine=engine)
+    result['deleted'] = deleted
+    return result
 
-        workbook.close()
-        return cells_data
 
-    except Exception as e:
-        raise Exception(f"讀取檔案失敗: {e}")
+def watch_index(db, root_path, workers=1, engine=READER_ENGINE):
+    """
+    監看目錄樹，檔案變動後自動重新索引，直到按下 Ctrl+C
+
+    變動以 inotify 偵測；事件溢位時，以及每 WATCH_RESCAN_MINUTES 分鐘
+    （網路磁碟上其他電腦的修改沒有事件）會以目錄快照重新掃描整個目錄。
+
+    Args:
+        db: DatabaseManager 實例
+        root_path: 監看的根目錄（絕對路徑）
+        workers: 解析用的 worker 進程數（不超過 WATCH_MAX_CONCURRENT）
+        engine: Excel 讀取引擎
+    """
+    workers = max(1, min(workers, WATCH_MAX_CONCURRENT))
+    rescan_seconds = WATCH_RESCAN_MINUTES * 60
+    scanner = get_scanner()
+
+    try:
+        watcher = DirectoryWatcher([root_path], scanner, debounce_seconds=WATCH_DEBOUNCE_SECONDS,
+                                   max_pending=WATCH_MAX_PENDING)
+    except WatchError as e:
+        print_error(f"無法啟動監看: {e}")
+        return
+
+    # 以 SIGTERM 停止（例如 systemd）時與 Ctrl+C 相同，結束監看
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with watcher:
+        print_info(f"👀 監看 {watcher.watch_count} 個目錄，檔案變動後自動重新索引（Ctrl+C 結束）")
+        last_scan = time.monotonic()
+        try:
+            while True:
+                change = watcher.poll(timeout=1.0)
+                if change is None and rescan_seconds and time.monotonic() - last_scan >= rescan_seconds:
+                    change = {'paths': [], 'removed_dirs': [], 'rescan': True}
+                if change is None:
+                    continue
+
+                if not db.ping():
+                    continue
+                if change['rescan']:
+                    # 以目錄快照重新掃描，資料庫中已不存在的檔案一併移除
+                    snapshot = DirectorySnapshot(db.get_dir_snapshot(root_path))
+                    files = scanner.scan_directory(root_path, show_progress=False, snapshot=snapshot)
+                    db.save_dir_snapshot(snapshot)
+                    paths = [f['file_path'] for f in files]
+                    removed_dirs = [root_path]
+                    last_scan = time.monotonic()
+                else:
+                    paths = change['paths']
+                    removed_dirs = change['removed_dirs']
+
+                result = reindex_paths(db, paths, workers=workers, engine=engine,
+                                       removed_dirs=removed_dirs)
+                indexed = result['success'] - result['linked']
+                if indexed or result['linked'] or result['deleted'] or result['failed']:
+                    print_info(f"[{datetime.now():%H:%M:%S}] 🔄 更新: {indexed}，🔗 連結: {result['linked']}，"
+                               f"🗑️  移除: {result['deleted']}，❌ 失敗: {result['failed']}")
+        except KeyboardInterrupt:
+            click.echo()
+            print_info("停止監看")
 
 
 # ============================================================================
@@ -107,21 +518,36 @@ def cli():
 @click.argument('path', type=click.Path(exists=True))
 @click.option('--recursive/--no-recursive', default=True, help='是否遞迴搜索子目錄')
 @click.option('--incremental/--full', default=True, help='增量索引（僅更新變動檔案）或全量索引')
-def index(path, recursive, incremental):
+@click.option('--workers', default=1, type=click.IntRange(min=0),
+              help='平行解析的進程數（0 表示使用設定檔的 MAX_WORKERS）')
+@click.option('--engine', type=click.Choice(READER_ENGINES), default=READER_ENGINE,
+              help='Excel 讀取引擎（iterparse 直接解析 XML，速度較快）')
+@click.option('--retry-failed', is_flag=True, help='重新嘗試之前失敗且未變動的檔案')
+@click.option('--resume', is_flag=True, help='續跑同一路徑上次中斷的索引（不重新掃描，已完成的檔案不再解析）')
+@click.option('--schedule', type=click.Choice(SCHEDULE_POLICIES), default=SCHEDULE_POLICY,
+              help='解析順序：lpt 預估最久的先做（縮短平行解析的尾巴），freshest 最近修改的先做')
+@click.option('--bulk', is_flag=True,
+              help='批次載入模式：單元格先寫入暫存 TSV，再以 LOAD DATA LOCAL INFILE 載入（大量首次建立索引時使用）')
+@click.option('--watch', is_flag=True,
+              help='索引完成後持續監看整個目錄樹（Linux inotify），檔案變動即重新索引')
+@click.option('--files-from', type=click.File('rb'), default=None,
+              help='不掃描目錄，只處理清單檔中的路徑（- 表示標準輸入；以換行或 NUL 分隔，'
+                   '相對路徑以 PATH 為基準，「D<Tab>路徑」表示已刪除的檔案或目錄）')
+@click.option('--pipeline', is_flag=True,
+              help='邊掃描邊解析：掃描到的檔案分批立即解析，不等整個目錄樹走完（網路磁碟上較快開始）')
+def index(path, recursive, incremental, workers, engine, retry_failed, resume, schedule, bulk, watch,
+          files_from, pipeline):
     """📥 索引 Excel 檔案"""
+    if files_from and (resume or watch or pipeline):
+        raise click.UsageError("--files-from 不能與 --resume / --watch / --pipeline 同時使用")
+    if files_from and not os.path.isdir(path):
+        raise click.UsageError("使用 --files-from 時 PATH 必須是目錄（清單中相對路徑的基準）")
+
     mode_text = "增量索引" if incremental else "全量索引"
     print_header(f"🔍 開始 {mode_text} Excel 檔案 (MariaDB)")
 
-    # 掃描檔案
-    scanner = FileScanner()
-    files = scanner.scan_directory(path, recursive=recursive, show_progress=True)
-
-    if not files:
-        print_warning("未找到任何 Excel 檔案")
-        return
-
-    print_success(f"找到 {len(files)} 個 Excel 檔案")
-    click.echo()
+    root_path = os.path.abspath(path)
+    scanner = get_scanner()
 
     # 連接資料庫
     with DatabaseManager() as db:
@@ -132,100 +558,103 @@ def index(path, recursive, incremental):
         # 確保資料表存在
         db.create_tables()
 
-        # 逐個處理檔案
-        total_cells = 0
-        success_count = 0
-        failed_count = 0
-        new_files = 0
-        updated_files = 0
-        skipped_files = 0
-
-        with tqdm(files, desc="索引檔案", unit="file") as pbar:
-            for file_info in pbar:
-                file_path = file_info['file_path']
-                file_name = file_info['file_name']
-                file_modified = file_info['last_modified']
-
-                try:
-                    pbar.set_description(f"處理: {file_name[:30]}")
+        # 上次中斷時寫到一半的檔案先回滾，避免被當成已索引
+        rolled_back = recover_interrupted_runs(db)
+        if rolled_back:
+            print_warning(f"回滾上次中斷時未寫完的檔案: {rolled_back} 個")
+
+        if files_from:
+            # 只 stat 清單中的路徑，工作量與變動數量成正比
+            change = scanner.read_change_list(files_from.read(), root_path)
+            print_info(f"📋 變動清單: {len(change['paths'])} 個檔案，"
+                       f"{len(change['removed_dirs'])} 個刪除標記")
+            if workers == 0:
+                workers = MAX_WORKERS
+            result = reindex_paths(db, change['paths'], workers=workers, engine=engine,
+                                   removed_dirs=change['removed_dirs'], incremental=incremental,
+                                   retry_failed=retry_failed)
 
-                    # 檢查檔案是否已存在於資料庫
-                    existing_file = db.get_file_by_path(file_path)
-
-                    # 增量模式：判斷是否需要索引
-                    if incremental and existing_file:
-                        # 比較修改時間
-                        if file_modified <= existing_file['last_modified']:
-                            # 檔案未變動，跳過
-                            skipped_files += 1
-                            pbar.set_description(f"⏭️  跳過: {file_name[:30]}")
-                            continue
-                        else:
-                            # 檔案已更新，刪除舊資料
-                            updated_files += 1
-                            db.delete_file(file_path)  # CASCADE 會自動刪除相關 cells
-                            pbar.set_description(f"🔄 更新: {file_name[:30]}")
-                    elif not existing_file:
-                        # 新檔案
-                        new_files += 1
-                        pbar.set_description(f"➕ 新增: {file_name[:30]}")
-                    else:
-                        # 全量模式：刪除舊資料重新索引
-                        if existing_file:
-                            db.delete_file(file_path)
-
-                    # 讀取檔案內容
-                    cells_data = read_excel_file(file_path)
-
-                    if not cells_data:
-                        print_warning(f"⚠️  檔案無內容: {file_name}")
-                        continue
+            click.echo()
+            click.echo("─" * 70)
+            print_success(f"索引完成！成功: {result['success']}, 失敗: {result['failed']}")
+            print_info(f"🔄 更新: {result['success'] - result['linked']}，🔗 連結: {result['linked']}，"
+                       f"⏭️  內容未變: {result['unchanged']}，🗑️  移除: {result['deleted']}")
+            print_info(f"📊 總共索引 {result['cells']:,} 個單元格")
+            click.echo("─" * 70)
+            return
 
-                    # 新增檔案記錄
-                    file_id = db.add_file(
-                        file_path=file_path,
-                        file_name=file_name,
-                        last_modified=file_modified,  # 已經是 datetime 物件
-                        file_size=file_info['file_size']
-                    )
+        run = find_resumable_run(db, root_path) if resume else None
+        if run:
+            run_id = run['run_id']
+            files = [info for info in (scanner.get_file_info(file_path)
+                                       for file_path in db.get_run_files(run_id, ('pending',)))
+                     if info]
+            db.set_index_run_status(run_id, 'running')
+            print_info(f"▶️  續跑索引 #{run_id}（開始於 {run['started_at']}）: "
+                       f"剩餘 {len(files)} / {run['file_count']} 個檔案")
+        else:
+            if resume:
+                print_warning("沒有可續跑的中斷索引，改為重新掃描")
+
+            # 重新開始後，同一路徑之前中斷的執行不再續跑
+            for old_run in db.get_index_runs('interrupted'):
+                if old_run['root_path'] == root_path:
+                    db.set_index_run_status(old_run['run_id'], 'abandoned')
+
+            # 掃描檔案（增量索引時，mtime 未變的目錄直接沿用上次的目錄快照）
+            snapshot = DirectorySnapshot(db.get_dir_snapshot(root_path) if incremental else None)
+            if not pipeline:
+                files = scanner.scan_directory(path, recursive=recursive, show_progress=True,
+                                               snapshot=snapshot)
+                db.save_dir_snapshot(snapshot, prune=recursive)
+                if not files:
+                    print_warning("未找到任何 Excel 檔案")
+                    return
+                print_success(f"找到 {len(files)} 個 Excel 檔案")
+                if snapshot.reused:
+                    print_info(f"📂 沿用目錄快照: {snapshot.reused} / {len(snapshot.visited)} 個目錄未變動")
+                run_id = db.start_index_run(root_path, [f['file_path'] for f in files])
+            else:
+                # 執行記錄的檔案清單隨掃描逐批加入
+                run_id = db.start_index_run(root_path, [])
+        click.echo()
 
-                    if not file_id:
-                        print_error(f"❌ 新增檔案記錄失敗: {file_name}")
-                        failed_count += 1
-                        continue
+        # 一次讀出該路徑下已索引的檔案與失敗記錄，與掃描結果比對（不逐一查詢資料庫）
+        db_files = db.get_files_map(root_path)
+        failed_files = {row['file_path']: row for row in db.get_failed_files()}
+
+        if workers == 0:
+            workers = MAX_WORKERS
+        if workers > 1:
+            print_info(f"使用 {workers} 個進程平行解析")
+
+        if pipeline and not run:
+            print_info("🚰 管線模式：邊掃描邊解析")
+            file_stream = scanner.iter_directory(path, recursive=recursive, snapshot=snapshot)
+            with db.bulk_load() if bulk else nullcontext():
+                files, plan, result = index_pipelined(
+                    db, file_stream, run_id=run_id, workers=workers, engine=engine,
+                    schedule=schedule, incremental=incremental, retry_failed=retry_failed,
+                    existing_files=db_files, failed_files=failed_files)
+            db.save_dir_snapshot(snapshot, prune=recursive)
+            if not files:
+                db.set_index_run_status(run_id, 'completed')
+                print_warning("未找到任何 Excel 檔案")
+                return
+            print_success(f"找到 {len(files)} 個 Excel 檔案"
+                          f"（{result['first_batch_seconds']:.1f} 秒後開始解析第一批）")
+            if snapshot.reused:
+                print_info(f"📂 沿用目錄快照: {snapshot.reused} / {len(snapshot.visited)} 個目錄未變動")
+        else:
+            # 判斷哪些檔案需要索引（增量模式會跳過修改時間或內容未變的檔案）
+            plan = plan_index(db, files, incremental=incremental, retry_failed=retry_failed,
+                              existing_files=db_files, failed_files=failed_files)
 
-                    # 準備批次插入資料
-                    batch_data = []
-                    for cell in cells_data:
-                        value = cell['value']
-                        batch_data.append((
-                            file_id,
-                            cell['sheet_name'],
-                            cell['row'],
-                            cell['col'],
-                            cell['location'],
-                            value,
-                            value.lower(),  # value_lower
-                            False,  # is_merged
-                            None    # merged_range
-                        ))
-
-                    # 批次插入
-                    inserted = 0
-                    for i in range(0, len(batch_data), BATCH_SIZE):
-                        batch = batch_data[i:i + BATCH_SIZE]
-                        inserted += db.add_cells_batch(batch)
-
-                    # 更新檔案的單元格數量
-                    db.update_file_cell_count(file_id, len(cells_data))
-
-                    total_cells += len(cells_data)
-                    success_count += 1
-
-                except Exception as e:
-                    print_error(f"❌ 索引失敗: {file_name}")
-                    print_error(f"   錯誤: {str(e)}")
-                    failed_count += 1
+            # 解析並寫入
+            with db.bulk_load() if bulk else nullcontext():
+                result = index_planned(db, plan, workers=workers, engine=engine, run_id=run_id,
+                                       schedule=schedule)
+        write_stats = dict(db.write_stats)
 
         # 反向比對：清理已刪除的檔案
         deleted_files = 0
@@ -233,43 +662,87 @@ def index(path, recursive, incremental):
             click.echo()
             print_info("🔍 檢查已刪除的檔案...")
 
-            # 取得資料庫中該路徑下的所有檔案
-            import os
-            base_path = os.path.abspath(path)
-            db_files = db.get_files_under_path(base_path)
+            # 資料庫中有、掃描結果中沒有的檔案再確認一次是否存在（目錄暫時無法讀取時不會誤刪）；
+            # 續跑時沒有完整的掃描結果，只能逐一確認
+            scanned = set() if run else {f['file_path'] for f in files}
+            stale = [db_file for file_path, db_file in db_files.items()
+                     if file_path not in scanned and not os.path.exists(file_path)]
+            for db_file in stale:
+                print_info(f"🗑️  清除: {db_file['file_name']} (已刪除)")
+            deleted_files = db.delete_files([db_file['file_id'] for db_file in stale])
 
-            # 檢查每個資料庫中的檔案是否還存在
-            for db_file in db_files:
-                file_path = db_file['file_path']
-                if not os.path.exists(file_path):
-                    # 檔案已被刪除，從資料庫移除
-                    if db.delete_file(file_path):
-                        deleted_files += 1
-                        print_info(f"🗑️  清除: {db_file['file_name']} (已刪除)")
+        if run_id:
+            db.set_index_run_status(run_id, 'completed')
 
     # 顯示結果
     click.echo()
     click.echo("─" * 70)
-    print_success(f"索引完成！成功: {success_count}, 失敗: {failed_count}")
+    print_success(f"索引完成！成功: {result['success']}, 失敗: {result['failed']}")
 
     if incremental:
-        print_info(f"➕ 新增檔案: {new_files}")
-        print_info(f"🔄 更新檔案: {updated_files}")
-        print_info(f"⏭️  跳過檔案: {skipped_files}")
+        print_info(f"➕ 新增檔案: {plan['new']}")
+        print_info(f"🔄 更新檔案: {plan['updated']}")
+        print_info(f"⏭️  跳過檔案: {plan['skipped'] + result['unchanged']}")
         if deleted_files > 0:
             print_info(f"🗑️  清除檔案: {deleted_files}")
-
-    print_info(f"📊 總共索引 {total_cells:,} 個單元格")
+        if plan['quarantined']:
+            print_info(f"🚫 已知失敗（未變動，跳過）: {plan['quarantined']}，使用 --retry-failed 重試")
+
+    if result['invalid']:
+        print_warning(f"結構損壞: {result['invalid']} 個檔案（未解析）")
+    if result['partial']:
+        print_info(f"📑 部分重新索引: {result['partial']} 個檔案（只寫入有變動的工作表）")
+    if result['linked']:
+        print_info(f"🔗 內容相同的檔案: {result['linked']}（共用已索引的單元格）")
+    print_info(f"📊 總共索引 {result['cells']:,} 個單元格")
+    if result['wall_seconds'] > 0:
+        print_info(f"⚙️  Worker 使用率: {result['utilization']:.0%}"
+                   f"（解析 {result['parse_seconds']:.1f} 秒 / 總耗時 {result['wall_seconds']:.1f} 秒 × {result['workers']} 個 worker）")
+    if write_stats['seconds'] > 0:
+        print_info(f"💾 單元格寫入: {write_stats['rows'] / write_stats['seconds']:,.0f} 筆/秒"
+                   f"（{'LOAD DATA' if bulk else 'executemany'}，{write_stats['seconds']:.1f} 秒）")
     click.echo("─" * 70)
 
+    if watch:
+        click.echo()
+        with DatabaseManager() as db:
+            if not db.connection:
+                print_error("無法連接到 MariaDB 資料庫")
+                return
+            watch_index(db, root_path, workers=workers, engine=engine)
+
 
 @cli.command()
-@click.argument('keyword')
+@click.argument('keyword', required=False)
 @click.option('--limit', default=20, help='結果數量限制')
 @click.option('--full-row', is_flag=True, help='顯示完整行內容')
-def search(keyword, limit, full_row):
-    """🔍 搜索 Excel 內容"""
-    print_header(f'🔍 搜索: "{keyword}" (MariaDB)')
+@click.option('--num-between', nargs=2, type=float, default=None, metavar='MIN MAX',
+              help='只找數值介於 MIN 與 MAX 之間（含）的儲存格')
+@click.option('--date-after', type=click.DateTime(), default=None,
+              help='只找此日期（含）之後的日期儲存格')
+@click.option('--date-before', type=click.DateTime(), default=None,
+              help='只找此日期（不含）之前的日期儲存格')
+def search(keyword, limit, full_row, num_between, date_after, date_before):
+    """🔍 搜索 Excel 內容（關鍵詞、數值範圍或日期範圍）"""
+    if num_between and (date_after or date_before):
+        raise click.UsageError("--num-between 不能與 --date-after / --date-before 同時使用")
+
+    descriptions = [f'"{keyword}"'] if keyword else []
+    num_range = date_range = None
+    if num_between:
+        num_range = tuple(sorted(num_between))
+        descriptions.append(f"數值 {num_range[0]:g} ~ {num_range[1]:g}")
+    if date_after or date_before:
+        date_range = (to_epoch_seconds(date_after) if date_after else None,
+                      to_epoch_seconds(date_before) if date_before else None)
+        if date_after:
+            descriptions.append(f"日期 >= {date_after:%Y-%m-%d %H:%M}")
+        if date_before:
+            descriptions.append(f"日期 < {date_before:%Y-%m-%d %H:%M}")
+    if not descriptions:
+        raise click.UsageError("請指定關鍵詞，或使用 --num-between / --date-after / --date-before")
+
+    print_header(f'🔍 搜索: {" ".join(descriptions)} (MariaDB)')
 
     # 連接資料庫並搜索
     with DatabaseManager() as db:
@@ -278,7 +751,7 @@ def search(keyword, limit, full_row):
             return
 
         start_time = time.time()
-        results = db.search(keyword, limit)
+        results = db.search(keyword, limit, num_range=num_range, date_range=date_range)
         query_time = (time.time() - start_time) * 1000  # 轉換成毫秒
 
     if not results:
@@ -336,6 +809,7 @@ def stats():
     click.echo(f"📁 檔案總數: {stats['file_count']:,}")
     click.echo(f"📊 單元格總數: {stats['cell_count']:,}")
     click.echo(f"💾 資料庫大小: {stats['db_size_mb']:.2f} MB")
+    click.echo(f"🚫 失敗檔案數: {stats['failed_count']:,}")
     click.echo(f"🔗 資料庫: {DB_CONFIG['database']}")
     click.echo(f"🖥️  主機: {DB_CONFIG['host']}:{DB_CONFIG['port']}")
     click.echo()
@@ -354,6 +828,30 @@ def stats():
                 click.echo()
 
 
+@cli.command()
+def failed():
+    """🚫 列出無法索引的檔案"""
+    print_header("🚫 無法索引的檔案 (MariaDB)")
+
+    with DatabaseManager() as db:
+        if not db.connection:
+            print_error("無法連接到 MariaDB 資料庫")
+            return
+
+        failed_files = db.get_failed_files()
+
+    if not failed_files:
+        print_success("沒有失敗的檔案")
+        return
+
+    for failed_file in failed_files:
+        click.secho(f"[{failed_file['status']}] {failed_file['file_path']}", fg='red')
+        click.echo(f"   {failed_file['error']} | {failed_file['failed_at']}")
+
+    click.echo()
+    print_info(f"共 {len(failed_files)} 個檔案；檔案變動後會自動重試，或使用 index --retry-failed")
+
+
 @cli.command()
 @click.confirmation_option(prompt='確定要清空整個資料庫嗎？')
 def clear():
@@ -386,6 +884,7 @@ def info():
     click.echo("  • index <路徑>    - 索引 Excel 檔案")
     click.echo("  • search <關鍵詞> - 搜索內容")
     click.echo("  • stats           - 顯示統計資訊")
+    click.echo("  • failed          - 列出無法索引的檔案")
     click.echo("  • clear           - 清空資料庫")
     click.echo("  • info            - 顯示系統資訊")
     click.echo()
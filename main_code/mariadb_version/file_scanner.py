@@ -3,28 +3,85 @@ Excel 搜索系統 - 檔案掃描模組
 負責掃描目錄中的 Excel 檔案並獲取元數據
 """
 import os
+import time
+import queue
 import logging
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from tqdm import tqdm
 
-from config import SUPPORTED_EXTENSIONS
+from config import SUPPORTED_EXTENSIONS, INDEX_CONFIG, IGNORE_PATTERNS, IGNORE_FILE_NAME
+from ignore_rules import IgnoreRules, IgnoreChain, load_ignore_file, is_ignored
 
 logger = logging.getLogger(__name__)
 
+# 目錄 mtime 距離掃描開始不到這個時間（奈秒）時不沿用快照：
+# 同一個時間刻度內的後續修改不會改變 mtime，下次掃描會看不出來
+SNAPSHOT_RACY_NS = 2 * 10 ** 9
+
+# 變動清單（index --files-from）中的刪除標記：「D<Tab>路徑」
+CHANGE_LIST_DELETE_MARKER = 'D\t'
+
+
+class DirectorySnapshot:
+    """
+    目錄快照：記錄每個目錄的 mtime、子目錄與其中符合條件的檔案 (名稱, 大小, mtime)
+
+    目錄 mtime 未變表示目錄中沒有新增、刪除或改名的項目（Excel 存檔是先寫暫存檔再改名，
+    同樣會更新目錄 mtime），掃描時即沿用快照中的檔案，不再列出目錄或 stat 檔案。
+    """
+
+    def __init__(self, dirs: Dict[str, Dict[str, Any]] = None):
+        """
+        初始化目錄快照
+
+        Args:
+            dirs: 目錄路徑 -> {'mtime_ns': 目錄 mtime, 'subdirs': [子目錄路徑],
+                  'files': [(檔名, 大小, mtime)]}，通常由資料庫的 get_dir_snapshot 讀取
+        """
+        self.dirs = dirs or {}
+        self.changed: Dict[str, Dict[str, Any]] = {}  # 本次重新列出的目錄（需寫回資料庫）
+        self.visited = set()                          # 本次掃描到的目錄
+        self.reused = 0                               # 沿用快照的目錄數
+        self.started_ns = time.time_ns()
+
+    def lookup(self, dir_path: str, mtime_ns: int) -> Optional[Dict[str, Any]]:
+        """目錄 mtime 與快照相同時回傳快照記錄，否則回傳 None"""
+        cached = self.dirs.get(dir_path)
+        if cached and cached['mtime_ns'] and cached['mtime_ns'] == mtime_ns:
+            return cached
+        return None
+
+    def make_record(self, mtime_ns: int, subdirs: List[str],
+                    files: List[Tuple[str, int, float]]) -> Dict[str, Any]:
+        """建立一個目錄的快照記錄；剛修改過的目錄 mtime 記為 0，下次一定重新列出"""
+        if mtime_ns >= self.started_ns - SNAPSHOT_RACY_NS:
+            mtime_ns = 0
+        return {'mtime_ns': mtime_ns, 'subdirs': subdirs, 'files': files}
+
+    def stale_dirs(self) -> List[str]:
+        """快照中本次沒有掃描到的目錄（已刪除或無法讀取）"""
+        return [dir_path for dir_path in self.dirs if dir_path not in self.visited]
+
 
 class FileScanner:
     """
     Excel 檔案掃描器
 
     負責掃描指定目錄中的所有 Excel 檔案，並獲取檔案的元數據信息。
+    目錄以 os.scandir 讀取，每個檔案只 stat 一次；遞迴掃描時多個目錄由執行緒池同時讀取。
+    符合忽略規則（設定檔與目錄中的忽略規則檔）的目錄在讀取前就被排除，整個子樹都不會讀取。
     """
 
     def __init__(self,
                  supported_extensions: List[str] = None,
                  exclude_hidden: bool = True,
-                 min_size_bytes: int = 0):
+                 min_size_bytes: int = 0,
+                 scan_workers: int = INDEX_CONFIG['scan_workers'],
+                 ignore_patterns: List[str] = None,
+                 ignore_file_name: Optional[str] = IGNORE_FILE_NAME):
         """
         初始化檔案掃描器
 
@@ -32,10 +89,16 @@ class FileScanner:
             supported_extensions: 支援的檔案副檔名列表（例如 ['.xlsx', '.xls']）
             exclude_hidden: 是否排除隱藏檔案（以 . 開頭或在隱藏目錄中）
             min_size_bytes: 最小檔案大小（bytes），小於此大小的檔案將被忽略
+            scan_workers: 遞迴掃描時同時讀取目錄的執行緒數
+            ignore_patterns: 忽略規則（gitignore 語法，相對於掃描的根目錄），預設為 IGNORE_PATTERNS
+            ignore_file_name: 目錄中的忽略規則檔名稱，None 表示不讀取
         """
         self.supported_extensions = supported_extensions or SUPPORTED_EXTENSIONS
         self.exclude_hidden = exclude_hidden
         self.min_size_bytes = min_size_bytes
+        self.scan_workers = max(1, scan_workers)
+        self.ignore_rules = IgnoreRules(IGNORE_PATTERNS if ignore_patterns is None else ignore_patterns)
+        self.ignore_file_name = ignore_file_name
 
         logger.info(f"初始化檔案掃描器: 支援格式={self.supported_extensions}, "
                    f"排除隱藏={self.exclude_hidden}, 最小大小={self.min_size_bytes}B")
@@ -43,7 +106,8 @@ class FileScanner:
     def scan_directory(self,
                       directory: str,
                       recursive: bool = True,
-                      show_progress: bool = True) -> List[Dict[str, Any]]:
+                      show_progress: bool = True,
+                      snapshot: Optional[DirectorySnapshot] = None) -> List[Dict[str, Any]]:
         """
         掃描目錄中的所有 Excel 檔案
 
@@ -51,6 +115,8 @@ class FileScanner:
             directory: 要掃描的目錄路徑
             recursive: 是否遞迴掃描子目錄
             show_progress: 是否顯示進度條
+            snapshot: 目錄快照；mtime 未變的目錄沿用快照中的檔案，
+                重新列出的目錄記錄在 snapshot.changed
 
         Returns:
             List[Dict]: 檔案資訊列表，每個元素包含：
@@ -61,6 +127,41 @@ class FileScanner:
                 - extension: 副檔名
                 - relative_path: 相對路徑
 
+        Raises:
+            FileNotFoundError: 目錄不存在
+            PermissionError: 無權限訪問目錄
+        """
+        file_infos = list(self.iter_directory(directory, recursive=recursive,
+                                              show_progress=show_progress, snapshot=snapshot))
+
+        # 按修改時間排序（最新的在前；執行緒池回傳的順序不固定，同時間再依路徑排序）
+        file_infos.sort(key=lambda x: (x['last_modified'], x['file_path']), reverse=True)
+
+        if snapshot is not None:
+            logger.info(f"目錄快照: 沿用 {snapshot.reused} / {len(snapshot.visited)} 個目錄")
+        logger.info(f"成功掃描 {len(file_infos)} 個檔案")
+        return file_infos
+
+    def iter_directory(self,
+                       directory: str,
+                       recursive: bool = True,
+                       show_progress: bool = False,
+                       snapshot: Optional[DirectorySnapshot] = None) -> Iterator[Dict[str, Any]]:
+        """
+        掃描目錄，每讀完一個目錄就產生其中的檔案資訊（不排序）
+
+        呼叫端不必等整個目錄樹走完就能開始處理；提前結束迭代時，
+        尚未開始讀取的目錄不再讀取。快照要在迭代結束後才完整。
+
+        Args:
+            directory: 要掃描的目錄路徑
+            recursive: 是否遞迴掃描子目錄
+            show_progress: 是否顯示進度條
+            snapshot: 目錄快照（見 scan_directory）
+
+        Yields:
+            Dict: 檔案資訊（欄位同 scan_directory）
+
         Raises:
             FileNotFoundError: 目錄不存在
             PermissionError: 無權限訪問目錄
@@ -74,60 +175,24 @@ class FileScanner:
 
         logger.info(f"開始掃描目錄: {directory} (遞迴={recursive})")
 
-        # 收集所有檔案路徑
-        all_files = []
-
-        if recursive:
-            # 遞迴掃描
-            for root, dirs, files in os.walk(directory):
-                # 排除隱藏目錄
-                if self.exclude_hidden:
-                    dirs[:] = [d for d in dirs if not d.startswith('.')]
-
-                for filename in files:
-                    file_path = os.path.join(root, filename)
-                    if self._should_include(file_path, filename):
-                        all_files.append(file_path)
-        else:
-            # 只掃描當前目錄
-            try:
-                for filename in os.listdir(directory):
-                    file_path = os.path.join(directory, filename)
-                    if os.path.isfile(file_path) and self._should_include(file_path, filename):
-                        all_files.append(file_path)
-            except PermissionError as e:
-                logger.error(f"無權限訪問目錄: {directory}")
-                raise
-
-        logger.info(f"找到 {len(all_files)} 個 Excel 檔案")
-
-        # 獲取每個檔案的詳細資訊
-        file_infos = []
-
-        if show_progress and len(all_files) > 0:
-            # 使用進度條
-            for file_path in tqdm(all_files, desc="掃描檔案", unit="個"):
-                try:
-                    info = self.get_file_info(file_path, base_dir=directory)
-                    if info:
-                        file_infos.append(info)
-                except Exception as e:
-                    logger.warning(f"無法讀取檔案資訊: {file_path}, 錯誤: {e}")
-        else:
-            # 不顯示進度條
-            for file_path in all_files:
+        progress = tqdm(desc="掃描檔案", unit="個") if show_progress else None
+        try:
+            if recursive:
+                yield from self._iter_tree(directory, progress, snapshot)
+            else:
+                # 只掃描當前目錄（無權限時直接拋出）
                 try:
-                    info = self.get_file_info(file_path, base_dir=directory)
-                    if info:
-                        file_infos.append(info)
-                except Exception as e:
-                    logger.warning(f"無法讀取檔案資訊: {file_path}, 錯誤: {e}")
-
-        # 按修改時間排序（最新的在前）
-        file_infos.sort(key=lambda x: x['last_modified'], reverse=True)
-
-        logger.info(f"成功掃描 {len(file_infos)} 個檔案")
-        return file_infos
+                    file_infos, _, record, _ = self._scan_dir(directory, directory, snapshot)
+                except PermissionError:
+                    logger.error(f"無權限訪問目錄: {directory}")
+                    raise
+                self._record_dir(snapshot, directory, record)
+                if progress is not None:
+                    progress.update(len(file_infos))
+                yield from file_infos
+        finally:
+            if progress is not None:
+                progress.close()
 
     def get_file_info(self, file_path: str, base_dir: str = None) -> Optional[Dict[str, Any]]:
         """
@@ -152,36 +217,12 @@ class FileScanner:
         try:
             # 獲取檔案統計資訊
             stat = os.stat(file_path)
-
-            # 獲取絕對路徑
-            abs_path = os.path.abspath(file_path)
-
-            # 計算相對路徑
-            relative_path = None
-            if base_dir:
-                try:
-                    relative_path = os.path.relpath(abs_path, base_dir)
-                except ValueError:
-                    # 不同磁碟機，無法計算相對路徑
-                    relative_path = abs_path
-
-            # 組裝資訊
-            info = {
-                'file_path': abs_path,
-                'file_name': os.path.basename(file_path),
-                'file_size': stat.st_size,
-                'file_size_mb': round(stat.st_size / (1024 * 1024), 2),
-                'last_modified': datetime.fromtimestamp(stat.st_mtime),
-                'extension': os.path.splitext(file_path)[1].lower(),
-                'relative_path': relative_path,
-            }
-
-            return info
-
         except (OSError, PermissionError) as e:
             logger.warning(f"無法讀取檔案: {file_path}, 錯誤: {e}")
             return None
 
+        return self._build_info(os.path.abspath(file_path), stat.st_size, stat.st_mtime, base_dir)
+
     def get_summary(self, file_infos: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         獲取掃描結果的統計摘要
@@ -230,16 +271,11 @@ class FileScanner:
             },
         }
 
-    # ========================================================================
-    # 私有輔助方法
-    # ========================================================================
-
-    def _should_include(self, file_path: str, filename: str) -> bool:
+    def should_include(self, filename: str) -> bool:
         """
-        判斷檔案是否應該被包含在掃描結果中
+        依檔名判斷檔案是否應該被包含在掃描結果中（大小限制在 stat 後檢查）
 
         Args:
-            file_path: 檔案路徑
             filename: 檔案名稱
 
         Returns:
@@ -253,22 +289,309 @@ class FileScanner:
         if self.exclude_hidden and filename.startswith('.'):
             return False
 
-        # 3. 檢查檔案大小
-        try:
-            file_size = os.path.getsize(file_path)
-            if file_size < self.min_size_bytes:
-                logger.debug(f"檔案太小，跳過: {filename} ({file_size} bytes)")
-                return False
-        except OSError:
-            return False
-
-        # 4. 排除臨時檔案（Excel 開啟時會產生 ~$ 開頭的臨時檔）
-        if filename.startswith('~$'):
-            logger.debug(f"跳過臨時檔案: {filename}")
+        # 3. 排除符合設定檔忽略規則的檔名（例如 Excel 開啟時產生的 ~$ 暫存檔）
+        if self.ignore_rules.match(filename):
+            logger.debug(f"跳過忽略的檔案: {filename}")
             return False
 
         return True
 
+    def is_ignored(self, path: str, root: str, is_dir: bool = False,
+                   cache: Optional[Dict[str, Optional[IgnoreRules]]] = None) -> bool:
+        """
+        判斷單一路徑是否被忽略（監看與變動清單用；掃描時規則隨目錄樹逐層套用，不需呼叫）
+
+        由 root 往下逐層檢查：任何一層目錄被忽略（或是設定排除的隱藏目錄）時，
+        其下的路徑都視為被忽略；途中各目錄的忽略規則檔都會套用。
+
+        Args:
+            path: 絕對路徑
+            root: 掃描的根目錄（設定檔規則的基準）；path 不在其下時以 path 所在目錄為準
+            is_dir: path 是否為目錄
+            cache: 目錄 -> 忽略規則檔的快取；同一批路徑共用時每個規則檔只讀一次
+
+        Returns:
+            bool: True 表示被忽略
+        """
+        root = root.rstrip(os.sep) or os.sep
+        if not path.startswith(os.path.join(root, '')):
+            root = os.path.dirname(path)
+
+        chain = self._extend_chain(((root, self.ignore_rules),), root, cache)
+        rel_parts = path[len(root):].strip(os.sep).split(os.sep)
+        current = root
+        for name in rel_parts[:-1]:
+            current = os.path.join(current, name)
+            if self._is_pruned(chain, current, name):
+                return True
+            chain = self._extend_chain(chain, current, cache)
+        if is_dir:
+            return self._is_pruned(chain, path, rel_parts[-1])
+        return is_ignored(chain, path)
+
+    def read_change_list(self, data: bytes, base_dir: str) -> Dict[str, List[str]]:
+        """
+        解析外部工具提供的變動清單（index --files-from）
+
+        清單中含有 NUL 字元時以 NUL 分隔（可容納含換行的檔名），否則以換行分隔。
+        每個項目是一個路徑，相對路徑以 base_dir 為基準；以 CHANGE_LIST_DELETE_MARKER
+        開頭的項目表示已刪除的檔案或目錄。只解析清單，不讀取檔案系統。
+
+        Args:
+            data: 清單內容
+            base_dir: 相對路徑的基準目錄
+
+        Returns:
+            Dict: 包含
+                - paths: 符合檔名規則的檔案路徑（含已刪除的檔案，由呼叫者依是否存在處理）
+                - removed_dirs: 標記為刪除的項目（可能是目錄，其下已不存在的檔案一併移除）
+        """
+        separator = b'\0' if b'\0' in data else b'\n'
+        paths = []
+        removed_dirs = []
+        seen = set()
+        ignore_cache = {}
+        for raw in data.split(separator):
+            entry = os.fsdecode(raw.rstrip(b'\r') if separator == b'\n' else raw)
+            deleted = entry.startswith(CHANGE_LIST_DELETE_MARKER)
+            if deleted:
+                entry = entry[len(CHANGE_LIST_DELETE_MARKER):]
+            if not entry:
+                continue
+
+            path = os.path.normpath(os.path.join(base_dir, entry))
+            if deleted:
+                removed_dirs.append(path)
+            if not self.should_include(os.path.basename(path)):
+                continue
+            if not deleted and self.is_ignored(path, base_dir, cache=ignore_cache):
+                continue
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+
+        return {'paths': paths, 'removed_dirs': removed_dirs}
+
+    # ========================================================================
+    # 私有輔助方法
+    # ========================================================================
+
+    def _iter_tree(self, directory: str, progress: Optional[tqdm] = None,
+                   snapshot: Optional[DirectorySnapshot] = None) -> Iterator[Dict[str, Any]]:
+        """
+        遞迴掃描目錄樹：每個目錄是一個任務，讀到的子目錄再提交給執行緒池
+
+        Args:
+            directory: 根目錄（絕對路徑）
+            progress: 進度條（每讀完一個目錄更新一次）
+            snapshot: 目錄快照（見 scan_directory）
+
+        Yields:
+            Dict: 檔案資訊（順序不固定）
+        """
+        # 完成的目錄依序放入佇列，由主執行緒取出（避免每次都檢查所有未完成的任務）
+        finished = queue.SimpleQueue()
+        pending = set()
+
+        with ThreadPoolExecutor(max_workers=self.scan_workers,
+                                thread_name_prefix='scan') as pool:
+            def submit(dir_path, chain):
+                future = pool.submit(self._scan_dir, dir_path, directory, snapshot, chain)
+                pending.add(future)
+                future.add_done_callback(lambda f: finished.put((dir_path, f)))
+
+            try:
+                submit(directory, None)
+                while pending:
+                    dir_path, future = finished.get()
+                    pending.discard(future)
+                    try:
+                        infos, subdirs, record, chain = future.result()
+                    except OSError as e:
+                        # 與 os.walk 相同：無法讀取的目錄略過
+                        logger.warning(f"無法讀取目錄: {dir_path}, 錯誤: {e}")
+                        continue
+                    self._record_dir(snapshot, dir_path, record)
+                    if progress is not None:
+                        progress.update(len(infos))
+                    for subdir in subdirs:
+                        submit(subdir, chain)
+                    yield from infos
+            finally:
+                # 提前結束迭代：還在排隊的目錄不再讀取
+                for future in list(pending):
+                    future.cancel()
+
+    def _scan_dir(self, dir_path: str, base_dir: str,
+                  snapshot: Optional[DirectorySnapshot] = None,
+                  chain: Optional[IgnoreChain] = None
+                  ) -> Tuple[List[Dict[str, Any]], List[str], Optional[Dict[str, Any]], IgnoreChain]:
+        """
+        讀取單一目錄（不遞迴）
+
+        名稱不符合的檔案不會 stat；符合的檔案重用 DirEntry 的 stat 結果組裝檔案資訊。
+        有快照且目錄 mtime 未變時不列出目錄，直接由快照組裝。
+        快照記錄的是套用忽略規則之前的內容（含忽略規則檔本身），規則變更後不需重新列出目錄。
+
+        Args:
+            dir_path: 目錄路徑
+            base_dir: 基礎目錄（用於計算相對路徑，也是設定檔忽略規則的基準）
+            snapshot: 目錄快照
+            chain: 上層目錄傳下來的忽略規則鏈，None 表示 dir_path 是根目錄
+
+        Returns:
+            (檔案資訊列表, 子目錄路徑列表, 快照記錄, 子目錄的忽略規則鏈)；子目錄不包含
+            符號連結、（設定排除時的）隱藏目錄與被忽略的目錄；沿用快照或沒有快照時快照記錄為 None
+
+        Raises:
+            OSError: 無法讀取目錄
+        """
+        if chain is None:
+            chain = ((base_dir, self.ignore_rules),)
+
+        dir_mtime_ns = None
+        if snapshot is not None:
+            # 先取得 mtime 再列出目錄：列出期間的修改會讓下次掃描重新列出
+            dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+            cached = snapshot.lookup(dir_path, dir_mtime_ns)
+            if cached:
+                files = cached['files']
+                if any(name == self.ignore_file_name for name, _, _ in files):
+                    chain = self._extend_chain(chain, dir_path)
+                return (self._filter_files(dir_path, base_dir, files, chain),
+                        self._filter_subdirs(cached['subdirs'], chain), None, chain)
+
+        subdirs = []
+        files = []
+        candidates = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (self.exclude_hidden and entry.name.startswith('.')):
+                            subdirs.append(entry.path)
+                        continue
+                    if entry.name == self.ignore_file_name or self.should_include(entry.name):
+                        candidates.append(entry)
+                except OSError as e:
+                    logger.warning(f"無法讀取檔案: {entry.path}, 錯誤: {e}")
+
+        # 目錄中的忽略規則檔要在判斷其他項目之前讀入
+        if any(entry.name == self.ignore_file_name for entry in candidates):
+            chain = self._extend_chain(chain, dir_path)
+
+        for entry in candidates:
+            # 沒有快照時，被忽略的檔案不必 stat；有快照時仍要記錄（規則變更後不需重新列出）
+            if snapshot is None and entry.name != self.ignore_file_name \
+                    and is_ignored(chain, entry.path):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError as e:
+                logger.warning(f"無法讀取檔案: {entry.path}, 錯誤: {e}")
+                continue
+            files.append((entry.name, stat.st_size, stat.st_mtime))
+
+        record = snapshot.make_record(dir_mtime_ns, subdirs, files) if snapshot is not None else None
+        return (self._filter_files(dir_path, base_dir, files, chain),
+                self._filter_subdirs(subdirs, chain), record, chain)
+
+    def _filter_files(self, dir_path: str, base_dir: str, files: List[Tuple[str, int, float]],
+                      chain: IgnoreChain) -> List[Dict[str, Any]]:
+        """由 (名稱, 大小, mtime) 組裝檔案資訊，排除忽略規則檔、太小與被忽略的檔案"""
+        file_infos = []
+        for name, size, mtime in files:
+            if name == self.ignore_file_name:
+                continue
+            if size < self.min_size_bytes:
+                logger.debug(f"檔案太小，跳過: {name} ({size} bytes)")
+                continue
+            path = os.path.join(dir_path, name)
+            if is_ignored(chain, path):
+                continue
+            file_infos.append(self._build_info(path, size, mtime, base_dir))
+        return file_infos
+
+    def _filter_subdirs(self, subdirs: List[str], chain: IgnoreChain) -> List[str]:
+        """排除被忽略的子目錄（在讀取之前剪除，整個子樹都不會讀取）"""
+        kept = []
+        for subdir in subdirs:
+            if is_ignored(chain, subdir, is_dir=True):
+                logger.debug(f"跳過忽略的目錄: {subdir}")
+                continue
+            kept.append(subdir)
+        return kept
+
+    def _extend_chain(self, chain: IgnoreChain, dir_path: str,
+                      cache: Optional[Dict[str, Optional[IgnoreRules]]] = None) -> IgnoreChain:
+        """讀取目錄中的忽略規則檔，加在規則鏈的最後（沒有規則檔時原樣回傳）"""
+        if not self.ignore_file_name:
+            return chain
+        if cache is not None and dir_path in cache:
+            rules = cache[dir_path]
+        else:
+            rules = load_ignore_file(os.path.join(dir_path, self.ignore_file_name))
+            if cache is not None:
+                cache[dir_path] = rules
+        return chain + ((dir_path, rules),) if rules else chain
+
+    def _is_pruned(self, chain: IgnoreChain, dir_path: str, name: str) -> bool:
+        """目錄是否被排除（隱藏目錄或符合忽略規則）"""
+        if self.exclude_hidden and name.startswith('.'):
+            return True
+        return is_ignored(chain, dir_path, is_dir=True)
+
+    def _record_dir(self, snapshot: Optional[DirectorySnapshot], dir_path: str,
+                    record: Optional[Dict[str, Any]]):
+        """在主執行緒中記錄一個目錄的掃描結果（record 為 None 表示沿用快照）"""
+        if snapshot is None:
+            return
+        snapshot.visited.add(dir_path)
+        if record is None:
+            snapshot.reused += 1
+        else:
+            snapshot.changed[dir_path] = record
+
+    def _build_info(self, abs_path: str, file_size: int, mtime: float,
+                    base_dir: str = None) -> Dict[str, Any]:
+        """
+        由檔案大小與修改時間組裝檔案資訊（格式見 get_file_info）
+
+        Args:
+            abs_path: 檔案絕對路徑
+            file_size: 檔案大小（bytes）
+            mtime: 修改時間（epoch 秒）
+            base_dir: 基礎目錄（用於計算相對路徑）
+
+        Returns:
+            Dict: 檔案資訊字典
+        """
+        # 計算相對路徑（掃描得到的路徑都在 base_dir 之下，直接截掉前綴，
+        # os.path.relpath 佔了組裝資訊大部分的時間）
+        relative_path = None
+        if base_dir:
+            prefix = os.path.join(base_dir, '')
+            if abs_path.startswith(prefix):
+                relative_path = abs_path[len(prefix):]
+            else:
+                try:
+                    relative_path = os.path.relpath(abs_path, base_dir)
+                except ValueError:
+                    # 不同磁碟機，無法計算相對路徑
+                    relative_path = abs_path
+
+        return {
+            'file_path': abs_path,
+            'file_name': os.path.basename(abs_path),
+            'file_size': file_size,
+            'file_size_mb': round(file_size / (1024 * 1024), 2),
+            'last_modified': datetime.fromtimestamp(mtime),
+            'extension': os.path.splitext(abs_path)[1].lower(),
+            'relative_path': relative_path,
+        }
+
     def _is_excel_file(self, filename: str) -> bool:
         """
         判斷檔案是否為 Excel 檔案
@@ -0,0 +1,208 @@
+"""
+Excel 搜索系統 - 忽略規則模組
+以 gitignore 語法描述不需要索引的檔案與目錄；每組規則只編譯一次，
+比對一個路徑只需要一次正規表示式比對
+"""
+import os
+import re
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 規則鏈：由淺到深的 (規則所在目錄, IgnoreRules)，越深的規則越優先
+IgnoreChain = Tuple[Tuple[str, 'IgnoreRules'], ...]
+
+# 路徑分隔符號就是 / 時，直接從絕對路徑中相對部分的位置開始比對，不必切出相對路徑
+_NATIVE_SLASH = os.sep == '/'
+
+
+class IgnoreRules:
+    """
+    一組 gitignore 語法的忽略規則（設定檔中的規則，或某個目錄中的忽略規則檔）
+
+    支援的語法：
+        - 空白行與 # 開頭的註解
+        - * ? [...] 萬用字元（不跨越 /），** 跨越任意層目錄
+        - 開頭的 ! 表示重新包含（同一組規則中，後面的規則優先）
+        - 結尾的 / 表示只比對目錄
+        - 含有 /（結尾的除外）的規則相對於規則所在的目錄，否則比對任何一層的名稱
+
+    目錄被忽略時整個子樹都不會被掃描，其中的檔案無法再以 ! 重新包含（與 git 相同）。
+    """
+
+    def __init__(self, patterns: Iterable[str], source: str = '設定檔'):
+        """
+        編譯規則
+
+        Args:
+            patterns: 規則列表（每個元素一行）
+            source: 規則來源，只用於記錄
+        """
+        self.source = source
+        self.patterns = []
+        self._negate = []
+        file_parts = []
+        dir_parts = []
+
+        for line in patterns:
+            translated = _translate(line)
+            if translated is None:
+                continue
+            regex, negate, dir_only = translated
+            group = f'r{len(self._negate)}'
+            self.patterns.append(line.strip())
+            self._negate.append(negate)
+            dir_parts.append(f'(?P<{group}>{regex})')
+            if not dir_only:
+                file_parts.append(f'(?P<{group}>{regex})')
+
+        # 後面的規則優先：以相反順序組成交替，fullmatch 會停在第一個成立的分支
+        self._file_regex = _combine(file_parts)
+        self._dir_regex = _combine(dir_parts)
+
+    def __bool__(self) -> bool:
+        return bool(self._negate)
+
+    def match(self, rel_path: str, is_dir: bool = False, pos: int = 0) -> Optional[bool]:
+        """
+        比對相對於規則所在目錄的路徑
+
+        Args:
+            rel_path: 以 / 分隔的相對路徑
+            is_dir: 是否為目錄
+            pos: 相對路徑在 rel_path 中的起始位置
+
+        Returns:
+            None 表示沒有規則符合；True 表示忽略；False 表示被 ! 規則重新包含
+        """
+        regex = self._dir_regex if is_dir else self._file_regex
+        if regex is None:
+            return None
+        match = regex.fullmatch(rel_path, pos)
+        if match is None:
+            return None
+        return not self._negate[int(match.lastgroup[1:])]
+
+
+def load_ignore_file(file_path: str) -> Optional[IgnoreRules]:
+    """
+    讀取目錄中的忽略規則檔
+
+    Returns:
+        IgnoreRules；檔案不存在、無法讀取或沒有任何規則時回傳 None
+    """
+    try:
+        with open(file_path, encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        logger.warning(f"無法讀取忽略規則檔: {file_path}, 錯誤: {e}")
+        return None
+    rules = IgnoreRules(lines, source=file_path)
+    return rules if rules else None
+
+
+def is_ignored(chain: IgnoreChain, path: str, is_dir: bool = False) -> bool:
+    """
+    依規則鏈判斷路徑是否被忽略（由最深的規則開始，第一組有符合規則的決定結果）
+
+    Args:
+        chain: 規則鏈，路徑必須位於每組規則所在的目錄之下
+        path: 絕對路徑
+        is_dir: 是否為目錄
+    """
+    for base_dir, rules in reversed(chain):
+        start = len(base_dir) if base_dir.endswith(os.sep) else len(base_dir) + 1
+        if _NATIVE_SLASH:
+            result = rules.match(path, is_dir, start)
+        else:
+            result = rules.match(path[start:].replace(os.sep, '/'), is_dir)
+        if result is not None:
+            return result
+    return False
+
+
+# ============================================================================
+# 私有輔助函數
+# ============================================================================
+
+def _combine(parts: List[str]) -> Optional['re.Pattern']:
+    """以相反順序把各規則組成一個正規表示式"""
+    if not parts:
+        return None
+    return re.compile('|'.join(reversed(parts)), re.DOTALL)
+
+
+def _translate(line: str) -> Optional[Tuple[str, bool, bool]]:
+    """
+    把一行 gitignore 規則轉成正規表示式
+
+    Returns:
+        (正規表示式, 是否為 ! 規則, 是否只比對目錄)；空白行與註解回傳 None
+    """
+    pattern = line.rstrip('\r\n')
+    if not pattern.strip() or pattern.startswith('#'):
+        return None
+
+    # 結尾空白忽略，除非以 \ 跳脫
+    stripped = pattern.rstrip(' ')
+    if stripped.endswith('\\') and len(stripped) < len(pattern):
+        stripped += ' '
+    pattern = stripped
+
+    negate = pattern.startswith('!')
+    if negate:
+        pattern = pattern[1:]
+    elif pattern.startswith('\\!') or pattern.startswith('\\#'):
+        pattern = pattern[1:]
+
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    if not pattern:
+        return None
+
+    # 含有 / 的規則相對於規則所在目錄；否則比對任何一層
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = []
+    i, n = 0, len(pattern)
+    while i < n:
+        char = pattern[i]
+        if char == '*':
+            if pattern.startswith('**', i) and (i == 0 or pattern[i - 1] == '/'):
+                if pattern.startswith('**/', i):
+                    regex.append('(?:.*/)?')
+                    i += 3
+                    continue
+                if i + 2 == n:
+                    regex.append('.*')
+                    i += 2
+                    continue
+            while i < n and pattern[i] == '*':
+                i += 1
+            regex.append('[^/]*')
+            continue
+        if char == '?':
+            regex.append('[^/]')
+        elif char == '[':
+            end = pattern.find(']', i + 2 if pattern.startswith('[!', i) or pattern.startswith('[^', i) else i + 1)
+            if end < 0:
+                regex.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                regex.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif char == '\\' and i + 1 < n:
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(char))
+        i += 1
+
+    prefix = '' if anchored else '(?:.*/)?'
+    return prefix + ''.join(regex), negate, dir_only
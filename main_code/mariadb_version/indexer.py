@@ -0,0 +1,578 @@
+"""
+Excel 搜索系統 - 平行索引模組
+在子進程中解析 Excel，主進程作為唯一的資料庫寫入者
+"""
+import os
+import time
+import logging
+import statistics
+import queue
+import threading
+import multiprocessing
+from typing import Iterable, Iterator, Dict, Any, List, Tuple, Optional
+
+from excel_reader import (read_excel_file, iter_batches, file_fingerprint, read_sheet_parts,
+                          validate_workbook, VALID_STATUSES)
+
+logger = logging.getLogger(__name__)
+
+# 每個 worker 在事件佇列中最多可以排隊的批次數
+QUEUE_BATCHES_PER_WORKER = 4
+
+# 監控 worker 的間隔（秒）：檢查解析時間與記憶體用量
+SUPERVISE_INTERVAL = 0.5
+
+# 解析排程策略：lpt 依預估耗時由長到短；freshest 依修改時間由新到舊
+SCHEDULE_POLICIES = ('lpt', 'freshest')
+
+# 事件格式: (事件類型, file_info, 資料)
+#   ('start', file_info, None)       開始解析檔案
+#   ('cells', file_info, [cell...])  一批單元格
+#   ('done',  file_info, cell_count) 解析完成；file_info 會補上 parse_seconds
+#   ('error', file_info, message)    解析失敗；worker 被終止時 file_info 會補上
+#                                    error_status（ERROR_TIMEOUT / ERROR_MEMORY / ERROR_CRASH）
+IndexEvent = Tuple[str, Dict[str, Any], Any]
+
+
+def plan_index(db, file_infos: Iterable[Dict[str, Any]], incremental: bool = True,
+               compare_mtime: bool = True, retry_failed: bool = False,
+               existing_files: Optional[Dict[str, Dict[str, Any]]] = None,
+               failed_files: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    依內容指紋決定每個檔案的處理方式
+
+    - 大小與修改時間都未變（compare_mtime 時）或內容指紋與資料庫相同的檔案不需解析，
+      只有大小或修改時間變了的檔案才需要結構檢查與計算指紋
+    - 曾經失敗且大小、修改時間都沒變的檔案直接跳過（增量模式且未指定 retry_failed 時）
+    - 結構檢查（validate_workbook）不通過的檔案不交給解析器
+    - 內容與資料庫中其他檔案相同時，只建立連結共用其單元格
+    - 本次有多個內容相同的檔案時只解析第一個，其餘延後到解析完成後再連結
+    - 其餘需要解析的 xlsx 會比對各工作表部件 CRC，只解析有變動的工作表
+
+    Args:
+        db: 資料庫管理器（需提供 get_file_by_path / find_content_owner）
+        file_infos: 檔案資訊列表，會補上 content_hash 欄位；
+            需要解析的檔案另補上 sheet_parts，部分重新索引時再補上
+            file_id / sheets（要解析的工作表）/ stale_sheets（要刪除的工作表）
+        incremental: False 時強制重新解析所有檔案（仍會共用相同內容）
+        compare_mtime: 是否先以大小與修改時間判斷檔案未變
+        retry_failed: 重新嘗試已記錄為失敗的檔案
+        existing_files: 預先一次讀出的檔案記錄（路徑 -> get_file_by_path 的記錄），
+            提供時不再逐一查詢資料庫
+        failed_files: 預先一次讀出的失敗記錄（路徑 -> get_failed_file 的記錄），
+            提供時不再逐一查詢資料庫
+
+    Returns:
+        {'parse': [file_info], 'link': [(file_info, owner_id)],
+         'deferred': [file_info], 'unchanged': [(file_info, existing)],
+         'invalid': [(file_info, 狀態代碼, 說明)],
+         'new': 新檔案數, 'updated': 更新檔案數, 'skipped': 修改時間未變的檔案數,
+         'partial': 只重新索引部分工作表的檔案數, 'quarantined': 已知失敗而跳過的檔案數}
+    """
+    plan = {'parse': [], 'link': [], 'deferred': [], 'unchanged': [], 'invalid': [],
+            'new': 0, 'updated': 0, 'skipped': 0, 'partial': 0, 'quarantined': 0}
+    skip_failed = incremental and not retry_failed
+    candidates = []
+    existing_rows = {}
+
+    for file_info in file_infos:
+        if existing_files is None:
+            existing = db.get_file_by_path(file_info['file_path'])
+        else:
+            existing = existing_files.get(file_info['file_path'])
+        existing_rows[file_info['file_path']] = existing
+        if existing and existing['parse_seconds']:
+            file_info['last_parse_seconds'] = existing['parse_seconds']
+            file_info['last_file_size'] = existing['file_size']
+        if existing and incremental and compare_mtime and existing['last_modified'] \
+                and file_info['file_size'] == existing['file_size']:
+            # MariaDB 的 DATETIME 欄位不保存微秒，比較前先捨去
+            last_modified = file_info['last_modified']
+            if not existing['last_modified'].microsecond:
+                last_modified = last_modified.replace(microsecond=0)
+            if last_modified <= existing['last_modified']:
+                plan['skipped'] += 1
+                continue
+
+        if skip_failed and _is_known_failure(db, file_info, failed_files):
+            plan['quarantined'] += 1
+            continue
+
+        status, message = validate_workbook(file_info['file_path'])
+        if status not in VALID_STATUSES:
+            plan['invalid'].append((file_info, status, message))
+            continue
+
+        content_hash = file_fingerprint(file_info['file_path'])
+        file_info['content_hash'] = content_hash
+
+        if existing and incremental and content_hash and content_hash == existing['content_hash']:
+            plan['unchanged'].append((file_info, existing))
+            continue
+
+        if existing:
+            plan['updated'] += 1
+        else:
+            plan['new'] += 1
+        candidates.append(file_info)
+
+    # 將要重新解析的檔案，其舊內容不能再被共用
+    reparse_paths = {file_info['file_path'] for file_info in candidates}
+    scheduled = set()
+
+    for file_info in candidates:
+        content_hash = file_info['content_hash']
+        if not content_hash:
+            plan['parse'].append(file_info)
+            continue
+        if content_hash in scheduled:
+            plan['deferred'].append(file_info)
+            continue
+
+        owner = db.find_content_owner(content_hash, exclude_path=file_info['file_path'])
+        if owner and owner['file_path'] not in reparse_paths:
+            plan['link'].append((file_info, owner['file_id']))
+            continue
+
+        scheduled.add(content_hash)
+        if _plan_sheets(db, file_info, existing_rows[file_info['file_path']], incremental):
+            plan['partial'] += 1
+        plan['parse'].append(file_info)
+
+    return plan
+
+
+def schedule_files(file_infos: List[Dict[str, Any]], policy: str = 'lpt') -> List[Dict[str, Any]]:
+    """
+    決定檔案的解析順序
+
+    lpt（longest processing time first）先處理預估最久的檔案，避免平行解析時
+    最後只剩一個大檔案在跑。預估耗時以上次解析的耗時依檔案大小變化換算；
+    沒有紀錄的檔案以本批已知檔案的「秒數 / 位元組」中位數乘上檔案大小估算，
+    完全沒有紀錄時即依檔案大小排序。
+
+    Args:
+        file_infos: 要解析的檔案資訊列表
+        policy: 'lpt' 或 'freshest'（修改時間由新到舊，讓最近變動的檔案先可搜尋）
+
+    Returns:
+        排序後的新列表
+    """
+    if policy == 'freshest':
+        return sorted(file_infos, key=lambda f: f['last_modified'], reverse=True)
+
+    rates = [f['last_parse_seconds'] / f['last_file_size'] for f in file_infos
+             if f.get('last_parse_seconds') and f.get('last_file_size')]
+    rate = statistics.median(rates) if rates else 1.0
+
+    def estimate(file_info: Dict[str, Any]) -> float:
+        if file_info.get('last_parse_seconds') and file_info.get('last_file_size'):
+            return file_info['last_parse_seconds'] * file_info['file_size'] / file_info['last_file_size']
+        return file_info['file_size'] * rate
+
+    return sorted(file_infos, key=estimate, reverse=True)
+
+
+def pipeline_batches(file_infos: Iterable[Dict[str, Any]], max_batch: int = 200,
+                     queue_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    在背景執行緒中取用檔案資訊（例如 FileScanner.iter_directory），經有界佇列分批交給呼叫端
+
+    每一批是目前已經到達的檔案（至少一個、至多 max_batch 個），因此第一個檔案一找到
+    就能開始解析；呼叫端處理一批的同時，掃描在背景繼續。佇列滿時掃描暫停，
+    記憶體用量維持固定。
+
+    Args:
+        file_infos: 檔案資訊的來源（在背景執行緒中迭代）
+        max_batch: 每一批最多的檔案數
+        queue_size: 佇列中最多暫存的檔案數
+
+    Yields:
+        List[Dict]: 一批檔案資訊
+
+    Raises:
+        來源迭代時拋出的例外，在所有已到達的檔案交出後重新拋出
+    """
+    source = iter(file_infos)
+    items = queue.Queue(maxsize=max(1, queue_size))
+    stop = threading.Event()
+    errors = []
+    end = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for file_info in source:
+                if not put(file_info):
+                    break
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+            put(end)
+
+    producer = threading.Thread(target=produce, name='pipeline-scan', daemon=True)
+    producer.start()
+    try:
+        finished = False
+        while not finished:
+            batch = [items.get()]
+            while len(batch) < max_batch:
+                try:
+                    batch.append(items.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is end:
+                batch.pop()
+                finished = True
+            if batch:
+                yield batch
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        producer.join()
+
+
+def record_failure(db, file_info: Dict[str, Any], status: str, error: str):
+    """
+    記錄檔案失敗；檔案的大小與修改時間不變時，之後的增量索引會直接跳過它
+
+    Args:
+        db: 資料庫管理器（需提供 record_failed_file）
+        file_info: 檔案資訊
+        status: 狀態代碼（validate_workbook() 的錯誤代碼或 ERROR_PARSE）
+        error: 錯誤訊息
+    """
+    db.record_failed_file(file_info['file_path'], file_info['file_size'],
+                          file_info['last_modified'].timestamp(), status, error)
+
+
+def _is_known_failure(db, file_info: Dict[str, Any],
+                      failed_files: Optional[Dict[str, Dict[str, Any]]] = None) -> bool:
+    """檔案是否已記錄為失敗，且之後沒有變動過"""
+    if failed_files is None:
+        failed = db.get_failed_file(file_info['file_path'])
+    else:
+        failed = failed_files.get(file_info['file_path'])
+    return bool(failed) and failed['file_size'] == file_info['file_size'] \
+        and failed['mtime'] == file_info['last_modified'].timestamp()
+
+
+def _plan_sheets(db, file_info: Dict[str, Any], existing: Optional[Dict[str, Any]],
+                 incremental: bool) -> bool:
+    """
+    比對工作表部件 CRC，決定是否只重新索引有變動的工作表
+
+    共用其他檔案內容、或內容被其他檔案共用的檔案一律整本重新索引。
+
+    Returns:
+        bool: True 表示只重新索引部分工作表
+    """
+    sheet_parts = read_sheet_parts(file_info['file_path'])
+    if sheet_parts is None:
+        return False
+    file_info['sheet_parts'] = sheet_parts
+
+    if not (incremental and existing) or existing['content_file_id']:
+        return False
+    old_parts = db.get_sheet_parts(existing['file_id'])
+    if not old_parts or db.has_content_aliases(existing['file_id']):
+        return False
+
+    file_info['file_id'] = existing['file_id']
+    file_info['base_cell_count'] = existing['cell_count']
+    file_info['sheets'] = [name for name, crc in sheet_parts.items() if old_parts.get(name) != crc]
+    file_info['stale_sheets'] = [name for name, crc in old_parts.items() if sheet_parts.get(name) != crc]
+    return True
+
+
+def _parse_file(file_info: Dict[str, Any], batch_size: int,
+                reader_options: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+    """
+    解析單個檔案並產生事件（不含 file_info，由呼叫端補上）
+
+    Args:
+        file_info: 檔案資訊（至少包含 file_path；有 sheets 時只解析這些工作表）
+        batch_size: 每批單元格數量
+        reader_options: 傳給 read_excel_file() 的參數（例如 engine）
+
+    Yields:
+        (事件類型, 資料)
+    """
+    yield 'start', None
+    cell_count = 0
+    try:
+        cells = read_excel_file(file_info['file_path'], sheets=file_info.get('sheets'),
+                                **reader_options)
+        for batch in iter_batches(cells, batch_size):
+            cell_count += len(batch)
+            yield 'cells', batch
+    except Exception as e:
+        yield 'error', str(e)
+        return
+    yield 'done', cell_count
+
+
+def _worker_main(conn, batch_size: int, reader_options: Dict[str, Any]):
+    """
+    Worker 進程入口：從管道接收任務，將解析結果逐批送回
+
+    Args:
+        conn: 與主進程連接的管道
+        batch_size: 每批單元格數量
+        reader_options: 傳給 read_excel_file() 的參數
+    """
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+
+        task_id, file_info = task
+        for event, data in _parse_file(file_info, batch_size, reader_options):
+            conn.send((event, task_id, data))
+
+    conn.close()
+
+
+def _process_rss_mb(pid: int) -> Optional[float]:
+    """讀取進程目前的常駐記憶體（MB）；不支援 /proc 的平台回傳 None"""
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+class ParallelIndexer:
+    """
+    多進程 Excel 解析器
+
+    openpyxl 的解析是 CPU 密集且受 GIL 限制，因此每個 worker 都是獨立進程。
+    所有批次經由有界佇列送回主進程，由呼叫端以單一連接寫入資料庫；
+    寫入跟不上時佇列會塞滿，worker 便會暫停，記憶體用量維持固定。
+
+    設定了 timeout 或 max_rss_mb 時，每個 worker 都受到監控：
+    單一檔案解析超時、記憶體超量或 worker 崩潰時，只終止該 worker
+    並回報該檔案失敗，再啟動新的 worker 繼續處理其餘檔案。
+    """
+
+    def __init__(self, workers: int = 1, batch_size: int = 1000,
+                 reader_options: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None, max_rss_mb: Optional[float] = None):
+        """
+        初始化平行解析器
+
+        Args:
+            workers: worker 進程數（1 且未設定監控時在主進程中依序解析）
+            batch_size: 每批單元格數量
+            reader_options: 傳給 read_excel_file() 的參數（例如 {'engine': 'iterparse'}）
+            timeout: 單一檔案的解析時間上限（秒，不含等待寫入的時間），None 或 0 表示不限
+            max_rss_mb: worker 常駐記憶體上限（MB），None 或 0 表示不限
+        """
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.reader_options = reader_options or {}
+        self.timeout = timeout or None
+        self.max_rss_mb = max_rss_mb or None
+        self.stats = {'workers': self.workers, 'busy_seconds': 0.0, 'wall_seconds': 0.0}
+        if self.max_rss_mb and _process_rss_mb(os.getpid()) is None:
+            logger.warning("此平台無法讀取進程記憶體用量，max_rss_mb 不會生效")
+
+    def run(self, file_infos: Iterable[Dict[str, Any]]) -> Iterator[IndexEvent]:
+        """
+        解析所有檔案並依完成順序產生事件
+
+        不同檔案的事件可能交錯出現，但同一檔案的事件一定依
+        start → cells... → done/error 的順序。
+
+        Args:
+            file_infos: 檔案資訊列表
+
+        Yields:
+            (事件類型, file_info, 資料)
+        """
+        file_infos = list(file_infos)
+        workers = min(self.workers, len(file_infos))
+        supervised = bool(self.timeout or self.max_rss_mb)
+        self.stats = {'workers': max(1, workers), 'busy_seconds': 0.0, 'wall_seconds': 0.0}
+        started = time.monotonic()
+
+        try:
+            if workers < 1 or (workers == 1 and not supervised):
+                yield from self._run_inline(file_infos)
+            else:
+                yield from self._run_parallel(file_infos, workers)
+        finally:
+            self.stats['wall_seconds'] = time.monotonic() - started
+
+    @property
+    def utilization(self) -> float:
+        """上一次 run() 的 worker 使用率：解析耗時總和 / (總耗時 × worker 數)"""
+        capacity = self.stats['wall_seconds'] * self.stats['workers']
+        return min(1.0, self.stats['busy_seconds'] / capacity) if capacity else 0.0
+
+    # ========================================================================
+    # 私有輔助方法
+    # ========================================================================
+
+    def _run_inline(self, file_infos: List[Dict[str, Any]]) -> Iterator[IndexEvent]:
+        """在主進程中依序解析檔案（只計算解析本身的時間，不含呼叫端寫入）"""
+        for file_info in file_infos:
+            busy = 0.0
+            events = _parse_file(file_info, self.batch_size, self.reader_options)
+            while True:
+                started = time.monotonic()
+                item = next(events, None)
+                busy += time.monotonic() - started
+                if item is None:
+                    break
+                event, data = item
+                if event == 'done':
+                    file_info['parse_seconds'] = busy
+                    self.stats['busy_seconds'] += busy
+                elif event == 'error':
+                    self.stats['busy_seconds'] += busy
+                yield event, file_info, data
+
+    def _run_parallel(self, file_infos: List[Dict[str, Any]],
+                      workers: int) -> Iterator[IndexEvent]:
+        """以多個受監控的 worker 進程解析檔案"""
+        # 由執行緒啟動子進程，使用 spawn 避免在多執行緒狀態下 fork
+        ctx = multiprocessing.get_context('spawn')
+        events = queue.Queue(maxsize=workers * QUEUE_BATCHES_PER_WORKER)
+        tasks = iter(enumerate(file_infos))
+        tasks_lock = threading.Lock()
+        stop = threading.Event()
+        processes = {}  # worker 編號 -> 目前的進程（被終止後會換成新的）
+        stats_lock = threading.Lock()
+
+        def next_task() -> Optional[Tuple[int, Dict[str, Any]]]:
+            with tasks_lock:
+                return next(tasks, None)
+
+        def start_worker(slot: int):
+            parent_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_worker_main,
+                                  args=(child_conn, self.batch_size, self.reader_options),
+                                  daemon=True)
+            process.start()
+            child_conn.close()
+            processes[slot] = process
+            return process, parent_conn
+
+        def pump(slot: int, process, conn):
+            """每個 worker 一條執行緒：派送任務、監控 worker 並把結果轉入事件佇列"""
+            task = None
+            try:
+                task = next_task()
+                while task is not None and not stop.is_set():
+                    conn.send(task)
+                    violation = self._relay(task, process, conn, events, file_infos, stats_lock)
+                    if violation:
+                        status, message = violation
+                        file_info = file_infos[task[0]]
+                        logger.warning(f"終止 worker（{file_info['file_path']}）: {message}")
+                        process.kill()
+                        process.join()
+                        conn.close()
+                        file_info['error_status'] = status
+                        events.put(('error', file_info, message))
+                        if stop.is_set():
+                            return
+                        process, conn = start_worker(slot)
+                    task = next_task()
+                task = None
+                conn.send(None)
+            except (EOFError, OSError) as e:
+                if not stop.is_set():
+                    logger.error(f"Worker 異常結束: {e}")
+                    if task is not None:
+                        events.put(('error', file_infos[task[0]], f"Worker 異常結束: {e}"))
+            finally:
+                events.put(None)
+
+        threads = []
+        for slot in range(workers):
+            process, conn = start_worker(slot)
+            thread = threading.Thread(target=pump, args=(slot, process, conn), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        running = workers
+        try:
+            while running:
+                item = events.get()
+                if item is None:
+                    running -= 1
+                    continue
+                yield item
+        finally:
+            stop.set()
+            if running:
+                # 呼叫端提前結束（例如 Ctrl+C）：終止 worker 並清空佇列讓執行緒退出
+                for process in list(processes.values()):
+                    process.terminate()
+                while any(thread.is_alive() for thread in threads):
+                    try:
+                        events.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+            for process in list(processes.values()):
+                process.join(timeout=5)
+
+    def _relay(self, task: Tuple[int, Dict[str, Any]], process, conn, events: queue.Queue,
+               file_infos: List[Dict[str, Any]],
+               stats_lock: threading.Lock) -> Optional[Tuple[str, str]]:
+        """
+        將一個任務的事件轉入佇列，直到 done/error，期間監控 worker
+
+        只計算 worker 開始解析後等待它的時間；worker 啟動（載入模組）以及
+        佇列已滿、等待主進程寫入的時間都不算在 timeout 內。
+
+        Returns:
+            None 表示正常結束；違規時回傳 (狀態代碼, 說明)，由呼叫端終止 worker
+        """
+        busy = 0.0
+        parsing = False
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    ready = conn.poll(SUPERVISE_INTERVAL)
+                    message = conn.recv() if ready else None
+                except EOFError:
+                    process.join(timeout=1)
+                    return 'ERROR_CRASH', f"Worker 異常結束（exit code {process.exitcode}）"
+                if parsing:
+                    busy += time.monotonic() - started
+
+                if message is not None:
+                    event, task_id, data = message
+                    parsing = True
+                    if event == 'done':
+                        file_infos[task_id]['parse_seconds'] = busy
+                    events.put((event, file_infos[task_id], data))
+                    if event in ('done', 'error'):
+                        return None
+
+                if self.timeout and busy > self.timeout:
+                    return 'ERROR_TIMEOUT', f"解析超過 {self.timeout:g} 秒，已終止"
+                if self.max_rss_mb:
+                    rss_mb = _process_rss_mb(process.pid)
+                    if rss_mb and rss_mb > self.max_rss_mb:
+                        return 'ERROR_MEMORY', (f"記憶體用量 {rss_mb:.0f} MB 超過上限 "
+                                                f"{self.max_rss_mb:g} MB，已終止")
+        finally:
+            with stats_lock:
+                self.stats['busy_seconds'] += busy
@@ -0,0 +1,317 @@
+"""
+Excel 搜索系統 - 目錄監看模組
+以 Linux inotify（透過 ctypes，不需額外套件）監看索引根目錄，
+合併短時間內的連續事件後，回報需要重新索引的檔案
+"""
+import os
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import logging
+from typing import List, Dict, Any, Optional, Iterable
+
+from file_scanner import FileScanner
+
+logger = logging.getLogger(__name__)
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+# 監看的事件：寫入完成、移入移出、新增刪除（新增目錄時要補上監看）
+WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+READ_BUFFER_SIZE = 64 * 1024
+
+
+class WatchError(OSError):
+    """inotify 無法使用（非 Linux 或初始化失敗）"""
+
+
+def _load_libc():
+    """載入 libc 並設定 inotify 函式的參數型別"""
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name or not hasattr(os, 'O_NONBLOCK'):
+        raise WatchError("找不到 libc，監看模式只支援 Linux")
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise WatchError("此系統不支援 inotify，監看模式只支援 Linux")
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+class DirectoryWatcher:
+    """
+    遞迴監看目錄樹中的 Excel 檔案變動
+
+    inotify 不會遞迴，因此每個子目錄各有一個監看；新增或移入的目錄會補上監看，
+    並把其中已經存在的檔案當作變動。過濾規則與掃描相同（FileScanner.should_include 與
+    忽略規則，例如 Excel 開啟時產生的 ~$ 鎖定檔不會觸發重新索引，被忽略的目錄不會監看）。
+    監看期間修改忽略規則檔不會立即生效，要等下次重新掃描。
+
+    變動的檔案先放在待處理表中（同一個檔案只記一次），等到一段時間沒有新事件（debounce）
+    才交給 poll() 的呼叫者。待處理表有上限：超過上限或 inotify 佇列溢位時，
+    改為要求呼叫者重新掃描整個根目錄。
+
+    注意：網路磁碟（CIFS/NFS）上由其他電腦做的修改不會產生 inotify 事件，
+    這類目錄需要搭配定期重新掃描。
+    """
+
+    def __init__(self,
+                 roots: Iterable[str],
+                 scanner: FileScanner = None,
+                 debounce_seconds: float = 2.0,
+                 max_pending: int = 10000):
+        """
+        初始化監看器並監看所有根目錄
+
+        Args:
+            roots: 要監看的根目錄
+            scanner: 提供檔名過濾規則的掃描器
+            debounce_seconds: 檔案最後一個事件之後需等待的秒數，才視為變動完成
+            max_pending: 待處理檔案數上限，超過即改為要求重新掃描
+
+        Raises:
+            WatchError: inotify 無法使用
+        """
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.scanner = scanner or FileScanner()
+        self.debounce_seconds = debounce_seconds
+        self.max_pending = max_pending
+
+        self._libc = _load_libc()
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise WatchError(err, f"inotify 初始化失敗: {os.strerror(err)}")
+
+        self._wds: Dict[int, str] = {}         # 監看 ID -> 目錄路徑
+        self.pending: Dict[str, float] = {}     # 檔案路徑 -> 最後事件時間
+        self.removed_dirs: Dict[str, float] = {}  # 被刪除或移出的目錄 -> 事件時間
+        self.overflow = False                   # 需要重新掃描整個根目錄
+        self._limit_warned = False
+
+        for root in self.roots:
+            self._watch_tree(root)
+        logger.info(f"開始監看 {len(self._wds)} 個目錄: {self.roots}")
+
+    @property
+    def watch_count(self) -> int:
+        """目前監看中的目錄數"""
+        return len(self._wds)
+
+    def poll(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        """
+        讀取事件，回傳已經穩定（debounce 時間內沒有新事件）的變動
+
+        Args:
+            timeout: 沒有事件時最多等待的秒數
+
+        Returns:
+            沒有可處理的變動時回傳 None，否則回傳：
+                - paths: 變動的檔案路徑（可能已被刪除，由呼叫者判斷）
+                - removed_dirs: 被刪除或移出的目錄（其下已索引的檔案都要移除）
+                - rescan: True 表示事件有遺漏，需要重新掃描整個根目錄
+        """
+        if self._wait_readable(timeout):
+            self._read_events()
+
+        now = time.monotonic()
+        if self.overflow:
+            # 重新掃描會涵蓋所有待處理的變動，等事件平息後再處理
+            if self.pending and now - max(self.pending.values()) < self.debounce_seconds:
+                return None
+            self.pending.clear()
+            self.removed_dirs.clear()
+            self.overflow = False
+            return {'paths': [], 'removed_dirs': [], 'rescan': True}
+
+        ready = [path for path, seen in self.pending.items()
+                 if now - seen >= self.debounce_seconds]
+        removed = [path for path, seen in self.removed_dirs.items()
+                   if now - seen >= self.debounce_seconds]
+        if not ready and not removed:
+            return None
+
+        for path in ready:
+            del self.pending[path]
+        for path in removed:
+            del self.removed_dirs[path]
+        return {'paths': sorted(ready), 'removed_dirs': sorted(removed), 'rescan': False}
+
+    def close(self):
+        """停止監看"""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._wds.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ========================================================================
+    # 私有輔助方法
+    # ========================================================================
+
+    def _wait_readable(self, timeout: float) -> bool:
+        """等待 inotify 有事件可讀（被訊號中斷時視為沒有事件）"""
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+        except InterruptedError:
+            return False
+        return bool(readable)
+
+    def _read_events(self):
+        """讀出目前所有的 inotify 事件並更新待處理表"""
+        while True:
+            try:
+                data = os.read(self._fd, READ_BUFFER_SIZE)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, name_len = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+                offset += name_len
+                self._handle_event(wd, mask, name)
+
+    def _handle_event(self, wd: int, mask: int, name: str):
+        """處理單一 inotify 事件"""
+        now = time.monotonic()
+
+        if mask & IN_Q_OVERFLOW:
+            logger.warning("inotify 事件佇列溢位，將重新掃描")
+            self.overflow = True
+            return
+
+        if mask & IN_IGNORED:
+            # 目錄被刪除或監看被移除
+            self._wds.pop(wd, None)
+            return
+
+        dir_path = self._wds.get(wd)
+        if dir_path is None or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            # 目錄本身的事件由上層目錄的 IN_DELETE / IN_MOVED_FROM 處理；
+            # 根目錄被刪除或移走時只能重新掃描
+            if dir_path in self.roots:
+                logger.warning(f"監看的根目錄被刪除或移動: {dir_path}")
+                self.overflow = True
+            return
+
+        path = os.path.join(dir_path, name)
+
+        if mask & IN_ISDIR:
+            if self.scanner.is_ignored(path, self._root_of(path), is_dir=True):
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # 新目錄：補上監看，並把其中已存在的檔案當作變動
+                for file_path in self._watch_tree(path):
+                    self._add_pending(file_path, now)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self._unwatch_tree(path)
+                self.removed_dirs[path] = now
+            return
+
+        if self.scanner.should_include(name) and not self.scanner.is_ignored(path, self._root_of(path)):
+            self._add_pending(path, now)
+
+    def _root_of(self, path: str) -> str:
+        """路徑所屬的監看根目錄"""
+        for root in self.roots:
+            if path == root or path.startswith(os.path.join(root, '')):
+                return root
+        return os.path.dirname(path)
+
+    def _add_pending(self, path: str, now: float):
+        """記錄一個變動的檔案；待處理表已滿時改為要求重新掃描"""
+        if self.overflow:
+            return
+        if path not in self.pending and len(self.pending) >= self.max_pending:
+            logger.warning(f"待處理的變動超過 {self.max_pending} 個檔案，將重新掃描")
+            self.overflow = True
+            return
+        self.pending[path] = now
+
+    def _watch_tree(self, dir_path: str) -> List[str]:
+        """
+        監看目錄與其所有子目錄（先加監看再列目錄，避免漏掉期間新增的檔案）
+
+        Returns:
+            目錄樹中符合條件的檔案路徑
+        """
+        files = []
+        root = self._root_of(dir_path)
+        if dir_path != root and self.scanner.is_ignored(dir_path, root, is_dir=True):
+            return files
+        # 同一次呼叫中每個忽略規則檔只讀一次
+        ignore_cache = {}
+        stack = [dir_path]
+        while stack:
+            current = stack.pop()
+            if not self._add_watch(current):
+                continue
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not self.scanner.is_ignored(entry.path, root, is_dir=True,
+                                                               cache=ignore_cache):
+                                    stack.append(entry.path)
+                            elif self.scanner.should_include(entry.name) and entry.is_file() \
+                                    and not self.scanner.is_ignored(entry.path, root, cache=ignore_cache):
+                                files.append(entry.path)
+                        except OSError:
+                            continue
+            except OSError as e:
+                logger.warning(f"無法讀取目錄: {current}, 錯誤: {e}")
+        return files
+
+    def _add_watch(self, dir_path: str) -> bool:
+        """對單一目錄加上 inotify 監看"""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC and not self._limit_warned:
+                self._limit_warned = True
+                logger.warning("已達 inotify 監看數上限，部分目錄不會被監看"
+                               "（可調高 /proc/sys/fs/inotify/max_user_watches）")
+            elif err != errno.ENOSPC:
+                logger.warning(f"無法監看目錄: {dir_path}, 錯誤: {os.strerror(err)}")
+            return False
+        self._wds[wd] = dir_path
+        return True
+
+    def _unwatch_tree(self, dir_path: str):
+        """移除目錄與其子目錄的監看（目錄被移走後，舊的監看對應的路徑已不正確）"""
+        prefix = os.path.join(dir_path, '')
+        for wd, path in list(self._wds.items()):
+            if path == dir_path or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                del self._wds[wd]
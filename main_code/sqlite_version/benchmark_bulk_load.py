@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+SQLite 批量載入效能比較
+以相同的檔案分別用一般模式與批量載入模式（index --bulk）建立新的資料庫，
+比較耗時並確認兩個資料庫的內容與全文檢索結果一致
+
+使用方法：
+    python3 benchmark_bulk_load.py ./Sharepoint
+    python3 benchmark_bulk_load.py ./Sharepoint --workers 4 --engine iterparse
+"""
+import os
+import time
+import shutil
+import tempfile
+import click
+from contextlib import nullcontext
+
+from database import Database
+from file_scanner import FileScanner
+from indexer import plan_index
+from excel_reader import READER_ENGINES
+from excel_search_cli import index_planned
+from config import INDEX_CONFIG
+
+# 比對全文檢索結果時抽樣的詞數
+SAMPLE_TERMS = 20
+
+
+def build(db_path, files, bulk, workers, engine):
+    """
+    建立一個新的資料庫並索引所有檔案
+
+    Returns:
+        (秒數, 統計結果)
+    """
+    db = Database(db_path)
+    start = time.perf_counter()
+    plan = plan_index(db, [dict(f) for f in files], compare_mtime=False)
+    with db.bulk_load() if bulk else nullcontext():
+        result = index_planned(db, plan, workers=workers, engine=engine)
+    elapsed = time.perf_counter() - start
+    db.close()
+    return elapsed, result
+
+
+def snapshot(db_path):
+    """讀取資料庫的單元格數、FTS5 記錄數與抽樣詞的搜索結果"""
+    db = Database(db_path)
+    cursor = db.conn.cursor()
+    cell_count = cursor.execute('SELECT COUNT(*) FROM cells').fetchone()[0]
+    fts_count = cursor.execute('SELECT COUNT(*) FROM content_fts').fetchone()[0]
+
+    terms = [row[0] for row in cursor.execute('''
+        SELECT DISTINCT value FROM cells
+        WHERE value GLOB '[A-Za-z]*' AND value NOT GLOB '*[^A-Za-z0-9]*'
+        ORDER BY value LIMIT ?
+    ''', (SAMPLE_TERMS,))]
+    matches = {}
+    for term in terms:
+        matches[term] = sorted(tuple(row) for row in cursor.execute('''
+            SELECT f.file_path, c.sheet_name, c.cell_location
+            FROM content_fts c JOIN files f ON f.file_id = c.file_id
+            WHERE content_fts MATCH ?
+        ''', (f'"{term}"',)))
+    db.close()
+    return cell_count, fts_count, matches
+
+
+@click.command()
+@click.argument('path', type=click.Path(exists=True, file_okay=False))
+@click.option('--workers', default=1, type=click.IntRange(min=1), help='平行解析的進程數')
+@click.option('--engine', type=click.Choice(READER_ENGINES), default=INDEX_CONFIG['reader_engine'],
+              help='Excel 讀取引擎')
+def main(path, workers, engine):
+    """比較一般模式與批量載入模式建立資料庫的速度"""
+    files = FileScanner().scan_directory(path, show_progress=False)
+    if not files:
+        click.echo("沒有找到 Excel 檔案")
+        return
+
+    total_size = sum(f['file_size'] for f in files)
+    click.echo(f"檔案數: {len(files)}，總大小: {total_size / (1024 * 1024):.1f} MB，"
+               f"引擎: {engine}，worker: {workers}")
+    click.echo()
+
+    work_dir = tempfile.mkdtemp(prefix='bulk_benchmark_')
+    try:
+        timings = {}
+        snapshots = {}
+        for mode, bulk in (('一般模式', False), ('批量載入', True)):
+            db_path = os.path.join(work_dir, f"{'bulk' if bulk else 'normal'}.db")
+            elapsed, result = build(db_path, files, bulk, workers, engine)
+            timings[mode] = elapsed
+            snapshots[mode] = snapshot(db_path)
+            click.echo(f"{mode}: {elapsed:.2f} 秒，{result['cells']:,} 個單元格，"
+                       f"資料庫 {os.path.getsize(db_path) / (1024 * 1024):.1f} MB")
+
+        click.echo("-" * 60)
+        normal, bulk = timings['一般模式'], timings['批量載入']
+        click.echo(f"加速: {normal / bulk:.2f}x" if bulk else "加速: -")
+
+        click.echo()
+        if snapshots['一般模式'] == snapshots['批量載入']:
+            click.secho("✅ 兩種模式的單元格、全文索引與抽樣搜索結果完全一致", fg='green')
+        else:
+            normal_snapshot, bulk_snapshot = snapshots['一般模式'], snapshots['批量載入']
+            click.secho("❌ 兩種模式的結果不一致:", fg='red')
+            click.echo(f"   單元格: {normal_snapshot[0]:,} / {bulk_snapshot[0]:,}")
+            click.echo(f"   全文索引: {normal_snapshot[1]:,} / {bulk_snapshot[1]:,}")
+            for term in normal_snapshot[2]:
+                if normal_snapshot[2][term] != bulk_snapshot[2].get(term):
+                    click.echo(f"   搜索結果不同: {term}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
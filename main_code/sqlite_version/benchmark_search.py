@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+SQLite 搜索效能比較
+從現有資料庫隨機抽取單元格中的詞、詞的前綴（runn）、詞中間的片段（PN3004 中的 3004，
+沒有 trigram 索引時 fts 找不到而 like 找得到）與不存在的詞（兩種模式都沒有結果），
+分別以全文索引（fts）與 LIKE 逐筆比對搜索，比較每個詞與每種詞的查詢延遲與結果數
+（有 trigram 索引時兩種模式都由索引找出包含片段的單元格）
+
+使用方法：
+    python3 benchmark_search.py
+    python3 benchmark_search.py --db ./excel_search.db --terms 50 --limit 100
+"""
+import re
+import random
+import statistics
+import time
+import click
+
+from database import Database
+from search_engine import search_cells, SEARCH_MODES
+from config import DATABASE_PATH
+
+# 抽樣時每個詞最多嘗試幾個隨機單元格
+MAX_SAMPLE_ATTEMPTS = 50
+
+_TERM_PATTERN = re.compile(r'[A-Za-z0-9]{3,}')
+
+# 抽樣的詞依序輪流取這幾種：整個詞、詞的前綴、詞中間的片段、不存在的詞
+TERM_KINDS = ('詞', '前綴', '片段', '無結果')
+
+# 接在詞後面造出不存在的詞
+NO_HIT_SUFFIX = 'qzxj'
+
+# 前綴與片段至少幾個字元（trigram 索引的最短長度）
+MIN_FRAGMENT_LENGTH = 3
+
+
+def _make_term(word, kind, rng):
+    """
+    由一個詞取出指定種類的搜索詞
+
+    Returns:
+        搜索詞；詞太短取不出前綴或片段時回傳 None
+    """
+    if kind == '詞':
+        return word
+    if kind == '無結果':
+        return word + NO_HIT_SUFFIX
+    if len(word) <= MIN_FRAGMENT_LENGTH:
+        return None
+    if kind == '前綴':
+        return word[:rng.randint(MIN_FRAGMENT_LENGTH, len(word) - 1)]
+    start = rng.randint(1, len(word) - MIN_FRAGMENT_LENGTH)
+    return word[start:rng.randint(start + MIN_FRAGMENT_LENGTH, len(word))]
+
+
+def sample_terms(db, count, seed):
+    """
+    以隨機 cell_id 抽取單元格並取出其中的英數詞、詞的前綴或片段（只做主鍵查詢，不掃描 cells）
+
+    Returns:
+        [(詞, 種類)]（不重複，可能少於 count）
+    """
+    cursor = db.conn.cursor()
+    max_cell_id = cursor.execute('SELECT MAX(cell_id) FROM cells').fetchone()[0]
+    if not max_cell_id:
+        return []
+
+    rng = random.Random(seed)
+    terms = []
+    seen = set()
+    for _ in range(count * MAX_SAMPLE_ATTEMPTS):
+        if len(terms) >= count:
+            break
+        row = cursor.execute('SELECT value FROM cells WHERE cell_id >= ? LIMIT 1',
+                             (rng.randint(1, max_cell_id),)).fetchone()
+        words = _TERM_PATTERN.findall(row[0]) if row and row[0] else []
+        if words:
+            kind = TERM_KINDS[len(terms) % len(TERM_KINDS)]
+            term = _make_term(rng.choice(words), kind, rng)
+            if term and term not in seen:
+                seen.add(term)
+                terms.append((term, kind))
+    return terms
+
+
+def time_search(db, term, mode, limit, repeat):
+    """
+    重複搜索 repeat 次
+
+    Returns:
+        (最短耗時毫秒, 結果數, 實際使用的搜索模式)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results, used_mode = search_cells(db.conn, term, limit=limit, mode=mode)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(results), used_mode
+
+
+def percentile(values, fraction):
+    """取排序後位於 fraction 位置的值"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+@click.command()
+@click.option('--db', 'db_path', default=DATABASE_PATH, type=click.Path(exists=True, dir_okay=False),
+              help='資料庫路徑')
+@click.option('--terms', 'term_count', default=20, type=click.IntRange(min=1), help='抽樣詞數')
+@click.option('--limit', default=20, type=click.IntRange(min=1), help='每次搜索最多回傳幾筆')
+@click.option('--repeat', default=3, type=click.IntRange(min=1), help='每個詞重複搜索幾次（取最短耗時）')
+@click.option('--seed', default=0, help='抽樣用的亂數種子')
+def main(db_path, term_count, limit, repeat, seed):
+    """比較全文索引搜索與 LIKE 逐筆比對的延遲"""
+    db = Database(db_path)
+    stats = db.get_stats()
+    click.echo(f"資料庫: {db_path}，{stats['cell_count']:,} 個單元格，{stats['db_size_mb']} MB，"
+               f"trigram 索引: {'有（片段由索引找出候選）' if stats['trigram_index'] else '無（fts 只比對詞的開頭，like 逐筆掃描）'}")
+
+    terms = sample_terms(db, term_count, seed)
+    if not terms:
+        click.echo("沒有可抽樣的詞")
+        db.close()
+        return
+    click.echo(f"抽樣詞數: {len(terms)}，limit: {limit}，每詞重複 {repeat} 次")
+    click.echo()
+
+    click.echo(f"{'關鍵詞':<20}{'種類':<6}"
+               + ''.join(f"{mode + ' ms':>12}{mode + ' 筆數':>10}" for mode in SEARCH_MODES))
+    click.echo("-" * 70)
+    timings = {mode: [] for mode in SEARCH_MODES}
+    # 各種類的詞數，以及兩種模式結果數不同的詞數
+    kind_totals = {kind: 0 for kind in TERM_KINDS}
+    kind_mismatches = {kind: 0 for kind in TERM_KINDS}
+    for term, kind in terms:
+        line = f"{term[:20]:<20}{kind:<6}"
+        hit_counts = set()
+        for mode in SEARCH_MODES:
+            elapsed, hits, used_mode = time_search(db, term, mode, limit, repeat)
+            timings[mode].append((elapsed, kind))
+            hit_counts.add(hits)
+            marker = '' if used_mode == mode else '*'
+            line += f"{elapsed:>11.1f}{marker or ' '}{hits:>10}"
+        kind_totals[kind] += 1
+        if len(hit_counts) > 1:
+            kind_mismatches[kind] += 1
+            line += "  ≠"
+        click.echo(line)
+
+    click.echo("-" * 70)
+    for mode in SEARCH_MODES:
+        values = [elapsed for elapsed, _ in timings[mode]]
+        click.echo(f"{mode:<6} 中位數 {statistics.median(values):>9.1f} ms   "
+                   f"p95 {percentile(values, 0.95):>9.1f} ms   最慢 {max(values):>9.1f} ms")
+
+    fts_median = statistics.median(elapsed for elapsed, _ in timings['fts'])
+    like_median = statistics.median(elapsed for elapsed, _ in timings['like'])
+    click.echo(f"加速（中位數）: {like_median / fts_median:.1f}x" if fts_median else "加速: -")
+    click.echo()
+    click.echo(f"{'種類':<8}" + ''.join(f"{mode + ' 中位數 ms':>16}" for mode in SEARCH_MODES))
+    for kind in TERM_KINDS:
+        if not kind_totals[kind]:
+            continue
+        click.echo(f"{kind:<8}" + ''.join(
+            f"{statistics.median(e for e, k in timings[mode] if k == kind):>16.1f}"
+            for mode in SEARCH_MODES))
+    click.echo("結果數不同（≠）: " + '，'.join(f"{kind} {kind_mismatches[kind]} / {kind_totals[kind]}"
+                                           for kind in TERM_KINDS))
+    click.echo("* 表示全文索引無法比對該詞，實際改用子字串比對")
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,26 @@ from config import DATABASE_PATH, DATABASE_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# 批量載入（bulk_load）期間暫不維護的 cells 二級索引；載入完成後才建立
+# idx_cells_file_id 保留，刪除文件與更新單元格計數都需要它
+DEFERRED_INDEXES = [
+    ('idx_cells_value_lower', "CREATE INDEX IF NOT EXISTS idx_cells_value_lower ON cells(value_lower)"),
+    ('idx_cells_sheet', "CREATE INDEX IF NOT EXISTS idx_cells_sheet ON cells(file_id, sheet_name)"),
+    ('idx_cells_row', "CREATE INDEX IF NOT EXISTS idx_cells_row ON cells(file_id, sheet_name, row_num)"),
+    ('idx_merged', "CREATE INDEX IF NOT EXISTS idx_merged ON cells(merged_range) WHERE is_merged = TRUE"),
+    ('idx_cells_num', "CREATE INDEX IF NOT EXISTS idx_cells_num ON cells(value_type, value_num) WHERE value_num IS NOT NULL"),
+]
+
+# PRAGMA user_version 記錄的資料庫結構版本
+#   1: content_fts 的 rowid 等於 cells.cell_id（搜索時以此對應回單元格）
+#   2: content_fts 不做 porter 詞幹化（前綴查詢 runn* 才能比對到 running）
+FTS_ROWID_VERSION = 1
+FTS_UNSTEMMED_VERSION = 2
+SCHEMA_VERSION = FTS_UNSTEMMED_VERSION
+
+# trigram 分詞器需要的 SQLite 版本（可選的子字串索引 content_trigram，見 create_trigram_index()）
+TRIGRAM_MIN_SQLITE = (3, 34, 0)
+
 
 class Database:
     """數據庫操作類"""
@@ -26,6 +46,10 @@ class Database:
         """
         self.db_path = db_path
         self.conn = None
+        self._session = None       # 寫入會話狀態（見 write_session()）
+        self._savepoint_seq = 0
+        self._bulk = False         # 批量載入中（見 bulk_load()）
+        self._trigram = False      # 是否有 content_trigram 子字串索引
         self._initialize_connection()
         self.initialize_db()
 
@@ -33,8 +57,10 @@ class Database:
         """初始化數據庫連接並設置 PRAGMA 優化"""
         self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row  # 使結果可以用字段名訪問
+        self._apply_pragmas()
 
-        # 應用 PRAGMA 優化設置
+    def _apply_pragmas(self):
+        """應用 DATABASE_CONFIG 中的 PRAGMA 優化設置"""
         cursor = self.conn.cursor()
         pragma_settings = DATABASE_CONFIG.get('pragma_settings', {})
 
@@ -60,10 +86,20 @@ class Database:
                 last_modified TIMESTAMP NOT NULL,
                 file_size INTEGER,
                 cell_count INTEGER DEFAULT 0,
-                indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                indexed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                content_hash TEXT,
+                content_file_id INTEGER,
+                parse_seconds REAL
             )
         ''')
 
+        # 舊版數據庫補上新增字段
+        self._ensure_columns('files', {
+            'content_hash': 'TEXT',         # 內容指紋（zip 中央目錄 CRC + 文件大小）
+            'content_file_id': 'INTEGER',   # 內容相同時，實際保存單元格的文件 ID
+            'parse_seconds': 'REAL',        # 上次完整解析的耗時（用於排程）
+        })
+
         # 2. 單元格詳細信息表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS cells (
@@ -77,11 +113,23 @@ class Database:
                 value_lower TEXT,
                 is_merged BOOLEAN DEFAULT FALSE,
                 merged_range TEXT,
+                value_type TEXT,
+                value_num REAL,
                 FOREIGN KEY (file_id) REFERENCES files(file_id) ON DELETE CASCADE
             )
         ''')
 
+        self._ensure_columns('cells', {
+            'value_type': 'TEXT',   # 原始類型：text / number / date / time / bool
+            'value_num': 'REAL',    # 數值；日期為 1970-01-01 起的秒數
+        })
+
         # 3. FTS5 全文搜索虛擬表
+        # 舊版以 porter 詞幹化，索引中只有 run 而沒有 running，前綴查詢 runn* 找不到；
+        # 刪除後以 unicode61 重建
+        fts_stemmed = self._schema_version() < FTS_UNSTEMMED_VERSION and self._fts_stemmed()
+        if fts_stemmed:
+            cursor.execute('DROP TABLE content_fts')
         try:
             cursor.execute('''
                 CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
@@ -89,7 +137,7 @@ class Database:
                     sheet_name,
                     cell_location,
                     cell_value,
-                    tokenize='porter unicode61'
+                    tokenize='unicode61'
                 )
             ''')
             logger.info("FTS5 全文索引表創建成功")
@@ -97,13 +145,91 @@ class Database:
             logger.error(f"創建 FTS5 表失敗: {e}")
             raise
 
-        # 4. 創建索引以加速查詢
+        # 可選的 trigram 子字串索引（外部內容表，只保存索引，內容讀自 cells）
+        self._trigram = self.has_trigram_index()
+
+        # 4. 工作表部件 CRC（用於只重新索引有變動的工作表）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sheet_parts (
+                file_id INTEGER NOT NULL,
+                sheet_name TEXT NOT NULL,
+                part_crc INTEGER NOT NULL,
+                shared_crc INTEGER NOT NULL,
+                PRIMARY KEY (file_id, sheet_name),
+                FOREIGN KEY (file_id) REFERENCES files(file_id) ON DELETE CASCADE
+            )
+        ''')
+
+        # 5. 失敗文件（結構損壞或解析失敗，文件未變動前不再重試）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS failed_files (
+                file_path TEXT PRIMARY KEY,
+                file_size INTEGER,
+                mtime REAL,
+                status TEXT NOT NULL,
+                error TEXT,
+                failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # 6. 索引執行記錄（中斷後可用 index --resume 續跑）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS index_runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                root_path TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                file_count INTEGER DEFAULT 0,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS run_files (
+                run_id INTEGER NOT NULL,
+                file_path TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                cell_watermark INTEGER,
+                PRIMARY KEY (run_id, file_path),
+                FOREIGN KEY (run_id) REFERENCES index_runs(run_id) ON DELETE CASCADE
+            )
+        ''')
+        self._ensure_columns('run_files', {
+            'cell_watermark': 'INTEGER',    # 重新索引開始時的 last_cell_id()，中斷時只回滾其後的單元格
+        })
+
+        # 7. 目錄快照（目錄 mtime 未變時，掃描直接沿用其中的子目錄與文件）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_dirs (
+                dir_path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                scanned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_entries (
+                dir_path TEXT NOT NULL,
+                name TEXT NOT NULL,
+                is_dir INTEGER NOT NULL DEFAULT 0,
+                file_size INTEGER,
+                mtime REAL,
+                PRIMARY KEY (dir_path, name),
+                FOREIGN KEY (dir_path) REFERENCES scan_dirs(dir_path) ON DELETE CASCADE
+            )
+        ''')
+
+        # 8. 創建索引以加速查詢
+        # 延後建立的索引不存在卻已有單元格，表示上次批量載入中途中斷，FTS5 表需要重建
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?",
+                       (DEFERRED_INDEXES[0][0],))
+        bulk_interrupted = cursor.fetchone() is None and self.has_cells()
+
         indexes = [
             "CREATE INDEX IF NOT EXISTS idx_cells_file_id ON cells(file_id)",
-            "CREATE INDEX IF NOT EXISTS idx_cells_value_lower ON cells(value_lower)",
-            "CREATE INDEX IF NOT EXISTS idx_cells_sheet ON cells(file_id, sheet_name)",
-            "CREATE INDEX IF NOT EXISTS idx_cells_row ON cells(file_id, sheet_name, row_num)",
-            "CREATE INDEX IF NOT EXISTS idx_merged ON cells(merged_range) WHERE is_merged = TRUE",
+            *[idx_sql for _, idx_sql in DEFERRED_INDEXES],
+            "CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash)",
+            "CREATE INDEX IF NOT EXISTS idx_files_content_file_id ON files(content_file_id)",
+            "CREATE INDEX IF NOT EXISTS idx_run_files_state ON run_files(run_id, state)",
         ]
 
         for idx_sql in indexes:
@@ -112,9 +238,89 @@ class Database:
             except Exception as e:
                 logger.warning(f"創建索引失敗: {e}")
 
+        if bulk_interrupted:
+            logger.warning("上次批量載入未完成，重建全文索引")
+            self._rebuild_fts()
+        elif self._schema_version() < FTS_ROWID_VERSION and self.has_cells():
+            logger.warning("舊版全文索引無法對應回單元格，重建全文索引（只需一次）")
+            self._rebuild_fts()
+        elif fts_stemmed and self.has_cells():
+            logger.warning("舊版全文索引使用詞幹化，前綴查詢比對不到原詞，重建全文索引（只需一次）")
+            self._rebuild_fts()
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
         self.conn.commit()
         logger.info(f"數據庫初始化完成: {self.db_path}")
 
+    def has_trigram_index(self) -> bool:
+        """是否已建立 content_trigram 子字串索引"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_trigram'")
+        return cursor.fetchone() is not None
+
+    def create_trigram_index(self):
+        """
+        建立 trigram 子字串索引並由 cells 表填入（已存在時重建）
+
+        索引以 cells 為外部內容表（rowid 即 cell_id），不重複保存單元格內容；
+        之後寫入與刪除單元格時會一併維護。
+
+        Raises:
+            RuntimeError: SQLite 版本不支援 trigram 分詞器
+        """
+        if sqlite3.sqlite_version_info < TRIGRAM_MIN_SQLITE:
+            raise RuntimeError(f"trigram 索引需要 SQLite "
+                               f"{'.'.join(map(str, TRIGRAM_MIN_SQLITE))} 以上，"
+                               f"目前版本: {sqlite3.sqlite_version}")
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS content_trigram USING fts5(
+                value,
+                content='cells',
+                content_rowid='cell_id',
+                tokenize='trigram'
+            )
+        ''')
+        self._trigram = True
+        logger.info("建立 trigram 子字串索引...")
+        self._rebuild_trigram()
+        self.conn.commit()
+        logger.info("trigram 子字串索引建立完成")
+
+    def drop_trigram_index(self):
+        """刪除 trigram 子字串索引"""
+        self.conn.execute('DROP TABLE IF EXISTS content_trigram')
+        self.conn.commit()
+        self._trigram = False
+
+    def _schema_version(self) -> int:
+        """資料庫結構版本（PRAGMA user_version，舊版資料庫為 0）"""
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def _fts_stemmed(self) -> bool:
+        """現有的 content_fts 是否以 porter 詞幹化（舊版資料庫）"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'content_fts'")
+        result = cursor.fetchone()
+        return bool(result) and 'porter' in result[0]
+
+    def _ensure_columns(self, table: str, columns: Dict[str, str]):
+        """
+        為舊版數據庫的表補上缺少的字段
+
+        Args:
+            table: 表名
+            columns: 字段名 -> 字段定義
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row['name'] for row in cursor.fetchall()}
+
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+                logger.info(f"數據庫升級: {table} 新增字段 {name}")
+
     @contextmanager
     def transaction(self):
         """事務上下文管理器"""
@@ -126,12 +332,195 @@ class Database:
             logger.error(f"事務回滾: {e}")
             raise
 
+    # ========================================================================
+    # 寫入會話
+    # ========================================================================
+
+    @contextmanager
+    def write_session(self, group_size: int = DATABASE_CONFIG['batch_commit_size']):
+        """
+        寫入會話：期間各寫入方法不再各自提交，改由 finish_file() 每 group_size 個文件提交一次
+
+        離開會話時提交剩餘的寫入；發生例外時回滾尚未提交的部分。
+        巢狀使用時，內層會話直接沿用外層的事務。
+
+        Args:
+            group_size: 每多少個文件提交一次
+        """
+        if self._session is not None:
+            yield self
+            return
+
+        self._session = {'group_size': max(1, group_size), 'pending': 0}
+        try:
+            yield self
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            self._session = None
+
+    @contextmanager
+    def savepoint(self):
+        """
+        以 SAVEPOINT 包住一組寫入：區塊內出錯時只回滾這一段，
+        同一事務中其他文件已寫入的內容不受影響
+        """
+        name = self.begin_savepoint()
+        try:
+            yield
+        except BaseException:
+            self.rollback_savepoint(name)
+            raise
+        self.release_savepoint(name)
+
+    def begin_savepoint(self) -> str:
+        """
+        建立 SAVEPOINT（用於跨越多個步驟、無法以 with 包住的一組寫入）
+
+        在 release_savepoint() 或 rollback_savepoint() 之前不可提交（包括 finish_file()），
+        提交會一併結束所有 SAVEPOINT。
+
+        Returns:
+            SAVEPOINT 名稱
+        """
+        if not self.conn.in_transaction:
+            # 先開啟事務，避免 RELEASE 最外層的 SAVEPOINT 時直接提交
+            self.conn.execute('BEGIN')
+        self._savepoint_seq += 1
+        name = f'sp_{self._savepoint_seq}'
+        self.conn.execute(f'SAVEPOINT {name}')
+        return name
+
+    def release_savepoint(self, name: str):
+        """保留 SAVEPOINT 之後的寫入並結束它"""
+        self.conn.execute(f'RELEASE {name}')
+
+    def rollback_savepoint(self, name: str):
+        """撤銷 SAVEPOINT 之後的所有寫入並結束它"""
+        self.conn.execute(f'ROLLBACK TO {name}')
+        self.conn.execute(f'RELEASE {name}')
+
+    def finish_file(self):
+        """寫入會話中每處理完一個文件呼叫一次，累積到 group_size 個時提交"""
+        if self._session is None:
+            return
+        self._session['pending'] += 1
+        if self._session['pending'] >= self._session['group_size']:
+            self.conn.commit()
+            self._session['pending'] = 0
+
+    @contextmanager
+    def bulk_load(self, group_size: int = DATABASE_CONFIG['bulk_commit_size']):
+        """
+        首次建立用的批量載入模式（只能用於尚無單元格的數據庫）
+
+        期間刪除 DEFERRED_INDEXES、不寫入 FTS5 表、synchronous=OFF，並以大事務寫入。
+        結束時（包括發生例外）建立索引、一次填入 FTS5 表並 optimize，
+        再恢復 DATABASE_CONFIG 的 PRAGMA 設定。
+
+        Args:
+            group_size: 每多少個文件提交一次
+
+        Raises:
+            ValueError: 數據庫已有單元格
+        """
+        if self.has_cells():
+            raise ValueError("批量載入只能用於尚未索引任何單元格的數據庫")
+
+        cursor = self.conn.cursor()
+        for index_name, _ in DEFERRED_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
+        self.conn.commit()
+        cursor.execute('PRAGMA synchronous = OFF')
+        logger.info("進入批量載入模式")
+
+        self._bulk = True
+        try:
+            with self.write_session(group_size):
+                yield self
+        finally:
+            self._bulk = False
+            try:
+                self._finish_bulk_load()
+            finally:
+                self._apply_pragmas()
+
+    def _finish_bulk_load(self):
+        """建立延後的索引、填入 FTS5 表並合併其索引段"""
+        cursor = self.conn.cursor()
+        logger.info("建立 cells 索引...")
+        for _, idx_sql in DEFERRED_INDEXES:
+            cursor.execute(idx_sql)
+
+        logger.info("建立全文索引...")
+        self._rebuild_fts()
+        self.conn.commit()
+        cursor.execute('ANALYZE')
+        logger.info("批量載入完成")
+
+    def _rebuild_fts(self):
+        """由 cells 表重新填入 FTS5 表並合併其索引段（不提交）"""
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM content_fts')
+        cursor.execute('''
+            INSERT INTO content_fts (rowid, file_id, sheet_name, cell_location, cell_value)
+            SELECT cell_id, file_id, sheet_name, cell_location, value FROM cells
+        ''')
+        cursor.execute("INSERT INTO content_fts (content_fts) VALUES ('optimize')")
+        if self._trigram:
+            self._rebuild_trigram()
+
+    def _rebuild_trigram(self):
+        """由 cells 表重建 trigram 索引並合併其索引段（不提交）"""
+        cursor = self.conn.cursor()
+        cursor.execute("INSERT INTO content_trigram (content_trigram) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO content_trigram (content_trigram) VALUES ('optimize')")
+
+    def _delete_fts_rows(self, condition: str, params: Tuple):
+        """
+        刪除 cells 中符合條件的單元格在全文索引中的記錄（必須在刪除單元格之前呼叫）
+
+        Args:
+            condition: cells 表的 WHERE 條件
+            params: 條件參數
+        """
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+            DELETE FROM content_fts WHERE rowid IN (SELECT cell_id FROM cells WHERE {condition})
+        ''', params)
+        if self._trigram:
+            # 外部內容表要以原本的內容發出 delete 命令
+            cursor.execute(f'''
+                INSERT INTO content_trigram (content_trigram, rowid, value)
+                SELECT 'delete', cell_id, value FROM cells WHERE {condition}
+            ''', params)
+
+    def last_cell_id(self) -> int:
+        """目前最大的 cell_id（cell_id 只增不減，之後寫入的單元格都大於它）"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COALESCE(MAX(cell_id), 0) FROM cells')
+        return cursor.fetchone()[0]
+
+    def has_cells(self) -> bool:
+        """數據庫中是否已有任何單元格"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT 1 FROM cells LIMIT 1')
+        return cursor.fetchone() is not None
+
+    def _commit(self):
+        """寫入方法的提交點：寫入會話中延後到 finish_file() 或會話結束"""
+        if self._session is None:
+            self.conn.commit()
+
     # ========================================================================
     # 文件操作
     # ========================================================================
 
     def add_file(self, file_path: str, file_name: str,
-                 last_modified: datetime, file_size: int) -> int:
+                 last_modified: datetime, file_size: int,
+                 content_hash: Optional[str] = None) -> int:
         """
         添加或更新文件記錄
 
@@ -140,6 +529,7 @@ class Database:
             file_name: 文件名
             last_modified: 最後修改時間
             file_size: 文件大小（字節）
+            content_hash: 內容指紋（可選）
 
         Returns:
             file_id: 文件 ID
@@ -149,11 +539,11 @@ class Database:
         # 使用 INSERT OR REPLACE 來處理重複
         cursor.execute('''
             INSERT OR REPLACE INTO files
-            (file_path, file_name, last_modified, file_size, indexed_at)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (file_path, file_name, last_modified, file_size, datetime.now()))
+            (file_path, file_name, last_modified, file_size, indexed_at, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (file_path, file_name, last_modified, file_size, datetime.now(), content_hash))
 
-        self.conn.commit()
+        self._commit()
         file_id = cursor.lastrowid
 
         # 如果是更新（lastrowid 為 0），則查詢 file_id
@@ -180,6 +570,141 @@ class Database:
         result = cursor.fetchone()
         return result[0] if result else None
 
+    def get_file_by_path(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        獲取文件的完整記錄
+
+        Args:
+            file_path: 文件路徑
+
+        Returns:
+            文件記錄或 None
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT file_id, file_path, file_name, last_modified, file_size,
+                   cell_count, indexed_at, content_hash, content_file_id, parse_seconds
+            FROM files
+            WHERE file_path = ?
+        ''', (file_path,))
+        result = cursor.fetchone()
+        if not result:
+            return None
+        record = dict(result)
+        # last_modified 以 ISO 字串保存，轉回 datetime 才能與檔案的修改時間比較
+        if record['last_modified']:
+            record['last_modified'] = datetime.fromisoformat(record['last_modified'])
+        return record
+
+    def find_content_owner(self, content_hash: str,
+                           exclude_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        查找保存了相同內容單元格的文件
+
+        Args:
+            content_hash: 內容指紋
+            exclude_path: 排除的文件路徑（通常是自己）
+
+        Returns:
+            文件記錄或 None
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT file_id, file_path, cell_count
+            FROM files
+            WHERE content_hash = ? AND content_file_id IS NULL
+              AND cell_count > 0 AND file_path != ?
+            ORDER BY file_id
+            LIMIT 1
+        ''', (content_hash, exclude_path or ''))
+        result = cursor.fetchone()
+        return dict(result) if result else None
+
+    def link_file_content(self, file_id: int, owner_id: int):
+        """
+        將文件指向另一個內容相同的文件，共用其單元格
+
+        Args:
+            file_id: 文件 ID（不保存單元格）
+            owner_id: 保存單元格的文件 ID
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE files
+            SET content_file_id = ?,
+                cell_count = (SELECT cell_count FROM files WHERE file_id = ?)
+            WHERE file_id = ?
+        ''', (owner_id, owner_id, file_id))
+        self._commit()
+        logger.debug(f"文件 ID {file_id} 共用文件 ID {owner_id} 的內容")
+
+    def update_file_metadata(self, file_id: int, last_modified: datetime, file_size: int,
+                             content_hash: Optional[str] = None):
+        """
+        只更新文件的修改時間和大小（內容未變，或只重新索引部分工作表）
+
+        Args:
+            file_id: 文件 ID
+            last_modified: 最後修改時間
+            file_size: 文件大小（字節）
+            content_hash: 新的內容指紋（可選，None 表示不變）
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE files
+            SET last_modified = ?, file_size = ?, content_hash = COALESCE(?, content_hash)
+            WHERE file_id = ?
+        ''', (last_modified, file_size, content_hash, file_id))
+        self._commit()
+
+    def has_content_aliases(self, file_id: int) -> bool:
+        """
+        檢查是否有其他文件共用這個文件的單元格
+
+        Args:
+            file_id: 文件 ID
+
+        Returns:
+            True 有共用的文件
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT 1 FROM files WHERE content_file_id = ? LIMIT 1', (file_id,))
+        return cursor.fetchone() is not None
+
+    def get_sheet_parts(self, file_id: int) -> Dict[str, Tuple[int, int]]:
+        """
+        獲取上次索引時各工作表的部件 CRC
+
+        Args:
+            file_id: 文件 ID
+
+        Returns:
+            工作表名 -> (工作表部件 CRC, 共用部件 CRC)
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT sheet_name, part_crc, shared_crc FROM sheet_parts WHERE file_id = ?
+        ''', (file_id,))
+        return {row['sheet_name']: (row['part_crc'], row['shared_crc'])
+                for row in cursor.fetchall()}
+
+    def save_sheet_parts(self, file_id: int, sheet_parts: Dict[str, Tuple[int, int]]):
+        """
+        記錄各工作表的部件 CRC（取代舊記錄）
+
+        Args:
+            file_id: 文件 ID
+            sheet_parts: 工作表名 -> (工作表部件 CRC, 共用部件 CRC)
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM sheet_parts WHERE file_id = ?', (file_id,))
+        cursor.executemany('''
+            INSERT INTO sheet_parts (file_id, sheet_name, part_crc, shared_crc)
+            VALUES (?, ?, ?, ?)
+        ''', [(file_id, name, part_crc, shared_crc)
+              for name, (part_crc, shared_crc) in sheet_parts.items()])
+        self._commit()
+
     def file_needs_reindex(self, file_path: str, current_modified: datetime) -> bool:
         """
         檢查文件是否需要重新索引
@@ -226,23 +751,46 @@ class Database:
 
         return [dict(row) for row in cursor.fetchall()]
 
+    def get_files_under_path(self, base_path: str) -> List[Dict[str, Any]]:
+        """
+        獲取指定路徑下所有已索引的文件
+
+        Args:
+            base_path: 路徑前綴（目錄請以路徑分隔符結尾）
+
+        Returns:
+            文件列表（file_id / file_path / file_name / cell_count）
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT file_id, file_path, file_name, cell_count
+            FROM files
+            WHERE substr(file_path, 1, ?) = ?
+        ''', (len(base_path), base_path))
+
+        return [dict(row) for row in cursor.fetchall()]
+
     def delete_file(self, file_id: int):
         """
         刪除文件及其所有相關數據
 
+        如果有其他文件共用這個文件的內容，單元格會先轉交給其中一個文件。
+
         Args:
             file_id: 文件 ID
         """
+        self._release_file_content(file_id)
         cursor = self.conn.cursor()
 
+        # 刪除 FTS5 數據（以 cell_id 定位，必須在刪除單元格之前）
+        self._delete_fts_rows('file_id = ?', (file_id,))
         # 刪除單元格數據
         cursor.execute('DELETE FROM cells WHERE file_id = ?', (file_id,))
-        # 刪除 FTS5 數據
-        cursor.execute('DELETE FROM content_fts WHERE file_id = ?', (file_id,))
+        cursor.execute('DELETE FROM sheet_parts WHERE file_id = ?', (file_id,))
         # 刪除文件記錄
         cursor.execute('DELETE FROM files WHERE file_id = ?', (file_id,))
 
-        self.conn.commit()
+        self._commit()
         logger.debug(f"刪除文件 ID: {file_id}")
 
     def delete_file_content(self, file_id: int):
@@ -252,14 +800,385 @@ class Database:
         Args:
             file_id: 文件 ID
         """
+        self._release_file_content(file_id)
         cursor = self.conn.cursor()
+        self._delete_fts_rows('file_id = ?', (file_id,))
         cursor.execute('DELETE FROM cells WHERE file_id = ?', (file_id,))
-        cursor.execute('DELETE FROM content_fts WHERE file_id = ?', (file_id,))
+        cursor.execute('DELETE FROM sheet_parts WHERE file_id = ?', (file_id,))
         # 重置單元格計數
         cursor.execute('UPDATE files SET cell_count = 0 WHERE file_id = ?', (file_id,))
-        self.conn.commit()
+        self._commit()
         logger.debug(f"刪除文件內容 ID: {file_id}")
 
+    def replace_file_content(self, file_id: int, up_to_cell_id: int, last_modified: datetime,
+                             file_size: int, content_hash: Optional[str] = None):
+        """
+        以重新索引時新寫入的單元格取代文件的舊內容，並更新文件記錄
+
+        重新索引先把新單元格寫在原本的文件 ID 下，解析完成才呼叫此方法；
+        解析失敗時以 discard_new_cells() 清除新單元格，舊內容不受影響。
+
+        Args:
+            file_id: 文件 ID
+            up_to_cell_id: 開始重新索引時的 last_cell_id()，不大於它的是舊單元格
+            last_modified: 最後修改時間
+            file_size: 文件大小（字節）
+            content_hash: 新的內容指紋
+        """
+        self._release_file_content(file_id, up_to_cell_id)
+        cursor = self.conn.cursor()
+        self._delete_fts_rows('file_id = ? AND cell_id <= ?', (file_id, up_to_cell_id))
+        cursor.execute('DELETE FROM cells WHERE file_id = ? AND cell_id <= ?', (file_id, up_to_cell_id))
+        cursor.execute('DELETE FROM sheet_parts WHERE file_id = ?', (file_id,))
+        # 原本共用其他文件的內容時，改為使用自己的單元格
+        cursor.execute('''
+            UPDATE files
+            SET last_modified = ?, file_size = ?, content_hash = ?, content_file_id = NULL,
+                indexed_at = ?
+            WHERE file_id = ?
+        ''', (last_modified, file_size, content_hash, datetime.now(), file_id))
+        self._commit()
+        logger.debug(f"取代文件內容 ID: {file_id}")
+
+    def discard_new_cells(self, file_id: int, after_cell_id: int):
+        """
+        刪除重新索引中途寫入的新單元格（解析失敗時保留舊內容）
+
+        Args:
+            file_id: 文件 ID
+            after_cell_id: 開始重新索引時的 last_cell_id()，大於它的是新單元格
+        """
+        cursor = self.conn.cursor()
+        self._delete_fts_rows('file_id = ? AND cell_id > ?', (file_id, after_cell_id))
+        cursor.execute('DELETE FROM cells WHERE file_id = ? AND cell_id > ?', (file_id, after_cell_id))
+        self._commit()
+        logger.debug(f"捨棄文件 ID {file_id} 重新索引中的單元格")
+
+    def delete_sheet_content(self, file_id: int, sheet_names: List[str],
+                             up_to_cell_id: Optional[int] = None) -> int:
+        """
+        只刪除指定工作表的內容（用於部分工作表重新索引）
+
+        Args:
+            file_id: 文件 ID
+            sheet_names: 工作表名列表
+            up_to_cell_id: 只刪除 cell_id 不大於此值的單元格（新內容已先寫入時使用），
+                None 表示全部刪除
+
+        Returns:
+            刪除的單元格數
+        """
+        cursor = self.conn.cursor()
+        deleted = 0
+        condition = 'file_id = ? AND sheet_name = ?'
+        if up_to_cell_id is not None:
+            condition += ' AND cell_id <= ?'
+        for sheet_name in sheet_names:
+            params = (file_id, sheet_name) if up_to_cell_id is None else (file_id, sheet_name, up_to_cell_id)
+            self._delete_fts_rows(condition, params)
+            cursor.execute(f'DELETE FROM cells WHERE {condition}', params)
+            deleted += cursor.rowcount
+            cursor.execute('DELETE FROM sheet_parts WHERE file_id = ? AND sheet_name = ?',
+                           (file_id, sheet_name))
+        self._commit()
+        logger.debug(f"刪除文件 ID {file_id} 的 {len(sheet_names)} 個工作表內容")
+        return deleted
+
+    def _release_file_content(self, file_id: int, up_to_cell_id: Optional[int] = None):
+        """
+        文件內容被刪除前，把單元格轉交給共用此內容的第一個文件
+
+        Args:
+            file_id: 文件 ID
+            up_to_cell_id: 只轉交 cell_id 不大於此值的單元格（其後是重新索引中的新內容），
+                None 表示全部轉交
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT file_id FROM files WHERE content_file_id = ? ORDER BY file_id LIMIT 1
+        ''', (file_id,))
+        result = cursor.fetchone()
+        if not result:
+            return
+
+        heir_id = result[0]
+        condition = 'file_id = ?'
+        params = (heir_id, file_id)
+        if up_to_cell_id is not None:
+            condition += ' AND cell_id <= ?'
+            params += (up_to_cell_id,)
+        cursor.execute(f'''
+            UPDATE content_fts SET file_id = ?
+            WHERE rowid IN (SELECT cell_id FROM cells WHERE {condition})
+        ''', params)
+        cursor.execute(f'UPDATE cells SET file_id = ? WHERE {condition}', params)
+        cursor.execute('UPDATE sheet_parts SET file_id = ? WHERE file_id = ?', (heir_id, file_id))
+        cursor.execute('''
+            UPDATE files SET content_file_id = ? WHERE content_file_id = ? AND file_id != ?
+        ''', (heir_id, file_id, heir_id))
+        cursor.execute('UPDATE files SET content_file_id = NULL WHERE file_id = ?', (heir_id,))
+        logger.debug(f"文件 ID {file_id} 的內容轉交給文件 ID {heir_id}")
+
+    # ========================================================================
+    # 失敗文件
+    # ========================================================================
+
+    def get_failed_file(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """
+        獲取文件的失敗記錄
+
+        Args:
+            file_path: 文件路徑
+
+        Returns:
+            失敗記錄（file_path / file_size / mtime / status / error / failed_at）或 None
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT * FROM failed_files WHERE file_path = ?', (file_path,))
+        result = cursor.fetchone()
+        return dict(result) if result else None
+
+    def record_failed_file(self, file_path: str, file_size: int, mtime: float,
+                           status: str, error: str):
+        """
+        記錄失敗的文件（以路徑、大小、修改時間識別同一個版本）
+
+        Args:
+            file_path: 文件路徑
+            file_size: 文件大小（字節）
+            mtime: 修改時間（epoch 秒數）
+            status: 狀態代碼（如 ERROR_CORRUPT）
+            error: 錯誤訊息
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO failed_files
+            (file_path, file_size, mtime, status, error, failed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (file_path, file_size, mtime, status, error, datetime.now()))
+        self._commit()
+
+    def clear_failed_file(self, file_path: str):
+        """
+        移除文件的失敗記錄（文件已成功索引）
+
+        Args:
+            file_path: 文件路徑
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('DELETE FROM failed_files WHERE file_path = ?', (file_path,))
+        self._commit()
+
+    def get_failed_files(self) -> List[Dict[str, Any]]:
+        """
+        獲取所有失敗記錄
+
+        Returns:
+            失敗記錄列表（依狀態、路徑排序）
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT * FROM failed_files ORDER BY status, file_path')
+        return [dict(row) for row in cursor.fetchall()]
+
+    # ========================================================================
+    # 索引執行記錄
+    # ========================================================================
+
+    def start_index_run(self, root_path: str, file_paths: List[str]) -> int:
+        """
+        建立一次索引執行，所有文件的狀態設為 pending
+
+        Args:
+            root_path: 索引的根路徑
+            file_paths: 本次要處理的文件路徑列表
+
+        Returns:
+            執行 ID
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            INSERT INTO index_runs (root_path, file_count, started_at) VALUES (?, ?, ?)
+        ''', (root_path, len(file_paths), datetime.now()))
+        run_id = cursor.lastrowid
+        cursor.executemany('''
+            INSERT OR IGNORE INTO run_files (run_id, file_path) VALUES (?, ?)
+        ''', [(run_id, file_path) for file_path in file_paths])
+        self._commit()
+        logger.debug(f"開始索引執行 ID: {run_id}，共 {len(file_paths)} 個文件")
+        return run_id
+
+    def add_run_files(self, run_id: int, file_paths: List[str]):
+        """
+        把文件加入進行中的索引執行（邊掃描邊索引時使用），狀態為 pending
+
+        Args:
+            run_id: 執行 ID
+            file_paths: 新掃描到的文件路徑列表
+        """
+        cursor = self.conn.cursor()
+        cursor.executemany('''
+            INSERT OR IGNORE INTO run_files (run_id, file_path) VALUES (?, ?)
+        ''', [(run_id, file_path) for file_path in file_paths])
+        cursor.execute('''
+            UPDATE index_runs SET file_count = file_count + ? WHERE run_id = ?
+        ''', (len(file_paths), run_id))
+        self._commit()
+
+    def get_index_runs(self, status: str) -> List[Dict[str, Any]]:
+        """
+        獲取指定狀態的索引執行（最新的在前）
+
+        Args:
+            status: running / interrupted / completed / abandoned
+
+        Returns:
+            執行記錄列表
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT * FROM index_runs WHERE status = ? ORDER BY run_id DESC
+        ''', (status,))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def set_index_run_status(self, run_id: int, status: str):
+        """
+        更新索引執行的狀態；completed / abandoned 時清除逐檔狀態
+
+        Args:
+            run_id: 執行 ID
+            status: running / interrupted / completed / abandoned
+        """
+        cursor = self.conn.cursor()
+        if status in ('completed', 'abandoned'):
+            cursor.execute('DELETE FROM run_files WHERE run_id = ?', (run_id,))
+            cursor.execute('''
+                UPDATE index_runs SET status = ?, finished_at = ? WHERE run_id = ?
+            ''', (status, datetime.now(), run_id))
+        else:
+            cursor.execute('UPDATE index_runs SET status = ? WHERE run_id = ?', (status, run_id))
+        self._commit()
+
+    def set_run_file_state(self, run_id: int, file_path: str, state: str,
+                           cell_watermark: Optional[int] = None):
+        """
+        更新文件在索引執行中的狀態
+
+        Args:
+            run_id: 執行 ID
+            file_path: 文件路徑
+            state: pending / in_progress / done / failed
+            cell_watermark: 重新索引已有的文件時，開始寫入前的 last_cell_id()
+                （None 表示新文件，中斷時整個刪除）
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            UPDATE run_files SET state = ?, updated_at = ?, cell_watermark = ?
+            WHERE run_id = ? AND file_path = ?
+        ''', (state, datetime.now(), cell_watermark, run_id, file_path))
+        self._commit()
+
+    def get_in_progress_files(self, run_id: int) -> Dict[str, Optional[int]]:
+        """
+        獲取索引執行中寫到一半（in_progress）的文件
+
+        Args:
+            run_id: 執行 ID
+
+        Returns:
+            文件路徑 -> cell_watermark（見 set_run_file_state()）
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT file_path, cell_watermark FROM run_files
+            WHERE run_id = ? AND state = 'in_progress'
+            ORDER BY file_path
+        ''', (run_id,))
+        return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def get_run_files(self, run_id: int, states: Tuple[str, ...]) -> List[str]:
+        """
+        獲取索引執行中處於指定狀態的文件
+
+        Args:
+            run_id: 執行 ID
+            states: 狀態列表
+
+        Returns:
+            文件路徑列表
+        """
+        cursor = self.conn.cursor()
+        placeholders = ','.join('?' * len(states))
+        cursor.execute(f'''
+            SELECT file_path FROM run_files
+            WHERE run_id = ? AND state IN ({placeholders})
+            ORDER BY file_path
+        ''', (run_id, *states))
+        return [row[0] for row in cursor.fetchall()]
+
+    # ========================================================================
+    # 目錄快照
+    # ========================================================================
+
+    def get_dir_snapshot(self, root_path: str) -> Dict[str, Dict[str, Any]]:
+        """
+        讀取根路徑（含）以下所有目錄的快照
+
+        Args:
+            root_path: 掃描的根目錄（絕對路徑）
+
+        Returns:
+            目錄路徑 -> {'mtime_ns', 'subdirs': [子目錄路徑], 'files': [(檔名, 大小, mtime)]}
+            （DirectorySnapshot 的格式）
+        """
+        prefix = os.path.join(root_path, '')
+        under_root = 'dir_path = ? OR substr(dir_path, 1, ?) = ?'
+        params = (root_path, len(prefix), prefix)
+        cursor = self.conn.cursor()
+
+        cursor.execute(f'SELECT dir_path, mtime_ns FROM scan_dirs WHERE {under_root}', params)
+        dirs = {row['dir_path']: {'mtime_ns': row['mtime_ns'], 'subdirs': [], 'files': []}
+                for row in cursor.fetchall()}
+
+        cursor.execute(f'''
+            SELECT dir_path, name, is_dir, file_size, mtime FROM scan_entries
+            WHERE {under_root}
+        ''', params)
+        for row in cursor.fetchall():
+            record = dirs.get(row['dir_path'])
+            if record is None:
+                continue
+            if row['is_dir']:
+                record['subdirs'].append(os.path.join(row['dir_path'], row['name']))
+            else:
+                record['files'].append((row['name'], row['file_size'], row['mtime']))
+        return dirs
+
+    def save_dir_snapshot(self, snapshot, prune: bool = True):
+        """
+        寫回本次掃描重新列出的目錄，並刪除已不存在的目錄
+
+        Args:
+            snapshot: 掃描後的 DirectorySnapshot
+            prune: 是否刪除本次沒有掃描到的目錄（只有遞迴掃描才完整走過整棵樹）
+        """
+        cursor = self.conn.cursor()
+        removed = snapshot.stale_dirs() if prune else []
+        for dir_path in removed + list(snapshot.changed):
+            cursor.execute('DELETE FROM scan_entries WHERE dir_path = ?', (dir_path,))
+            cursor.execute('DELETE FROM scan_dirs WHERE dir_path = ?', (dir_path,))
+
+        for dir_path, record in snapshot.changed.items():
+            cursor.execute('''
+                INSERT INTO scan_dirs (dir_path, mtime_ns, scanned_at) VALUES (?, ?, ?)
+            ''', (dir_path, record['mtime_ns'], datetime.now()))
+            cursor.executemany('''
+                INSERT INTO scan_entries (dir_path, name, is_dir, file_size, mtime)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(dir_path, os.path.basename(subdir), 1, None, None) for subdir in record['subdirs']]
+                + [(dir_path, name, 0, size, mtime) for name, size, mtime in record['files']])
+        self._commit()
+        logger.debug(f"目錄快照: 更新 {len(snapshot.changed)} 個目錄，移除 {len(removed)} 個目錄")
+
     # ========================================================================
     # 單元格操作
     # ========================================================================
@@ -278,6 +1197,8 @@ class Database:
                 - value: 單元格值
                 - is_merged: 是否為合併儲存格（可選）
                 - merged_range: 合併範圍（可選）
+                - value_type: 原始類型（可選）
+                - value_num: 數值或日期秒數（可選）
         """
         if not cells_data:
             return
@@ -286,7 +1207,6 @@ class Database:
 
         # 準備數據
         cells_rows = []
-        fts_rows = []
 
         for cell in cells_data:
             value = str(cell['value']).strip() if cell.get('value') else ''
@@ -303,38 +1223,42 @@ class Database:
                 value,
                 value.lower(),  # 小寫版本用於不區分大小寫搜索
                 cell.get('is_merged', False),
-                cell.get('merged_range', None)
-            ))
-
-            # 準備 FTS5 表數據
-            fts_rows.append((
-                cell['file_id'],
-                cell['sheet_name'],
-                cell['location'],
-                value
+                cell.get('merged_range', None),
+                cell.get('value_type'),
+                cell.get('value_num')
             ))
 
         # 批量插入到 cells 表
         try:
+            cursor.execute('SELECT COALESCE(MAX(cell_id), 0) FROM cells')
+            last_cell_id = cursor.fetchone()[0]
             cursor.executemany('''
                 INSERT INTO cells
                 (file_id, sheet_name, row_num, col_num, cell_location,
-                 value, value_lower, is_merged, merged_range)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                 value, value_lower, is_merged, merged_range, value_type, value_num)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', cells_rows)
 
-            # 批量插入到 FTS5 表
-            cursor.executemany('''
-                INSERT INTO content_fts
-                (file_id, sheet_name, cell_location, cell_value)
-                VALUES (?, ?, ?, ?)
-            ''', fts_rows)
-
-            self.conn.commit()
+            # 由剛插入的單元格填入 FTS5 表，rowid 即 cell_id（批量載入時延後到結束再一次寫入）
+            if not self._bulk:
+                cursor.execute('''
+                    INSERT INTO content_fts
+                    (rowid, file_id, sheet_name, cell_location, cell_value)
+                    SELECT cell_id, file_id, sheet_name, cell_location, value
+                    FROM cells WHERE cell_id > ?
+                ''', (last_cell_id,))
+                if self._trigram:
+                    cursor.execute('''
+                        INSERT INTO content_trigram (rowid, value)
+                        SELECT cell_id, value FROM cells WHERE cell_id > ?
+                    ''', (last_cell_id,))
+
+            self._commit()
             logger.debug(f"批量插入 {len(cells_data)} 個單元格")
 
         except Exception as e:
-            self.conn.rollback()
+            if self._session is None:
+                self.conn.rollback()
             logger.error(f"批量插入失敗: {e}")
             raise
 
@@ -360,20 +1284,22 @@ class Database:
 
         return [dict(row) for row in cursor.fetchall()]
 
-    def update_file_cell_count(self, file_id: int):
+    def update_file_cell_count(self, file_id: int, parse_seconds: Optional[float] = None):
         """
         更新文件的單元格計數
 
         Args:
             file_id: 文件 ID
+            parse_seconds: 本次完整解析的耗時（秒），None 表示保留原值
         """
         cursor = self.conn.cursor()
         cursor.execute('''
             UPDATE files
-            SET cell_count = (SELECT COUNT(*) FROM cells WHERE file_id = ?)
+            SET cell_count = (SELECT COUNT(*) FROM cells WHERE file_id = ?),
+                parse_seconds = COALESCE(?, parse_seconds)
             WHERE file_id = ?
-        ''', (file_id, file_id))
-        self.conn.commit()
+        ''', (file_id, parse_seconds, file_id))
+        self._commit()
 
     # ========================================================================
     # 統計信息
@@ -407,6 +1333,10 @@ class Database:
         cursor.execute('SELECT MAX(indexed_at) FROM files')
         last_indexed = cursor.fetchone()[0]
 
+        # 失敗文件數
+        cursor.execute('SELECT COUNT(*) FROM failed_files')
+        failed_count = cursor.fetchone()[0]
+
         return {
             'file_count': file_count,
             'cell_count': cell_count,
@@ -414,6 +1344,8 @@ class Database:
             'db_size_mb': round(db_size / (1024 * 1024), 2),
             'last_indexed': last_indexed,
             'avg_cells_per_file': round(cell_count / file_count, 2) if file_count > 0 else 0,
+            'failed_count': failed_count,
+            'trigram_index': self._trigram,
         }
 
     def vacuum(self):
@@ -4,15 +4,22 @@ Excel 搜索系統 - 簡單 CLI 工具
 """
 import os
 import sys
+import time
 import click
+import signal
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
-from openpyxl import load_workbook
 from tqdm import tqdm
 
 from database import Database
-from file_scanner import FileScanner
-from config import DATABASE_PATH
+from file_scanner import FileScanner, DirectorySnapshot
+from indexer import (ParallelIndexer, plan_index, record_failure, schedule_files, pipeline_batches,
+                     SCHEDULE_POLICIES)
+from excel_reader import READER_ENGINES, to_epoch_seconds
+from watcher import DirectoryWatcher, WatchError
+from search_engine import search_cells, substring_indexed, SEARCH_MODES
+from config import DATABASE_PATH, INDEX_CONFIG, SEARCH_CONFIG
 
 
 # ============================================================================
@@ -61,40 +68,523 @@ def print_warning(text):
     click.secho(f"⚠️  {text}", fg='yellow')
 
 
-def read_excel_file(file_path):
+def index_files(db, files_to_index, workers=1, engine=INDEX_CONFIG['reader_engine'], run_id=None):
     """
-    讀取單個 Excel 檔案
+    解析並寫入一組檔案
+
+    解析可在多個 worker 進程中進行，但所有寫入都由目前進程的單一連接完成。
+
+    Args:
+        db: Database 實例
+        files_to_index: 檔案資訊列表
+        workers: 解析用的 worker 進程數
+        engine: Excel 讀取引擎
+        run_id: 索引執行 ID（記錄每個檔案的進度，供 --resume 使用）
+
+    Returns:
+        dict: 統計結果（success / failed / cells / partial），以及 worker 使用率
+            utilization / parse_seconds / wall_seconds / workers
+    """
+    result = {'success': 0, 'failed': 0, 'cells': 0, 'partial': 0}
+    indexer = ParallelIndexer(workers=workers, batch_size=INDEX_CONFIG['batch_size'],
+                              reader_options={'engine': engine,
+                                              'expand_merged': INDEX_CONFIG['expand_merged_cells'],
+                                              'mark_merged': INDEX_CONFIG['mark_merged_cells']},
+                              timeout=INDEX_CONFIG['file_timeout_seconds'],
+                              max_rss_mb=INDEX_CONFIG['max_worker_rss_mb'])
+
+    # 正在寫入中的檔案: file_path -> file_id（平行模式下可能同時有多個）
+    # 寫入失敗的檔案對應 None，其後續事件都會被忽略
+    open_files = {}
+
+    # 重新索引已有的檔案: file_path -> 開始時的 last_cell_id()
+    # 新單元格先寫在原本的文件 ID 下，解析完成才刪除舊內容並更新文件記錄；
+    # 失敗時只清除新寫入的單元格，舊內容（包括未變動的工作表）保持不變
+    staged = {}
+
+    # 一次只解析一個檔案時事件不會交錯：整個檔案（start 到 done）再包一層 SAVEPOINT，
+    # 出錯時全部回滾
+    serial = min(workers, len(files_to_index)) <= 1
+    file_savepoint = None
+
+    # 整批寫入共用一個事務，只在檔案之間每 batch_commit_size 個檔案提交一次；
+    # 每個事件包在 SAVEPOINT 中，出錯時只回滾該事件，其餘由下方的清除邏輯處理
+    with db.write_session(), \
+            tqdm(total=len(files_to_index), desc="索引中", unit="檔案") as pbar:
+        for event, file_info, data in indexer.run(files_to_index):
+            file_path = file_info['file_path']
+
+            if event in ('done', 'error'):
+                pbar.update(1)
+                if file_path in open_files and open_files[file_path] is None:
+                    del open_files[file_path]
+                    continue
+            elif event == 'cells' and open_files.get(file_path) is None:
+                continue
+
+            try:
+                if event == 'start' and serial:
+                    file_savepoint = db.begin_savepoint()
+
+                with db.savepoint():
+                    if event == 'start':
+                        open_files[file_path] = None
+
+                        if file_info.get('sheets') is not None:
+                            # 只有部分工作表變動：保留文件記錄，變動的工作表等解析完成才清除
+                            staged[file_path] = db.last_cell_id()
+                            open_files[file_path] = file_info['file_id']
+                        else:
+                            existing_id = db.get_file_id(file_path)
+                            if existing_id:
+                                # 重新索引：舊內容等解析完成才取代，避免單元格重複
+                                staged[file_path] = db.last_cell_id()
+                                open_files[file_path] = existing_id
+                            else:
+                                # 添加檔案記錄（串流寫入需要先取得 file_id）
+                                open_files[file_path] = db.add_file(
+                                    file_path=file_path,
+                                    file_name=file_info['file_name'],
+                                    last_modified=file_info['last_modified'],
+                                    file_size=file_info['file_size'],
+                                    content_hash=file_info.get('content_hash')
+                                )
+
+                        if run_id:
+                            # 與寫入在同一個事務中提交；中斷時依 watermark 只回滾新寫入的單元格
+                            db.set_run_file_state(run_id, file_path, 'in_progress',
+                                                  cell_watermark=staged.get(file_path))
+
+                    elif event == 'cells':
+                        file_id = open_files[file_path]
+                        for cell in data:
+                            cell['file_id'] = file_id
+                        db.add_cells_batch(data)
+
+                    elif event == 'done':
+                        file_id = open_files[file_path]
+                        watermark = staged.get(file_path)
+
+                        if file_info.get('sheets') is not None:
+                            file_info['base_cell_count'] -= db.delete_sheet_content(
+                                file_id, file_info['stale_sheets'], up_to_cell_id=watermark)
+                            db.update_file_metadata(file_id, file_info['last_modified'],
+                                                    file_info['file_size'], file_info.get('content_hash'))
+                        elif watermark is not None:
+                            db.replace_file_content(file_id, watermark, file_info['last_modified'],
+                                                    file_info['file_size'], file_info.get('content_hash'))
+
+                        if data + file_info.get('base_cell_count', 0) == 0:
+                            db.delete_file(file_id)
+                            if run_id:
+                                db.set_run_file_state(run_id, file_path, 'done')
+                            pbar.write(f"⚠️  跳過空檔案: {file_info['file_name']}")
+                        else:
+                            # 只有完整解析的耗時才記錄下來，作為下次排程的依據
+                            full_parse = file_info.get('sheets') is None
+                            db.update_file_cell_count(
+                                file_id, file_info.get('parse_seconds') if full_parse else None)
+                            if file_info.get('sheet_parts'):
+                                db.save_sheet_parts(file_id, file_info['sheet_parts'])
+                            result['success'] += 1
+                            result['cells'] += data
+                            if file_info.get('sheets') is not None:
+                                result['partial'] += 1
+                            db.clear_failed_file(file_path)
+                            if run_id:
+                                db.set_run_file_state(run_id, file_path, 'done')
+                            pbar.set_postfix({'成功': result['success'], '單元格': result['cells']})
+
+                    elif event == 'error':
+                        raise Exception(data)
+
+                if event == 'done':
+                    open_files.pop(file_path)
+                    staged.pop(file_path, None)
+                    if file_savepoint:
+                        db.release_savepoint(file_savepoint)
+                        file_savepoint = None
+                    # 提交會結束所有 SAVEPOINT，只能在檔案的寫入全部完成之後
+                    db.finish_file()
+
+            except Exception as e:
+                if file_savepoint:
+                    # 回滾整個檔案的寫入：舊內容與文件記錄恢復原狀，下方的清除不會再找到資料
+                    db.rollback_savepoint(file_savepoint)
+                    file_savepoint = None
+
+                result['failed'] += 1
+                pbar.write(f"❌ 索引失敗: {file_info['file_name']} - {e}")
+
+                if event == 'error':
+                    # 解析失敗（或超時、超量被終止）：記錄下來，檔案未變動前不再重試
+                    record_failure(db, file_info, file_info.get('error_status', 'ERROR_PARSE'), data)
+
+                # 清除寫到一半的資料：新檔案整個刪除，重新索引的檔案只清除新寫入的單元格
+                file_id = open_files.get(file_path)
+                watermark = staged.pop(file_path, None)
+                if file_id and watermark is not None:
+                    db.discard_new_cells(file_id, watermark)
+                elif file_id:
+                    db.delete_file(file_id)
+                if run_id:
+                    db.set_run_file_state(run_id, file_path, 'failed')
+                if event in ('done', 'error'):
+                    open_files.pop(file_path, None)
+                    db.finish_file()
+                else:
+                    open_files[file_path] = None
+
+    result['utilization'] = indexer.utilization
+    result['parse_seconds'] = indexer.stats['busy_seconds']
+    result['wall_seconds'] = indexer.stats['wall_seconds']
+    result['workers'] = indexer.stats['workers']
+    return result
+
+
+def link_file(db, file_info, owner_id):
+    """
+    將內容相同的檔案連結到已索引的檔案，共用其單元格
+
+    Args:
+        db: Database 實例
+        file_info: 檔案資訊
+        owner_id: 保存單元格的檔案 ID
+    """
+    existing_id = db.get_file_id(file_info['file_path'])
+    if existing_id:
+        db.delete_file(existing_id)
+
+    file_id = db.add_file(
+        file_path=file_info['file_path'],
+        file_name=file_info['file_name'],
+        last_modified=file_info['last_modified'],
+        file_size=file_info['file_size'],
+        content_hash=file_info.get('content_hash')
+    )
+    db.link_file_content(file_id, owner_id)
+    db.clear_failed_file(file_info['file_path'])
+
+
+def index_planned(db, plan, workers=1, engine=INDEX_CONFIG['reader_engine'], run_id=None,
+                  schedule=INDEX_CONFIG['schedule_policy']):
+    """
+    依 plan_index() 的結果寫入資料庫
+
+    Args:
+        db: Database 實例
+        plan: plan_index() 的回傳值
+        workers: 解析用的 worker 進程數
+        engine: Excel 讀取引擎
+        run_id: 索引執行 ID
+        schedule: 解析排程策略（見 schedule_files()）
 
     Returns:
-        list: 單元格資料列表
+        dict: 統計結果（success / failed / cells / linked / unchanged / invalid）
     """
-    cells_data = []
+    with db.write_session():
+        # 結構檢查未通過：不解析，移除舊內容並記錄失敗
+        for file_info, status, message in plan['invalid']:
+            existing_id = db.get_file_id(file_info['file_path'])
+            if existing_id:
+                db.delete_file(existing_id)
+            record_failure(db, file_info, status, message)
+            print_error(f"跳過損壞檔案: {file_info['file_name']} ({message})")
+            db.finish_file()
+
+        # 內容未變，只更新修改時間
+        for file_info, existing in plan['unchanged']:
+            db.update_file_metadata(existing['file_id'], file_info['last_modified'],
+                                    file_info['file_size'])
+            db.finish_file()
+
+        parse_queue = schedule_files(plan['parse'], schedule)
+        result = index_files(db, parse_queue, workers=workers, engine=engine, run_id=run_id)
+        result['linked'] = 0
+        result['unchanged'] = len(plan['unchanged'])
+        result['invalid'] = len(plan['invalid'])
+        result['failed'] += result['invalid']
+
+        # 與已索引檔案內容相同的檔案：直接共用單元格
+        links = list(plan['link'])
+        for file_info in plan['deferred']:
+            owner = db.find_content_owner(file_info['content_hash'],
+                                          exclude_path=file_info['file_path'])
+            if owner:
+                links.append((file_info, owner['file_id']))
+            else:
+                # 第一份副本解析失敗或無內容，改為自行解析
+                retry = index_files(db, [file_info], workers=1, engine=engine, run_id=run_id)
+                for key in ('success', 'failed', 'cells', 'partial'):
+                    result[key] += retry[key]
+
+        for file_info, owner_id in links:
+            try:
+                with db.savepoint():
+                    link_file(db, file_info, owner_id)
+                result['linked'] += 1
+                result['success'] += 1
+                db.finish_file()
+            except Exception as e:
+                result['failed'] += 1
+                print_error(f"連結失敗: {file_info['file_name']} - {e}")
+
+    return result
+
+
+def index_pipelined(db, file_stream, run_id=None, workers=1, engine=INDEX_CONFIG['reader_engine'],
+                    schedule=INDEX_CONFIG['schedule_policy'], incremental=True, retry_failed=False):
+    """
+    邊掃描邊索引：掃描到的文件經有界佇列分批交給 plan_index / index_planned
+
+    排程（schedule）與同內容文件的合併只在同一批之內進行；不同批之間的相同內容
+    由 find_content_owner 找到先前已寫入的文件，同樣只解析一次。
+
+    Args:
+        db: Database 實例
+        file_stream: 文件資訊的來源（FileScanner.iter_directory）
+        run_id: 索引執行 ID（每一批的文件先加入執行記錄）
+        workers: 解析用的 worker 進程數
+        engine: Excel 讀取引擎
+        schedule: 解析排程策略
+        incremental: 是否為增量索引
+        retry_failed: 重新嘗試之前失敗且未變動的文件
+
+    Returns:
+        (掃描到的文件列表, plan 計數, index_planned 的統計結果加總)；
+        統計結果另加 first_batch_seconds（開始到第一批交給解析的秒數）
+    """
+    started = time.monotonic()
+    files = []
+    plan_totals = {key: 0 for key in ('new', 'updated', 'skipped', 'partial', 'quarantined')}
+    totals = {}
+    first_batch = None
+
+    for batch in pipeline_batches(file_stream, max_batch=INDEX_CONFIG['pipeline_max_batch'],
+                                  queue_size=INDEX_CONFIG['pipeline_queue_size']):
+        if first_batch is None:
+            first_batch = time.monotonic() - started
+        files.extend(batch)
+        if run_id:
+            db.add_run_files(run_id, [f['file_path'] for f in batch])
+
+        plan = plan_index(db, batch, incremental=incremental, retry_failed=retry_failed)
+        for key in plan_totals:
+            plan_totals[key] += plan[key]
+        result = index_planned(db, plan, workers=workers, engine=engine, run_id=run_id,
+                               schedule=schedule)
+        for key, value in result.items():
+            if key == 'workers':
+                totals[key] = max(totals.get(key, 0), value)
+            elif key != 'utilization':
+                totals[key] = totals.get(key, 0) + value
+
+    if not totals:
+        totals = {'success': 0, 'failed': 0, 'cells': 0, 'partial': 0, 'linked': 0,
+                  'unchanged': 0, 'invalid': 0, 'parse_seconds': 0.0, 'wall_seconds': 0.0,
+                  'workers': workers}
+    capacity = totals['wall_seconds'] * totals['workers']
+    totals['utilization'] = min(1.0, totals['parse_seconds'] / capacity) if capacity else 0.0
+    totals['first_batch_seconds'] = first_batch or 0.0
+    return files, plan_totals, totals
+
+
+def recover_interrupted_runs(db):
+    """
+    回滾上次中斷時寫到一半的檔案，並把未結束的索引執行標記為 interrupted
+
+    重新索引已有的檔案時，舊內容要到解析完成才被取代，因此只刪除 watermark 之後
+    新寫入的單元格，保留上次成功索引的內容；新檔案則整個刪除。
+    假設同一個資料庫同時只有一個 index 在執行。
+
+    Args:
+        db: Database 實例
+
+    Returns:
+        int: 回滾的檔案數
+    """
+    rolled_back = 0
+    for run in db.get_index_runs('running'):
+        for file_path, watermark in db.get_in_progress_files(run['run_id']).items():
+            file_id = db.get_file_id(file_path)
+            if file_id and watermark is not None:
+                db.discard_new_cells(file_id, watermark)
+            elif file_id:
+                db.delete_file(file_id)
+            db.set_run_file_state(run['run_id'], file_path, 'pending')
+            rolled_back += 1
+        db.set_index_run_status(run['run_id'], 'interrupted')
+    return rolled_back
+
+
+def find_resumable_run(db, root_path):
+    """
+    找出同一路徑最近一次中斷的索引執行
+
+    Args:
+        db: Database 實例
+        root_path: 索引的根路徑（絕對路徑）
+
+    Returns:
+        dict: 執行記錄，沒有則為 None
+    """
+    for run in db.get_index_runs('interrupted'):
+        if run['root_path'] == root_path:
+            return run
+    return None
+
+
+def reindex_paths(db, paths, workers=1, engine=INDEX_CONFIG['reader_engine'], removed_dirs=(),
+                  incremental=True, retry_failed=False):
+    """
+    只處理指定的檔案：仍存在的檔案依內容指紋重新索引，已不存在的檔案從資料庫移除
+
+    Args:
+        db: Database 實例
+        paths: 檔案路徑列表
+        workers: 解析用的 worker 進程數
+        engine: Excel 讀取引擎
+        removed_dirs: 已刪除或移出的目錄，其下已不存在的檔案都會從資料庫移除
+        incremental: False 時不比對修改時間與內容，全部重新解析
+        retry_failed: 重新嘗試之前失敗且未變動的檔案
+
+    Returns:
+        dict: index_planned 的統計結果，另加 deleted（移除的檔案數）
+    """
+    scanner = FileScanner()
+    files = []
+    missing = set()
+    for file_path in paths:
+        info = scanner.get_file_info(file_path) if os.path.isfile(file_path) else None
+        if info:
+            files.append(info)
+        else:
+            missing.add(file_path)
+    for dir_path in removed_dirs:
+        missing.update(db_file['file_path']
+                       for db_file in db.get_files_under_path(os.path.join(dir_path, ''))
+                       if not os.path.exists(db_file['file_path']))
+
+    deleted = 0
+    for file_path in sorted(missing):
+        file_id = db.get_file_id(file_path)
+        if file_id:
+            db.delete_file(file_id)
+            deleted += 1
+
+    plan = plan_index(db, files, incremental=incremental, retry_failed=retry_failed)
+    result = index_planned(db, plan, workers=workers, engine=engine)
+    result['deleted'] = deleted
+    return result
+
+
+def watch_index(db, root_path, workers=1, engine=INDEX_CONFIG['reader_engine']):
+    """
+    監看目錄樹，檔案變動後自動重新索引，直到按下 Ctrl+C
+
+    變動以 inotify 偵測；事件溢位時，以及每 watch_rescan_minutes 分鐘
+    （網路磁碟上其他電腦的修改沒有事件）會以目錄快照重新掃描整個目錄。
+
+    Args:
+        db: Database 實例
+        root_path: 監看的根目錄（絕對路徑）
+        workers: 解析用的 worker 進程數（不超過 watch_max_concurrent）
+        engine: Excel 讀取引擎
+    """
+    workers = max(1, min(workers, INDEX_CONFIG['watch_max_concurrent']))
+    rescan_seconds = INDEX_CONFIG['watch_rescan_minutes'] * 60
+    scanner = FileScanner()
 
     try:
-        # 打開檔案
-        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        watcher = DirectoryWatcher([root_path], scanner,
+                                   debounce_seconds=INDEX_CONFIG['watch_debounce_seconds'],
+                                   max_pending=INDEX_CONFIG['watch_max_pending'])
+    except WatchError as e:
+        print_error(f"無法啟動監看: {e}")
+        return
+
+    # 以 SIGTERM 停止（例如 systemd）時與 Ctrl+C 相同，結束監看
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with watcher:
+        print_info(f"監看 {watcher.watch_count} 個目錄，檔案變動後自動重新索引（Ctrl+C 結束）")
+        last_scan = time.monotonic()
+        try:
+            while True:
+                change = watcher.poll(timeout=1.0)
+                if change is None and rescan_seconds and time.monotonic() - last_scan >= rescan_seconds:
+                    change = {'paths': [], 'removed_dirs': [], 'rescan': True}
+                if change is None:
+                    continue
+
+                if change['rescan']:
+                    # 以目錄快照重新掃描，資料庫中已不存在的檔案一併移除
+                    snapshot = DirectorySnapshot(db.get_dir_snapshot(root_path))
+                    files = scanner.scan_directory(root_path, show_progress=False, snapshot=snapshot)
+                    db.save_dir_snapshot(snapshot)
+                    paths = [f['file_path'] for f in files]
+                    removed_dirs = [root_path]
+                    last_scan = time.monotonic()
+                else:
+                    paths = change['paths']
+                    removed_dirs = change['removed_dirs']
+
+                result = reindex_paths(db, paths, workers=workers, engine=engine,
+                                       removed_dirs=removed_dirs)
+                indexed = result['success'] - result['linked']
+                if indexed or result['linked'] or result['deleted'] or result['failed']:
+                    print_info(f"[{datetime.now():%H:%M:%S}] 更新: {indexed}，連結: {result['linked']}，"
+                               f"移除: {result['deleted']}，失敗: {result['failed']}")
+        except KeyboardInterrupt:
+            click.echo()
+            print_info("停止監看")
+
+
+def build_search_filters(keyword, num_between=None, date_after=None, date_before=None):
+    """
+    組合關鍵詞以外的搜索條件（關鍵詞由 search_cells 依搜索模式處理）
+
+    Args:
+        keyword: 關鍵詞（可為 None）
+        num_between: (最小值, 最大值) 或 None
+        date_after: 日期下限（含）或 None
+        date_before: 日期上限（不含）或 None
+
+    Returns:
+        (WHERE 條件列表, 參數列表, 條件說明)
+
+    Raises:
+        click.UsageError: 沒有任何條件，或同時指定數值與日期範圍
+    """
+    conditions, params, descriptions = [], [], []
+
+    if keyword:
+        descriptions.append(f'"{keyword}"')
+
+    if num_between and (date_after or date_before):
+        raise click.UsageError("--num-between 不能與 --date-after / --date-before 同時使用")
 
-        # 遍歷所有工作表
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
+    if num_between:
+        low, high = sorted(num_between)
+        conditions.append("c.value_type = 'number' AND c.value_num BETWEEN ? AND ?")
+        params.extend([low, high])
+        descriptions.append(f"數值 {low:g} ~ {high:g}")
 
-            # 遍歷所有單元格
-            for row_idx, row in enumerate(sheet.iter_rows(), start=1):
-                for col_idx, cell in enumerate(row, start=1):
-                    if cell.value is not None:
-                        cells_data.append({
-                            'sheet_name': sheet_name,
-                            'row': row_idx,
-                            'col': col_idx,
-                            'location': f"{cell.column_letter}{cell.row}",
-                            'value': str(cell.value),
-                        })
+    if date_after or date_before:
+        conditions.append("c.value_type = 'date'")
+        if date_after:
+            conditions.append('c.value_num >= ?')
+            params.append(to_epoch_seconds(date_after))
+            descriptions.append(f"日期 >= {date_after:%Y-%m-%d %H:%M}")
+        if date_before:
+            conditions.append('c.value_num < ?')
+            params.append(to_epoch_seconds(date_before))
+            descriptions.append(f"日期 < {date_before:%Y-%m-%d %H:%M}")
 
-        workbook.close()
-        return cells_data
+    if not keyword and not conditions:
+        raise click.UsageError("請指定關鍵詞，或使用 --num-between / --date-after / --date-before")
 
-    except Exception as e:
-        raise Exception(f"讀取檔案失敗: {e}")
+    return conditions, params, " ".join(descriptions)
 
 
 # ============================================================================
@@ -118,19 +608,91 @@ def cli():
 @cli.command()
 @click.argument('path', type=click.Path(exists=True))
 @click.option('--recursive/--no-recursive', default=True, help='是否遞迴掃描子目錄')
-def index(path, recursive):
+@click.option('--workers', default=1, type=click.IntRange(min=0),
+              help='平行解析的進程數（0 表示使用設定檔的 max_workers）')
+@click.option('--engine', type=click.Choice(READER_ENGINES), default=INDEX_CONFIG['reader_engine'],
+              help='Excel 讀取引擎（iterparse 直接解析 XML，速度較快）')
+@click.option('--incremental/--full', default=True,
+              help='增量索引（跳過內容未變的檔案）或全量重新解析')
+@click.option('--retry-failed', is_flag=True, help='重新嘗試之前失敗且未變動的檔案')
+@click.option('--resume', is_flag=True,
+              help='續跑同一路徑上次中斷的索引（不重新掃描，已完成的檔案不再解析）')
+@click.option('--schedule', type=click.Choice(SCHEDULE_POLICIES),
+              default=INDEX_CONFIG['schedule_policy'],
+              help='解析順序：lpt 預估最久的先做（縮短平行解析的尾巴），freshest 最近修改的先做')
+@click.option('--bulk', is_flag=True,
+              help='首次建立資料庫時使用批量載入（載入完成後才建立索引與全文檢索）')
+@click.option('--watch', is_flag=True,
+              help='索引完成後持續監看整個目錄樹（Linux inotify），檔案變動即重新索引')
+@click.option('--files-from', type=click.File('rb'), default=None,
+              help='不掃描目錄，只處理清單檔中的路徑（- 表示標準輸入；以換行或 NUL 分隔，'
+                   '相對路徑以 PATH 為基準，「D<Tab>路徑」表示已刪除的檔案或目錄）')
+@click.option('--pipeline', is_flag=True,
+              help='邊掃描邊解析：掃描到的檔案分批立即解析，不等整個目錄樹走完（網路磁碟上較快開始）')
+def index(path, recursive, workers, engine, incremental, retry_failed, resume, schedule, bulk, watch,
+          files_from, pipeline):
     """
     索引 Excel 檔案
 
-    PATH: 檔案或目錄路徑
+    PATH: 檔案或目錄路徑（使用 --files-from 時為清單中相對路徑的基準目錄）
     """
+    if files_from and (resume or watch or pipeline):
+        raise click.UsageError("--files-from 不能與 --resume / --watch / --pipeline 同時使用")
+    if pipeline and bulk:
+        raise click.UsageError("--pipeline 不能與 --bulk 同時使用（批量載入時索引要到最後才建立）")
+    if files_from and not os.path.isdir(path):
+        raise click.UsageError("使用 --files-from 時 PATH 必須是目錄（清單中相對路徑的基準）")
+
     print_header("📚 索引 Excel 檔案")
 
     # 初始化資料庫
     db = get_db()
+    root_path = os.path.abspath(path)
+
+    # 上次中斷時寫到一半的檔案先回滾，避免被當成已索引
+    rolled_back = recover_interrupted_runs(db)
+    if rolled_back:
+        print_warning(f"回滾上次中斷時未寫完的檔案: {rolled_back} 個")
+
+    if files_from:
+        # 只 stat 清單中的路徑，工作量與變動數量成正比
+        change = FileScanner().read_change_list(files_from.read(), root_path)
+        print_info(f"變動清單: {len(change['paths'])} 個檔案，{len(change['removed_dirs'])} 個刪除標記")
+        if workers == 0:
+            workers = INDEX_CONFIG['max_workers']
+        result = reindex_paths(db, change['paths'], workers=workers, engine=engine,
+                               removed_dirs=change['removed_dirs'], incremental=incremental,
+                               retry_failed=retry_failed)
+        db.close()
 
-    # 判斷是單個檔案還是目錄
-    if os.path.isfile(path):
+        click.echo()
+        print_header("📊 索引完成")
+        print_success(f"成功索引: {result['success']} 個檔案")
+        if result['failed'] > 0:
+            print_warning(f"失敗: {result['failed']} 個檔案")
+        if result['unchanged'] > 0:
+            print_info(f"內容未變: {result['unchanged']} 個檔案")
+        if result['linked'] > 0:
+            print_info(f"內容相同: {result['linked']} 個檔案（共用已索引的單元格）")
+        if result['deleted'] > 0:
+            print_info(f"移除: {result['deleted']} 個檔案")
+        print_info(f"總單元格數: {result['cells']:,}")
+        return
+
+    run = find_resumable_run(db, root_path) if resume else None
+    if resume and not run:
+        print_warning("沒有可續跑的中斷索引，改為重新掃描")
+
+    if run:
+        run_id = run['run_id']
+        scanner = FileScanner()
+        files_to_index = [info for info in (scanner.get_file_info(file_path)
+                                            for file_path in db.get_run_files(run_id, ('pending',)))
+                          if info]
+        db.set_index_run_status(run_id, 'running')
+        print_info(f"續跑索引 #{run_id}（開始於 {run['started_at']}）: "
+                   f"剩餘 {len(files_to_index)} / {run['file_count']} 個檔案")
+    elif os.path.isfile(path):
         files_to_index = [{
             'file_path': os.path.abspath(path),
             'file_name': os.path.basename(path),
@@ -138,128 +700,149 @@ def index(path, recursive):
             'last_modified': datetime.fromtimestamp(os.path.getmtime(path))
         }]
         print_info(f"索引單個檔案: {os.path.basename(path)}")
+    elif pipeline:
+        # 管線模式：邊掃描邊解析，掃描結果在索引時才逐批取得
+        print_info(f"掃描目錄: {path}（管線模式：邊掃描邊解析）")
+        scanner = FileScanner()
+        snapshot = DirectorySnapshot(db.get_dir_snapshot(root_path) if incremental else None)
+        files_to_index = None
     else:
         # 掃描目錄
         print_info(f"掃描目錄: {path}")
         scanner = FileScanner()
-        files_to_index = scanner.scan_directory(path, recursive=recursive, show_progress=True)
+        # 增量索引時，mtime 未變的目錄直接沿用上次的目錄快照
+        snapshot = DirectorySnapshot(db.get_dir_snapshot(root_path) if incremental else None)
+        files_to_index = scanner.scan_directory(path, recursive=recursive, show_progress=True,
+                                                snapshot=snapshot)
+        db.save_dir_snapshot(snapshot, prune=recursive)
         print_success(f"找到 {len(files_to_index)} 個 Excel 檔案")
+        if snapshot.reused:
+            print_info(f"沿用目錄快照: {snapshot.reused} / {len(snapshot.visited)} 個目錄未變動")
 
-    if not files_to_index:
+    if files_to_index is not None and not files_to_index and not run:
         print_warning("沒有找到 Excel 檔案")
         return
 
+    if not run:
+        # 重新開始後，同一路徑之前中斷的執行不再續跑
+        for old_run in db.get_index_runs('interrupted'):
+            if old_run['root_path'] == root_path:
+                db.set_index_run_status(old_run['run_id'], 'abandoned')
+        # 管線模式的檔案清單隨掃描逐批加入
+        run_id = db.start_index_run(root_path, [f['file_path'] for f in files_to_index or []])
+
     click.echo()
 
     # 索引檔案
-    success_count = 0
-    failed_count = 0
-    total_cells = 0
-
-    with tqdm(files_to_index, desc="索引中", unit="檔案") as pbar:
-        for file_info in pbar:
-            try:
-                # 讀取檔案內容
-                cells_data = read_excel_file(file_info['file_path'])
-
-                if not cells_data:
-                    pbar.write(f"⚠️  跳過空檔案: {file_info['file_name']}")
-                    continue
-
-                # 添加檔案記錄
-                file_id = db.add_file(
-                    file_path=file_info['file_path'],
-                    file_name=file_info['file_name'],
-                    last_modified=file_info['last_modified'],
-                    file_size=file_info['file_size']
-                )
-
-                # 準備單元格資料
-                cells_to_insert = []
-                for cell in cells_data:
-                    cells_to_insert.append({
-                        'file_id': file_id,
-                        'sheet_name': cell['sheet_name'],
-                        'row': cell['row'],
-                        'col': cell['col'],
-                        'location': cell['location'],
-                        'value': cell['value'],
-                    })
-
-                # 批量插入
-                db.add_cells_batch(cells_to_insert)
-                db.update_file_cell_count(file_id)
-
-                success_count += 1
-                total_cells += len(cells_data)
-                pbar.set_postfix({'成功': success_count, '單元格': total_cells})
-
-            except Exception as e:
-                failed_count += 1
-                pbar.write(f"❌ 索引失敗: {file_info['file_name']} - {e}")
-                continue
+    if workers == 0:
+        workers = INDEX_CONFIG['max_workers']
+    if workers > 1:
+        print_info(f"使用 {workers} 個進程平行解析")
+    if bulk and db.has_cells():
+        print_warning("資料庫已有索引內容，--bulk 只適用於首次建立，改用一般模式")
+        bulk = False
+    if bulk:
+        print_info("批量載入模式：載入完成後才建立索引與全文檢索")
+
+    if files_to_index is None:
+        file_stream = scanner.iter_directory(path, recursive=recursive, snapshot=snapshot)
+        files_to_index, plan, result = index_pipelined(
+            db, file_stream, run_id=run_id, workers=workers, engine=engine, schedule=schedule,
+            incremental=incremental, retry_failed=retry_failed)
+        db.save_dir_snapshot(snapshot, prune=recursive)
+        print_success(f"找到 {len(files_to_index)} 個 Excel 檔案"
+                      f"（{result['first_batch_seconds']:.1f} 秒後開始解析第一批）")
+        if snapshot.reused:
+            print_info(f"沿用目錄快照: {snapshot.reused} / {len(snapshot.visited)} 個目錄未變動")
+    else:
+        # 修改時間與大小未變的檔案直接跳過，其餘以內容指紋判斷哪些檔案需要解析
+        plan = plan_index(db, files_to_index, incremental=incremental, retry_failed=retry_failed)
+        with db.bulk_load() if bulk else nullcontext():
+            result = index_planned(db, plan, workers=workers, engine=engine, run_id=run_id,
+                                   schedule=schedule)
+    db.set_index_run_status(run_id, 'completed')
 
     click.echo()
     print_header("📊 索引完成")
 
-    print_success(f"成功索引: {success_count} 個檔案")
-    if failed_count > 0:
-        print_warning(f"失敗: {failed_count} 個檔案")
-    print_info(f"總單元格數: {total_cells:,}")
+    print_success(f"成功索引: {result['success']} 個檔案")
+    if result['failed'] > 0:
+        print_warning(f"失敗: {result['failed']} 個檔案")
+    if result['invalid'] > 0:
+        print_warning(f"結構損壞: {result['invalid']} 個檔案（未解析）")
+    if plan['quarantined'] > 0:
+        print_info(f"已知失敗（未變動，跳過）: {plan['quarantined']} 個檔案，使用 --retry-failed 重試")
+    if result['unchanged'] > 0:
+        print_info(f"內容未變: {result['unchanged']} 個檔案")
+    if result['partial'] > 0:
+        print_info(f"部分重新索引: {result['partial']} 個檔案（只寫入有變動的工作表）")
+    if result['linked'] > 0:
+        print_info(f"內容相同: {result['linked']} 個檔案（共用已索引的單元格）")
+    print_info(f"總單元格數: {result['cells']:,}")
+    if result['wall_seconds'] > 0:
+        print_info(f"Worker 使用率: {result['utilization']:.0%}"
+                   f"（解析 {result['parse_seconds']:.1f} 秒 / 總耗時 {result['wall_seconds']:.1f} 秒 × {result['workers']} 個 worker）")
 
     # 顯示統計
     stats = db.get_stats()
     print_info(f"資料庫大小: {stats['db_size_mb']} MB")
 
+    if watch and os.path.isdir(path):
+        click.echo()
+        watch_index(db, root_path, workers=workers, engine=engine)
+
     db.close()
 
 
 @cli.command()
-@click.argument('keyword')
+@click.argument('keyword', required=False)
 @click.option('--limit', default=20, help='最多顯示幾個結果')
 @click.option('--full-row', is_flag=True, help='顯示完整行資料')
-def search(keyword, limit, full_row):
+@click.option('--num-between', nargs=2, type=float, default=None, metavar='MIN MAX',
+              help='只找數值介於 MIN 與 MAX 之間（含）的儲存格')
+@click.option('--date-after', type=click.DateTime(), default=None,
+              help='只找此日期（含）之後的日期儲存格')
+@click.option('--date-before', type=click.DateTime(), default=None,
+              help='只找此日期（不含）之前的日期儲存格')
+@click.option('--mode', type=click.Choice(SEARCH_MODES), default=SEARCH_CONFIG['search_mode'],
+              help='fts: 全文索引（依相關度排序，比對詞的開頭，有 trigram 索引時也比對子字串；'
+                   '中日韓文字與符號改用子字串比對）；'
+                   'like: 比對任意子字串（沒有 trigram 索引時逐筆掃描，較慢）')
+def search(keyword, limit, full_row, num_between, date_after, date_before, mode):
     """
     搜索關鍵詞
 
-    KEYWORD: 要搜索的關鍵詞
+    KEYWORD: 要搜索的關鍵詞（使用數值或日期範圍時可省略）
     """
-    print_header(f"🔍 搜索: \"{keyword}\"")
+    conditions, params, description = build_search_filters(
+        keyword, num_between, date_after, date_before)
+    print_header(f"🔍 搜索: {description}")
 
     db = get_db()
 
-    # 執行搜索
-    cursor = db.conn.cursor()
-    cursor.execute('''
-        SELECT
-            f.file_name,
-            f.file_path,
-            c.sheet_name,
-            c.cell_location,
-            c.value,
-            c.row_num,
-            c.col_num,
-            c.file_id
-        FROM cells c
-        JOIN files f ON c.file_id = f.file_id
-        WHERE c.value_lower LIKE ?
-        ORDER BY f.file_name, c.sheet_name, c.row_num, c.col_num
-        LIMIT ?
-    ''', (f'%{keyword.lower()}%', limit))
-
-    results = cursor.fetchall()
+    start = time.perf_counter()
+    results, used_mode = search_cells(db.conn, keyword, conditions, params, limit=limit, mode=mode)
+    elapsed = time.perf_counter() - start
+
+    if keyword and used_mode != mode:
+        print_info("全文索引無法比對此關鍵詞，改用子字串比對")
+    elif keyword and mode == 'fts' and not results and not substring_indexed(db.conn, keyword):
+        print_info("全文索引只比對詞的開頭，要找詞中間的片段請用 --mode like")
 
     if not results:
-        print_warning(f"沒有找到包含 \"{keyword}\" 的結果")
+        print_warning(f"沒有找到符合 {description} 的結果")
         db.close()
         return
 
-    print_success(f"找到 {len(results)} 個結果")
+    print_success(f"找到 {len(results)} 個結果（{elapsed * 1000:.0f} ms）")
     click.echo()
 
     # 顯示結果
+    cursor = db.conn.cursor()
     for i, row in enumerate(results, 1):
-        file_name, file_path, sheet_name, location, value, row_num, col_num, file_id = row
+        file_name, sheet_name, location, value = (
+            row['file_name'], row['sheet_name'], row['cell_location'], row['value'])
+        row_num, col_num, file_id = row['row_num'], row['col_num'], row['file_id']
 
         click.echo("─" * 70)
         click.secho(f"結果 {i}", fg='cyan', bold=True)
@@ -268,7 +851,9 @@ def search(keyword, limit, full_row):
         click.echo(f"📍 位置: {location} (第{row_num}行, 第{col_num}列)")
 
         # 高亮關鍵詞
-        highlighted = value.replace(keyword, click.style(keyword, fg='yellow', bold=True))
+        highlighted = value
+        if keyword:
+            highlighted = value.replace(keyword, click.style(keyword, fg='yellow', bold=True))
         click.echo(f"📝 內容: {highlighted}")
 
         # 如果需要顯示完整行
@@ -295,6 +880,37 @@ def search(keyword, limit, full_row):
     db.close()
 
 
+@cli.command('build-trigram')
+@click.option('--drop', is_flag=True, help='刪除 trigram 索引')
+def build_trigram(drop):
+    """
+    由現有單元格建立 trigram 子字串索引（需要 SQLite 3.34 以上）
+
+    建立後 search 比對至少三個字元的子字串（例如 PN3004-A 中的 3004）時由索引找出候選，
+    不必逐筆掃描，fts 模式也會找到這些子字串；之後的 index 會自動維護。已存在時重建。
+    """
+    db = get_db()
+
+    if drop:
+        db.drop_trigram_index()
+        print_success("已刪除 trigram 索引")
+        db.close()
+        return
+
+    print_header("🔤 建立 trigram 子字串索引")
+    start = time.perf_counter()
+    try:
+        db.create_trigram_index()
+    except RuntimeError as e:
+        print_error(str(e))
+        db.close()
+        return
+    elapsed = time.perf_counter() - start
+
+    print_success(f"完成 {db.get_stats()['cell_count']:,} 個單元格，耗時 {elapsed:.1f} 秒")
+    db.close()
+
+
 @cli.command()
 def stats():
     """顯示資料庫統計資訊"""
@@ -309,6 +925,8 @@ def stats():
     click.echo(f"🗄️  資料庫大小:     {stats['db_size_mb']} MB")
     click.echo(f"📊 平均單元格/檔案: {stats['avg_cells_per_file']:.0f}")
     click.echo(f"🕒 最後索引時間:   {stats['last_indexed'] or '尚未索引'}")
+    click.echo(f"🚫 失敗檔案數:     {stats['failed_count']:,}")
+    click.echo(f"🔤 trigram 索引:   {'已建立' if stats['trigram_index'] else '未建立（可用 build-trigram 建立）'}")
 
     click.echo()
 
@@ -334,6 +952,27 @@ def stats():
     db.close()
 
 
+@cli.command()
+def failed():
+    """列出無法索引的檔案"""
+    print_header("🚫 無法索引的檔案")
+
+    db = get_db()
+    failed_files = db.get_failed_files()
+    db.close()
+
+    if not failed_files:
+        print_success("沒有失敗的檔案")
+        return
+
+    for failed_file in failed_files:
+        click.secho(f"[{failed_file['status']}] {failed_file['file_path']}", fg='red')
+        click.echo(f"   {failed_file['error']} | {failed_file['failed_at']}")
+
+    click.echo()
+    print_info(f"共 {len(failed_files)} 個檔案；檔案變動後會自動重試，或使用 index --retry-failed")
+
+
 @cli.command()
 @click.confirmation_option(prompt='確定要清空資料庫嗎？')
 def clear():
@@ -0,0 +1,216 @@
+"""
+Excel 搜索系統 - 搜索引擎模組
+關鍵詞以 content_fts MATCH 查詢並依 bm25 排序，再對應回 cells 與 files；
+有 trigram 索引時再以索引補上其他包含關鍵詞的單元格；子字串比對（LIKE）為另一種模式
+"""
+import re
+import sqlite3
+import logging
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+from database import FTS_ROWID_VERSION
+
+logger = logging.getLogger(__name__)
+
+# 搜索模式：fts（全文索引，預設）或 like（子字串比對）
+SEARCH_MODES = ('fts', 'like')
+
+# trigram 索引只能比對至少三個字元的子字串
+TRIGRAM_MIN_LENGTH = 3
+
+# 中日韓文字之間沒有分詞邊界，unicode61 分詞器會把整段連續文字當成一個詞，
+# 只能找到以關鍵詞開頭的儲存格，因此這類關鍵詞改用 LIKE
+_NO_WORD_BREAK = re.compile('[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+# unicode61 分詞器視為詞的一部分的字元（字母與數字）
+_WORD_CHAR = re.compile(r'[^\W_]')
+
+_RESULT_COLUMNS = '''
+    f.file_name,
+    f.file_path,
+    c.sheet_name,
+    c.cell_location,
+    c.value,
+    c.row_num,
+    c.col_num,
+    c.file_id
+'''
+
+# 單元格對應到保存它的檔案與所有內容相同的檔案。不寫成 f.file_id = c.file_id OR
+# f.content_file_id = c.file_id：content_file_id 大多是 NULL，統計資訊讓 SQLite 認為
+# 走索引與掃描 files 一樣貴，結果對每個候選單元格都掃描一次 files
+_FILES_JOIN = '''
+    JOIN files f ON f.file_id IN (
+        SELECT c.file_id
+        UNION ALL
+        SELECT a.file_id FROM files a WHERE a.content_file_id = c.file_id
+    )
+'''
+
+
+def build_match_query(keyword: str) -> Optional[str]:
+    """
+    把關鍵詞轉成只比對 cell_value 欄的 FTS5 查詢
+
+    整個關鍵詞當成一個詞組（詞必須相鄰且依序出現），最後一個詞以前綴比對，
+    例如 "PN30" 可以找到 "PN3004-A"。雙引號會跳脫，關鍵詞中的運算子不會生效。
+
+    Args:
+        keyword: 關鍵詞
+
+    Returns:
+        FTS5 查詢字串；關鍵詞無法以全文索引比對時回傳 None
+    """
+    if not _WORD_CHAR.search(keyword) or _NO_WORD_BREAK.search(keyword):
+        return None
+    phrase = keyword.strip().replace('"', '""')
+    return f'cell_value : "{phrase}"*'
+
+
+def fts_ready(conn: sqlite3.Connection) -> bool:
+    """content_fts 的 rowid 是否已對應 cells.cell_id（舊版資料庫由 Database 開啟時會自動重建）"""
+    return conn.execute('PRAGMA user_version').fetchone()[0] >= FTS_ROWID_VERSION
+
+
+def trigram_ready(conn: sqlite3.Connection) -> bool:
+    """是否已建立 content_trigram 子字串索引（見 Database.create_trigram_index()）"""
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_trigram'")
+    return cursor.fetchone() is not None
+
+
+def substring_indexed(conn: sqlite3.Connection, keyword: str) -> bool:
+    """關鍵詞的子字串比對能否由 trigram 索引找出候選單元格（不必逐筆掃描 cells）"""
+    return len(keyword) >= TRIGRAM_MIN_LENGTH and trigram_ready(conn)
+
+
+def search_cells(conn: sqlite3.Connection, keyword: Optional[str] = None,
+                 conditions: Sequence[str] = (), params: Sequence[Any] = (),
+                 limit: int = 20, mode: str = 'fts') -> Tuple[List[Dict[str, Any]], str]:
+    """
+    搜索單元格
+
+    fts 模式比對詞的開頭，結果依 bm25 相關度排序。有 trigram 索引且關鍵詞至少三個字元時，
+    再由 trigram 索引補上其他包含關鍵詞的單元格（例如 PN3004-A 中的 3004），排在詞開頭的結果之後；
+    沒有 trigram 索引時只比對詞的開頭，3004 找不到 PN3004-A，要用 like 模式。
+    找不到結果時回傳空列表，不會改用 like 模式逐筆掃描，因此同一個關鍵詞的結果
+    與是否有詞開頭的比對無關。
+    關鍵詞無法以全文索引比對（只有符號、含中日韓文字）、全文索引尚未對應單元格
+    或查詢失敗時改用 like 模式，呼叫端可由回傳的實際搜索模式得知並告知使用者。
+    like 模式與沒有關鍵詞時，結果依檔名、工作表、行、列排序。
+
+    like 模式在有 trigram 索引且關鍵詞至少三個字元時，由索引找出候選單元格，
+    再以 cells 中的內容確認；否則逐筆掃描 cells。trigram 索引只影響速度，不影響結果。
+
+    Args:
+        conn: SQLite 連接
+        keyword: 關鍵詞，None 表示只用其他條件
+        conditions: 其他 WHERE 條件（以 c 代表 cells、f 代表 files）
+        params: 其他條件的參數
+        limit: 最多回傳幾筆
+        mode: 搜索模式（見 SEARCH_MODES）
+
+    Returns:
+        (結果列表, 實際使用的搜索模式)
+
+    Raises:
+        ValueError: 未知的搜索模式
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"未知的搜索模式: {mode}")
+
+    if keyword and mode == 'fts':
+        match_query = build_match_query(keyword)
+        if match_query is not None and fts_ready(conn):
+            try:
+                results = _search_fts(conn, match_query, conditions, params, limit)
+                if len(results) < limit and substring_indexed(conn, keyword):
+                    results = _merge_results(results, _search_scan(
+                        conn, *_substring_conditions(conn, keyword, conditions, params), limit), limit)
+                return results, 'fts'
+            except sqlite3.OperationalError as e:
+                logger.warning(f"全文索引查詢失敗，改用 LIKE: {match_query}, 錯誤: {e}")
+        mode = 'like'
+
+    if keyword:
+        conditions, params = _substring_conditions(conn, keyword, conditions, params)
+    return _search_scan(conn, conditions, params, limit), mode
+
+
+# ============================================================================
+# 私有輔助函數
+# ============================================================================
+
+def _substring_conditions(conn: sqlite3.Connection, keyword: str, conditions: Sequence[str],
+                          params: Sequence[Any]) -> Tuple[List[str], List[Any]]:
+    """
+    在其他條件前加上子字串比對的條件
+
+    子字串比對一律以 cells 中的內容確認；trigram 索引只負責縮小候選範圍。
+
+    Returns:
+        (條件列表, 參數列表)
+    """
+    conditions = ['c.value_lower LIKE ?', *conditions]
+    params = [f'%{keyword.lower()}%', *params]
+    if substring_indexed(conn, keyword):
+        conditions.insert(0, 'c.cell_id IN (SELECT rowid FROM content_trigram WHERE content_trigram MATCH ?)')
+        params.insert(0, '"{}"'.format(keyword.replace('"', '""')))
+    return conditions, params
+
+
+def _merge_results(first: List[Dict[str, Any]], rest: List[Dict[str, Any]],
+                   limit: int) -> List[Dict[str, Any]]:
+    """把 rest 中不在 first 的結果接在 first 之後，最多 limit 筆"""
+    seen = {(row['file_path'], row['sheet_name'], row['cell_location']) for row in first}
+    merged = list(first)
+    for row in rest:
+        if len(merged) >= limit:
+            break
+        if (row['file_path'], row['sheet_name'], row['cell_location']) not in seen:
+            merged.append(row)
+    return merged
+
+
+def _search_fts(conn: sqlite3.Connection, match_query: str, conditions: Sequence[str],
+                params: Sequence[Any], limit: int) -> List[Dict[str, Any]]:
+    """
+    以全文索引找出符合的 cell_id 再對應回單元格
+
+    沒有其他條件時在全文索引內就先取前 limit 筆（每個單元格至少對應一個檔案），
+    不必把所有符合的單元格都對應回 cells。
+    """
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    cursor = conn.execute(f'''
+        SELECT {_RESULT_COLUMNS}, m.score
+        FROM (
+            SELECT rowid AS cell_id, bm25(content_fts) AS score
+            FROM content_fts
+            WHERE content_fts MATCH ?
+            ORDER BY score
+            LIMIT ?
+        ) m
+        JOIN cells c ON c.cell_id = m.cell_id
+        {_FILES_JOIN}
+        {where}
+        ORDER BY m.score, f.file_name, c.sheet_name, c.row_num, c.col_num
+        LIMIT ?
+    ''', (match_query, -1 if conditions else limit, *params, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def _search_scan(conn: sqlite3.Connection, conditions: Sequence[str], params: Sequence[Any],
+                 limit: int) -> List[Dict[str, Any]]:
+    """
+    以 WHERE 條件查詢 cells
+
+    數值與日期條件走 idx_cells_num 的範圍掃描，trigram 條件由索引找出的 cell_id 查詢。
+    """
+    cursor = conn.execute(f'''
+        SELECT {_RESULT_COLUMNS}
+        FROM cells c
+        {_FILES_JOIN}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY f.file_name, c.sheet_name, c.row_num, c.col_num
+        LIMIT ?
+    ''', (*params, limit))
+    return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,68 @@
+"""
+測試共用設定：兩個版本的模組都以平面方式匯入（與執行 CLI 時相同）
+"""
+import os
+import sys
+import shutil
+import zipfile
+
+import pytest
+from openpyxl import Workbook
+
+MAIN_CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for version_dir in ('mariadb_version', 'sqlite_version'):
+    sys.path.insert(0, os.path.join(MAIN_CODE_DIR, version_dir))
+
+
+def write_workbook(path, sheets):
+    """
+    寫入測試用活頁簿
+
+    Args:
+        path: 檔案路徑
+        sheets: 工作表名 -> A 欄的值列表（依序寫入）
+    """
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet_name, values in sheets.items():
+        ws = wb.create_sheet(sheet_name)
+        for row, value in enumerate(values, start=1):
+            ws.cell(row=row, column=1, value=value)
+    wb.save(path)
+
+
+def corrupt_sheet(path, sheet_index):
+    """截斷活頁簿中第 sheet_index 個工作表的 XML（其餘部件不變），讓解析失敗"""
+    member = f'xl/worksheets/sheet{sheet_index}.xml'
+    original = f'{path}.orig'
+    shutil.move(path, original)
+    with zipfile.ZipFile(original) as zin, zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zout:
+        for item in zin.infolist():
+            data = zin.read(item.filename)
+            if item.filename == member:
+                data = data[:len(data) // 2]
+            zout.writestr(item, data)
+    os.remove(original)
+
+
+def scan_files(directory):
+    """掃描目錄中的 Excel 檔案（與 index 指令相同的掃描規則）"""
+    from file_scanner import FileScanner
+    return FileScanner().scan_directory(str(directory), show_progress=False)
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """暫存目錄中的 SQLite 資料庫"""
+    from database import Database
+    db = Database(str(tmp_path / 'excel_search.db'))
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def workbook_dir(tmp_path):
+    """放測試活頁簿的目錄"""
+    directory = tmp_path / 'workbooks'
+    directory.mkdir()
+    return directory
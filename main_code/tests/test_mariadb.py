@@ -0,0 +1,90 @@
+"""
+MariaDB 版本的索引流程（需要可連線的 MariaDB）
+
+只在設定環境變數 EXCEL_SEARCH_MARIADB_TEST_DB 時執行：值為專供測試用的資料庫名稱，
+其中的資料表會被清空。其餘連線設定沿用 config_mariadb.DB_CONFIG。
+"""
+import os
+
+import pytest
+
+from conftest import write_workbook, corrupt_sheet, scan_files
+
+TEST_DATABASE = os.environ.get('EXCEL_SEARCH_MARIADB_TEST_DB')
+
+pytestmark = pytest.mark.skipif(not TEST_DATABASE,
+                                reason='未設定 EXCEL_SEARCH_MARIADB_TEST_DB（測試用 MariaDB 資料庫）')
+
+
+@pytest.fixture
+def mariadb(monkeypatch):
+    """連線到測試資料庫並清空所有資料表"""
+    import database_mariadb
+    monkeypatch.setitem(database_mariadb.DB_CONFIG, 'database', TEST_DATABASE)
+    db = database_mariadb.DatabaseManager()
+    if not db.connect():
+        pytest.skip(f'無法連線到 MariaDB 測試資料庫: {TEST_DATABASE}')
+    db.create_tables()
+    db.clear_database()
+    yield db
+    db.close()
+
+
+def index_directory(db, directory, bulk=False):
+    from contextlib import nullcontext
+    from indexer import plan_index
+    from excel_search_cli_mariadb import index_planned
+    plan = plan_index(db, scan_files(directory))
+    with db.bulk_load() if bulk else nullcontext():
+        return index_planned(db, plan)
+
+
+def sheet_values(db, file_path):
+    db.cursor.execute("""
+        SELECT c.sheet_name, c.value FROM cells c JOIN files f ON f.file_id = c.file_id
+        WHERE f.file_path = %s ORDER BY c.sheet_name, c.row_num
+    """, (file_path,))
+    values = {}
+    for row in db.cursor.fetchall():
+        values.setdefault(row['sheet_name'], []).append(row['value'])
+    return values
+
+
+def test_failed_partial_reindex_keeps_existing_content(mariadb, workbook_dir):
+    path = str(workbook_dir / 'two.xlsx')
+    write_workbook(path, {'S1': [f'keep{i}' for i in range(20)],
+                          'S2': [f'old{i}' for i in range(20)]})
+    index_directory(mariadb, workbook_dir)
+    before = mariadb.get_file_by_path(path)
+
+    corrupt_sheet(path, 2)
+    result = index_directory(mariadb, workbook_dir)
+    assert (result['success'], result['failed']) == (0, 1)
+
+    # 修改時間與指紋不更新，下次檔案變動時仍會重新索引
+    values = sheet_values(mariadb, path)
+    assert values['S1'] == [f'keep{i}' for i in range(20)]
+    assert values['S2'] == [f'old{i}' for i in range(20)]
+    after = mariadb.get_file_by_path(path)
+    assert (after['file_size'], after['content_hash']) == (before['file_size'], before['content_hash'])
+
+
+def test_bulk_reindex_leaves_no_orphaned_rows(mariadb, workbook_dir):
+    for name in ('changed', 'emptied', 'broken'):
+        write_workbook(str(workbook_dir / f'{name}.xlsx'), {'S1': [f'{name}{i}' for i in range(20)]})
+    index_directory(mariadb, workbook_dir, bulk=True)
+
+    # 工作表改名讓三個檔案都整個重新索引：成功、變成空檔案、解析失敗各走一次刪除
+    write_workbook(str(workbook_dir / 'changed.xlsx'), {'T1': ['new']})
+    write_workbook(str(workbook_dir / 'emptied.xlsx'), {'T1': []})
+    write_workbook(str(workbook_dir / 'broken.xlsx'), {'T1': [f'broken{i}' for i in range(20)]})
+    corrupt_sheet(str(workbook_dir / 'broken.xlsx'), 1)
+    index_directory(mariadb, workbook_dir, bulk=True)
+
+    for table in ('cells', 'sheet_parts'):
+        mariadb.cursor.execute(f"""
+            SELECT COUNT(*) AS orphans FROM {table} t
+            LEFT JOIN files f ON f.file_id = t.file_id WHERE f.file_id IS NULL
+        """)
+        assert mariadb.cursor.fetchone()['orphans'] == 0, table
+    assert sheet_values(mariadb, str(workbook_dir / 'changed.xlsx')) == {'T1': ['new']}
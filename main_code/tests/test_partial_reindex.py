@@ -0,0 +1,126 @@
+"""
+SQLite 版本：只重新索引有變動的工作表，成功時取代該工作表，失敗時保留原本的內容
+"""
+import os
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+from conftest import write_workbook, corrupt_sheet, scan_files
+from indexer import plan_index
+from excel_search_cli import index_planned
+
+
+def index_directory(db, directory, workers=1):
+    plan = plan_index(db, scan_files(directory))
+    return index_planned(db, plan, workers=workers)
+
+
+def sheet_values(db, file_path):
+    cursor = db.conn.execute('''
+        SELECT c.sheet_name, c.value FROM cells c JOIN files f ON f.file_id = c.file_id
+        WHERE f.file_path = ? ORDER BY c.sheet_name, c.row_num
+    ''', (file_path,))
+    values = {}
+    for sheet_name, value in cursor.fetchall():
+        values.setdefault(sheet_name, []).append(value)
+    return values
+
+
+def assert_fts_consistent(db):
+    """content_fts 與 cells 一一對應（沒有遺留或缺少的全文索引記錄）"""
+    cells = db.conn.execute('SELECT COUNT(*) FROM cells').fetchone()[0]
+    matched = db.conn.execute('''
+        SELECT COUNT(*) FROM content_fts t
+        JOIN cells c ON c.cell_id = t.rowid AND c.value = t.cell_value AND c.file_id = t.file_id
+    ''').fetchone()[0]
+    assert db.conn.execute('SELECT COUNT(*) FROM content_fts').fetchone()[0] == cells == matched
+
+
+def make_two_sheet_workbook(directory):
+    path = str(directory / 'two.xlsx')
+    write_workbook(path, {'S1': [f'keep{i}' for i in range(20)],
+                          'S2': [f'old{i}' for i in range(20)]})
+    return path
+
+
+def test_partial_reindex_replaces_only_the_changed_sheet(sqlite_db, workbook_dir):
+    path = make_two_sheet_workbook(workbook_dir)
+    assert index_directory(sqlite_db, workbook_dir)['success'] == 1
+
+    wb = load_workbook(path)
+    for row in range(1, 11):
+        wb['S2'].cell(row=row, column=1, value=f'new{row}')
+    wb.save(path)
+
+    result = index_directory(sqlite_db, workbook_dir)
+    assert (result['success'], result['partial'], result['failed']) == (1, 1, 0)
+
+    values = sheet_values(sqlite_db, path)
+    assert values['S1'] == [f'keep{i}' for i in range(20)]
+    assert values['S2'] == [f'new{i}' for i in range(1, 11)] + [f'old{i}' for i in range(10, 20)]
+    assert sqlite_db.get_file_by_path(path)['cell_count'] == 40
+    assert_fts_consistent(sqlite_db)
+
+
+def test_failed_partial_reindex_keeps_existing_content(sqlite_db, workbook_dir):
+    path = make_two_sheet_workbook(workbook_dir)
+    index_directory(sqlite_db, workbook_dir)
+    before = sqlite_db.get_file_by_path(path)
+
+    corrupt_sheet(path, 2)
+    result = index_directory(sqlite_db, workbook_dir)
+    assert (result['success'], result['failed']) == (0, 1)
+
+    # 未變動與變動中的工作表都保留上次成功的內容，修改時間與指紋也不更新
+    values = sheet_values(sqlite_db, path)
+    assert values['S1'] == [f'keep{i}' for i in range(20)]
+    assert values['S2'] == [f'old{i}' for i in range(20)]
+    after = sqlite_db.get_file_by_path(path)
+    assert (after['file_size'], after['content_hash']) == (before['file_size'], before['content_hash'])
+    assert after['file_size'] != os.path.getsize(path)
+    assert sqlite_db.get_failed_file(path) is not None
+    assert_fts_consistent(sqlite_db)
+
+
+def test_failed_partial_reindex_keeps_existing_content_in_parallel(sqlite_db, workbook_dir):
+    path = make_two_sheet_workbook(workbook_dir)
+    write_workbook(str(workbook_dir / 'other.xlsx'), {'S1': ['other']})
+    index_directory(sqlite_db, workbook_dir, workers=2)
+
+    # 兩個檔案都要重新解析，事件才會交錯（不走整個檔案一個 SAVEPOINT 的逐一解析路徑）
+    corrupt_sheet(path, 2)
+    write_workbook(str(workbook_dir / 'other.xlsx'), {'S1': ['other', 'changed']})
+    result = index_directory(sqlite_db, workbook_dir, workers=2)
+    assert (result['success'], result['failed']) == (1, 1)
+
+    values = sheet_values(sqlite_db, path)
+    assert values['S1'] == [f'keep{i}' for i in range(20)]
+    assert values['S2'] == [f'old{i}' for i in range(20)]
+    assert_fts_consistent(sqlite_db)
+
+
+def test_interrupted_run_rolls_back_only_new_cells(sqlite_db, workbook_dir):
+    from excel_search_cli import recover_interrupted_runs
+    path = make_two_sheet_workbook(workbook_dir)
+    new_path = str(workbook_dir / 'new.xlsx')
+    index_directory(sqlite_db, workbook_dir)
+    file_id = sqlite_db.get_file_id(path)
+
+    # 模擬平行解析時批次提交後中斷：已有檔案寫了部分新單元格，新檔案只寫了一半
+    run_id = sqlite_db.start_index_run(str(workbook_dir), [path, new_path])
+    sqlite_db.set_run_file_state(run_id, path, 'in_progress', cell_watermark=sqlite_db.last_cell_id())
+    sqlite_db.add_cells_batch([{'file_id': file_id, 'sheet_name': 'S2', 'row': row, 'col': 1,
+                                'location': f'A{row}', 'value': f'half{row}'} for row in range(1, 4)])
+    new_id = sqlite_db.add_file(new_path, 'new.xlsx', datetime.now(), 0)
+    sqlite_db.set_run_file_state(run_id, new_path, 'in_progress')
+    sqlite_db.add_cells_batch([{'file_id': new_id, 'sheet_name': 'S1', 'row': 1, 'col': 1,
+                                'location': 'A1', 'value': 'half'}])
+
+    assert recover_interrupted_runs(sqlite_db) == 2
+    values = sheet_values(sqlite_db, path)
+    assert values['S1'] == [f'keep{i}' for i in range(20)]
+    assert values['S2'] == [f'old{i}' for i in range(20)]
+    assert sqlite_db.get_file_id(new_path) is None
+    assert sqlite_db.get_run_files(run_id, ('pending',)) == sorted([path, new_path])
+    assert_fts_consistent(sqlite_db)
@@ -0,0 +1,73 @@
+"""
+SQLite 版本：fts 與 like 模式的搜索結果
+"""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from database import TRIGRAM_MIN_SQLITE
+from search_engine import search_cells
+
+needs_trigram = pytest.mark.skipif(sqlite3.sqlite_version_info < TRIGRAM_MIN_SQLITE,
+                                   reason='SQLite 版本不支援 trigram 分詞器')
+
+VALUES = ['PN3004-A', '3004', 'running fast', 'runner', 'runny', 'Engineering', '料號 PN3004']
+
+
+@pytest.fixture
+def search_db(sqlite_db, tmp_path):
+    file_id = sqlite_db.add_file(str(tmp_path / 'parts.xlsx'), 'parts.xlsx', datetime.now(), 0)
+    sqlite_db.add_cells_batch([{'file_id': file_id, 'sheet_name': 'S1', 'row': row, 'col': 1,
+                                'location': f'A{row}', 'value': value}
+                               for row, value in enumerate(VALUES, start=1)])
+    return sqlite_db
+
+
+def search(db, keyword, mode):
+    results, used_mode = search_cells(db.conn, keyword, limit=20, mode=mode)
+    return sorted(row['value'] for row in results), used_mode
+
+
+def test_fts_matches_word_prefixes_only(search_db):
+    assert search(search_db, 'runn', 'fts') == (['runner', 'running fast', 'runny'], 'fts')
+    assert search(search_db, '3004', 'fts') == (['3004'], 'fts')
+
+
+def test_fts_without_hits_does_not_fall_back_to_like(search_db):
+    # 找不到詞的開頭時不逐筆掃描 cells，結果與有沒有其他詞開頭的比對無關
+    assert search(search_db, 'ngineeri', 'fts') == ([], 'fts')
+
+
+def test_like_matches_substrings(search_db):
+    assert search(search_db, '3004', 'like') == (['3004', 'PN3004-A', '料號 PN3004'], 'like')
+    assert search(search_db, 'ngineeri', 'like') == (['Engineering'], 'like')
+
+
+def test_unmatchable_keyword_reports_like_fallback(search_db):
+    assert search(search_db, '料號', 'fts') == (['料號 PN3004'], 'like')
+
+
+@needs_trigram
+def test_fts_with_trigram_adds_substring_hits_after_prefix_hits(search_db):
+    search_db.create_trigram_index()
+    results, used_mode = search_cells(search_db.conn, '3004', limit=20, mode='fts')
+    assert used_mode == 'fts'
+    assert results[0]['value'] == '3004'
+    assert sorted(row['value'] for row in results) == ['3004', 'PN3004-A', '料號 PN3004']
+    assert search(search_db, 'ngineeri', 'fts') == (['Engineering'], 'fts')
+
+
+@needs_trigram
+def test_fts_with_trigram_respects_limit(search_db):
+    search_db.create_trigram_index()
+    results, _ = search_cells(search_db.conn, '3004', limit=2, mode='fts')
+    assert len(results) == 2
+    assert results[0]['value'] == '3004'
+
+
+@needs_trigram
+def test_like_results_do_not_depend_on_trigram(search_db):
+    without = search(search_db, '3004', 'like')
+    search_db.create_trigram_index()
+    assert search(search_db, '3004', 'like') == without